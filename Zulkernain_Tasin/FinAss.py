@@ -18,51 +18,75 @@ import depends
 os.environ["OPENBLAS_NUM_THREADS"] = "1"
 
 import pandas as pd
-import matplotlib.pyplot as plt
+from depends.aggregates import MonthlyAggregateStore
+from depends.ledger import load_ledger
+from depends.render import ChartRenderer
 pd.options.display.float_format = '{:,.2f}'.format
 
 # Load and preprocess
 
-def finAss(CSV_FILE):
-    df = pd.read_csv(CSV_FILE)
-    df['Period'] = pd.to_datetime(df['Period'], errors='coerce', dayfirst=True)
-    df['Month'] = df['Period'].dt.to_period('M').astype(str)
-    df['Income/Expense'] = (
-        df['Income/Expense']
-        .str.strip()
-        .str.lower()
-        .replace({
-            'exp.': 'expense'
-        })
-    )
-    df['EUR'] = pd.to_numeric(df['EUR'], errors='coerce')
-
-    # Clean and list unique accounts
-    accounts = df['Accounts'].dropna().unique()
-
-    # Filter Swedbank-related accounts
-    swed_accounts = accounts #['Swedbank']
-    df_swed = df[df['Accounts'].isin(swed_accounts)]
-
-    # Group by month and original income/expense/transfer-in/out type
-    monthly_swed = (
-        df_swed.groupby(['Month', 'Income/Expense'])['EUR']
-        .sum()
-        .unstack(fill_value=0)
-        .reset_index()
-    )
-
-    # Calculate Net manually
-    income = monthly_swed.get('income', 0)+monthly_swed.get('transfer-in', 0)
-    expense = monthly_swed.get('expense', 0)+monthly_swed.get('transfer-out', 0)
-    monthly_swed['Net'] = income - expense
-
-    monthly_swed['Balance'] = monthly_swed.get('Net',0).cumsum()
+def finAss(CSV_FILE, renderer=None, store_path=None):
+    """
+    Computes and plots the monthly income, expense, net flow and running balance over all accounts.
+
+    Parameters:
+        CSV_FILE (str or pd.DataFrame): Path to the CSV file, or the ledger returned by load_ledger.
+        renderer (ChartRenderer): Renders the chart. Defaults to showing it in a window.
+        store_path (str): SQLite file of the monthly aggregate store, as last updated by
+            analyze_account_groups_monthly. Defaults to aggregating the whole ledger.
+
+    Returns:
+        pd.DataFrame: One row per month with the sum of every flow type, Net and the running Balance.
+    """
+    if store_path is not None:
+        # Monthly sums and the running Balance over all accounts, kept by the aggregate store
+        with MonthlyAggregateStore(store_path) as store:
+            monthly_swed = store.overview()
+    else:
+        df = load_ledger(CSV_FILE)
+
+        # Clean and list unique accounts
+        accounts = df['Accounts'].dropna().unique()
+
+        # Filter Swedbank-related accounts
+        swed_accounts = accounts #['Swedbank']
+        df_swed = df[df['Accounts'].isin(swed_accounts)]
+
+        # Group by month and original income/expense/transfer-in/out type
+        monthly_swed = (
+            df_swed.groupby(['Month', 'Income/Expense'], observed=True)['EUR']
+            .sum()
+            .unstack(fill_value=0)
+            .reset_index()
+        )
+
+        # Calculate Net manually
+        income = monthly_swed.get('income', 0)+monthly_swed.get('transfer-in', 0)
+        expense = monthly_swed.get('expense', 0)+monthly_swed.get('transfer-out', 0)
+        monthly_swed['Net'] = income - expense
+
+        monthly_swed['Balance'] = monthly_swed.get('Net',0).cumsum()
 
     #print(monthly_swed['Balance'])
 
+    (renderer or ChartRenderer()).render('overview', plot_overview, monthly_swed)
+    return monthly_swed
+
+
+def plot_overview(monthly_swed):
+    """
+    Draws the monthly financial overview.
+
+    Parameters:
+        monthly_swed (pd.DataFrame): The monthly flows returned by finAss.
+
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    """
+    import matplotlib.pyplot as plt
+
     # Plot
-    plt.figure(figsize=(12, 6))
+    figure = plt.figure(figsize=(12, 6))
 
     #for col in monthly_swed.columns[1:]:
     #    plt.plot(monthly_swed['Month'], monthly_swed[col], label=col.capitalize(), marker='o')
@@ -80,4 +104,4 @@ def finAss(CSV_FILE):
     plt.grid(True)
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.show()
+    return figure
@@ -14,12 +14,14 @@ Note:
 
 
 import pandas as pd
-import matplotlib.pyplot as plt
+from depends.aggregates import MonthlyAggregateStore
+from depends.ledger import classify_flows, load_ledger
+from depends.render import ChartRenderer
 #pd.set_option('display.max_rows', None)
 #pd.set_option('display.max_columns', None)
 #pd.set_option('display.width', None)
 
-def analyze_account_groups_monthly(csv_file, account_groups):
+def analyze_account_groups_monthly(csv_file, account_groups, renderer=None, store_path=None):
     """
     Analyze and plot monthly financial data grouped by account category (Bank, Savings, Cash, Loan, Other).
     
@@ -30,47 +32,78 @@ def analyze_account_groups_monthly(csv_file, account_groups):
     - Transfer Out: -
     
     Parameters:
-        csv_file (str): Path to the CSV file.
+        csv_file (str or pd.DataFrame): Path to the CSV file, or the ledger returned by load_ledger.
         account_groups (dict): Mapping of account names to group labels.
+        renderer (ChartRenderer): Renders the chart. Defaults to showing it in a window.
+        store_path (str): SQLite file of the monthly aggregate store, kept up to date with the ledger.
+            Defaults to aggregating the whole ledger on every call.
+
+    Returns:
+        tuple: The tidy monthly summary (one row per month and group, with the flow sums,
+            Net and the running Total) and the running Total pivoted to one column per group.
     """
 
-    # Load CSV
-    df = pd.read_csv(csv_file)
-    df['Period'] = pd.to_datetime(df['Period'], errors='coerce', dayfirst=True)
-    df['Month'] = df['Period'].dt.to_period('M').astype(str)
-    df['Income/Expense'] = (
-        df['Income/Expense']
-        .str.strip()
-        .str.lower()
-        .replace({
-            'exp.': 'expense'
-        })
-    )
-    df['EUR'] = pd.to_numeric(df['EUR'], errors='coerce')
+    # Load the normalized ledger
+    df = load_ledger(csv_file)
     
     # Ensure we have account groups
     if account_groups is None:
         print("⚠️ No account groupings found. Please load account groups first.")
-        return
+        return None, None
+
+    if store_path is not None:
+        # Only the transactions added since the last run are aggregated, past months are read back from the store
+        with MonthlyAggregateStore(store_path) as store:
+            store.sync(df, account_groups)
+            grouped = store.group_summary()
+    else:
+        grouped = summarize_account_groups(df, account_groups)
+
+    # Wide view: one running total column per group (in order of first activity), NaN in months without activity
+    group_totals = grouped.pivot(index='Month', columns='AccountGroup', values='Total')
+    group_totals = group_totals[list(grouped['AccountGroup'].unique())]
+    
+    # Debug
+    """
+    target_group = 'Cash'
+    print(f"\n🔍 Data for group: {target_group}")
+    print(grouped[grouped['AccountGroup'] == target_group])
+    """
+
+    # 👇 Sum Total per Month across the groups active in that month
+    total_assets = group_totals.sum(axis=1) #No Group ignored
+    # Particular Group Ignored
+    # total_assets = group_totals.drop(columns='Loan').sum(axis=1)
+
+    (renderer or ChartRenderer()).render('account_groups', plot_account_groups, group_totals, total_assets)
+    return grouped, group_totals
+
+
+def summarize_account_groups(df, account_groups):
+    """
+    Sums the flows of every account group per month and computes their running totals.
+
+    Parameters:
+        df (pd.DataFrame): The ledger, from load_ledger.
+        account_groups (dict): Mapping of account names to group labels.
+
+    Returns:
+        pd.DataFrame: One row per month and group, with the flow sums, Net and the running Total.
+    """
     #account_groups = {'Ammu': 'Loan', 'Bolt': 'Other', 'Cash': 'Cash', 'Ethos 24': 'Loan', 'Fleetfox': 'Other', 'Golam Rabbi': 'Loan', 'Neste Fuel': 'Other', 'Revolut': 'Bank','RevolutSaving ':'Savings', 'Sourov': 'Loan', 'Swedbank': 'Bank', 'Swedbank Saving': 'Savings', 'Wise': 'Bank', 'Wolt': 'Other'}
     # Map each account to its group
+    df = df.copy()
     df['AccountGroup'] = df['Accounts'].map(account_groups)
 
     #print(df['Accounts'].unique())
     #print(df['AccountGroup'])
     # print(account_groups)
     
-    # Create new columns for types of financial flow
-    df['Income'] = df.apply(lambda row: row['EUR'] if row['Income/Expense'] == 'income' else 0, axis=1)
-    df['Expense'] = df.apply(lambda row: row['EUR'] if row['Income/Expense'] == 'expense' else 0, axis=1)
-    df['TransferIn'] = df.apply(lambda row: row['EUR'] if row['Income/Expense'] == 'transfer-in' else 0, axis=1)
-    df['TransferOut'] = df.apply(lambda row: row['EUR'] if row['Income/Expense'] == 'transfer-out' else 0, axis=1)
-
-    # Calculate net flow per row
-    df['Net'] = df['Income'] - df['Expense'] + df['TransferIn'] - df['TransferOut']
+    # Split amounts into the types of financial flow and the signed net flow per row
+    classify_flows(df)
     
-    # Group by Month and AccountGroup
-    grouped = df.groupby(['Month', 'AccountGroup']).agg({
+    # Group by Month and AccountGroup, months are sorted within every group
+    grouped = df.groupby(['Month', 'AccountGroup'], observed=True).agg({
         'Income': 'sum',
         'Expense': 'sum',
         'TransferIn': 'sum',
@@ -80,58 +113,41 @@ def analyze_account_groups_monthly(csv_file, account_groups):
     
     #print(grouped)
 
-    # Calculate running total (cumulative net) for each group
-    all_group_dfs = []
+    # Calculate running total (cumulative net) for each group in one pass over the sorted rows
+    grouped['Total'] = grouped.groupby('AccountGroup', observed=True)['Net'].cumsum()
 
-    for group in grouped['AccountGroup'].unique():
-        group_df = grouped[grouped['AccountGroup'] == group].copy()
-        group_df.sort_values('Month', inplace=True)
-        group_df['Total'] = group_df['Net'].cumsum()
-        all_group_dfs.append(group_df)
-    
-    # Debug
+    return grouped
+
+
+def plot_account_groups(group_totals, total_assets):
     """
-    target_group = 'Cash'
+    Draws the running total of every account group and the total assets.
+
+    Parameters:
+        group_totals (pd.DataFrame): The running totals pivoted to one column per group.
+        total_assets (pd.Series): The sum of the running totals per month.
 
-    for gdf in all_group_dfs:
-        group = gdf['AccountGroup'].iloc[0]
-        if target_group.strip().lower() in group.strip().lower():
-            print(f"\n🔍 Data for group: {group}")
-            print(gdf)
+    Returns:
+        matplotlib.figure.Figure: The figure.
     """
+    import matplotlib.pyplot as plt
 
     # Plot
-    plt.figure(figsize=(12, 8))
+    figure = plt.figure(figsize=(12, 8))
 
-    for gdf in all_group_dfs:
-        group = gdf['AccountGroup'].iloc[0]
+    for group in group_totals.columns:
+        totals = group_totals[group].dropna()
+        months = totals.index.astype(str)
         # if(group=='Loan'): continue #ignoring Loan Profile
-        #plt.plot(gdf['Month'], gdf['Income'], label=f'{group} Income', marker='o')
-        #plt.plot(gdf['Month'], gdf['Expense'], label=f'{group} Expense', marker='o')
-        #plt.plot(gdf['Month'], gdf['TransferIn'], label=f'{group} Transfer In', linestyle='dotted')
-        #plt.plot(gdf['Month'], gdf['TransferOut'], label=f'{group} Transfer Out', linestyle='dotted')
-        #plt.plot(gdf['Month'], gdf['Net'], label=f'{group} Net', linestyle='--', linewidth=2)
-        plt.plot(gdf['Month'], gdf['Total'], label=f'{group} Running Total', linewidth=2)
-        for col in ['Total']:
-            for i, value in enumerate(gdf[col]):
-                if abs(value) > 1e-1:  # Skip near-zero values
-                    x = gdf['Month'].iloc[i]
-                    y = value
-                    plt.text(x, y, f'{value:,.0f}', fontsize=8, ha='center', va='bottom', rotation=0)
-
-    # 👇 Combine all group DataFrames
-    combined_df = pd.concat(all_group_dfs) #No Group ignored
-    # Particular Group Ignored
-    # combined_df = pd.concat([gdf for gdf in all_group_dfs if gdf['AccountGroup'].iloc[0] != 'Loan'])
-
-
-    # 👇 Sum Total per Month across all groups
-    total_assets = combined_df.groupby('Month')['Total'].sum().reset_index()
+        plt.plot(months, totals, label=f'{group} Running Total', linewidth=2)
+        for x, value in zip(months, totals):
+            if abs(value) > 1e-1:  # Skip near-zero values
+                plt.text(x, value, f'{value:,.0f}', fontsize=8, ha='center', va='bottom', rotation=0)
 
     # 👇 Plot the total asset line
     plt.plot(
-        total_assets['Month'], 
-        total_assets['Total'], 
+        total_assets.index.astype(str), 
+        total_assets, 
         label='💰 Total Assets', 
         linestyle='--', 
         color='black', 
@@ -140,11 +156,9 @@ def analyze_account_groups_monthly(csv_file, account_groups):
     )
 
     # Annotate total asset values
-    for i, value in enumerate(total_assets['Total']):
-        x = total_assets['Month'].iloc[i]
-        y = value
+    for x, value in zip(total_assets.index.astype(str), total_assets):
         if abs(value) > 1e-1:
-            plt.text(x, y, f'{value:,.0f}', fontsize=9, ha='center', va='bottom', color='black', fontweight='bold')
+            plt.text(x, value, f'{value:,.0f}', fontsize=9, ha='center', va='bottom', color='black', fontweight='bold')
 
     plt.title("Monthly Financial Summary by Account Group (with Transfers)")
     plt.xlabel("Month")
@@ -152,6 +166,5 @@ def analyze_account_groups_monthly(csv_file, account_groups):
     plt.legend()
     plt.grid(True)
     plt.tight_layout()
-    plt.show()
 
-    return all_group_dfs
\ No newline at end of file
+    return figure
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 import pandas as pd
+from depends.ledger import load_ledger
 
 # ACCOUNT NAME CAN NOT START OR END WITH BLANK SPACE
 
@@ -8,7 +9,7 @@ def load_account_groups(csv_file='PerFinData.csv', group_file='account_groups.tx
     Loads account groupings from a file, or prompts the user to create them if not found.
     
     Parameters:
-        csv_file (str): Path to the input CSV file.
+        csv_file (str or pd.DataFrame): Path to the input CSV file, or the ledger returned by load_ledger.
         group_file (str): Path to the account group mapping text file.
 
     Returns:
@@ -29,7 +30,7 @@ def load_account_groups(csv_file='PerFinData.csv', group_file='account_groups.tx
         return {line.split('=>')[0].strip(): line.split('=>')[1].strip() for line in lines}
 
     # File not found, prompt user to assign groups
-    df = pd.read_csv(csv_file)
+    df = load_ledger(csv_file)
     unique_accounts = sorted(df['Accounts'].dropna().unique())
 
     print("\nGrouping Options:")
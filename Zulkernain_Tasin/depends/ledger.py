@@ -0,0 +1,230 @@
+"""
+Author: Zulkernain Tasin
+Institution: Vilnius University Business School
+Project: Financial Assistant (FINASS)
+Version: 1.0
+Description:
+    Loads the ledger CSV (PerFinData.csv) once and normalizes it, so the grouping,
+    analysis, overview and prediction stages all work on the same typed DataFrame.
+    The normalized ledger is cached as Parquet and only parsed again when the CSV changes.
+
+Note:
+    This version was submitted and demonstrated during the academic exam session.
+    All features reflect Version 1 functionality.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Flow types in the order they are treated everywhere else, other values are kept after them
+FLOW_TYPES = ['income', 'expense', 'transfer-in', 'transfer-out']
+
+# The column each flow type is summed into and the sign it has in Net
+FLOW_COLUMNS = ['Income', 'Expense', 'TransferIn', 'TransferOut']
+FLOW_SIGNS = [1, -1, 1, -1]
+
+# Text columns with few distinct values are stored as categories
+CATEGORICAL_COLUMNS = ['Accounts', 'Category', 'Subcategory', 'Currency', 'Month']
+
+# Bump when parse_ledger changes, so older caches are parsed again
+CACHE_VERSION = 1
+CACHE_DIR_NAME = '.ledger_cache'
+
+
+def parse_ledger(csv_file):
+    """
+    Parses and normalizes the ledger CSV.
+
+    - Period: parsed as day-first dates, unparseable ones become NaT
+    - Month: the 'YYYY-MM' month of the period, as an ordered category
+    - Income/Expense: stripped and lowercased, 'exp.' becomes 'expense', as a category
+    - EUR: numeric, unparseable amounts become NaN
+
+    Parameters:
+        csv_file (str): Path to the input CSV file.
+
+    Returns:
+        pd.DataFrame: The normalized ledger.
+    """
+    df = pd.read_csv(csv_file)
+    df['Period'] = pd.to_datetime(df['Period'], errors='coerce', dayfirst=True)
+    df['Month'] = df['Period'].dt.to_period('M').astype(str)
+
+    flow = (
+        df['Income/Expense']
+        .str.strip()
+        .str.lower()
+        .replace({
+            'exp.': 'expense'
+        })
+    )
+    other_flows = sorted(set(flow.dropna()) - set(FLOW_TYPES))
+    df['Income/Expense'] = pd.Categorical(flow, categories=FLOW_TYPES + other_flows)
+
+    df['EUR'] = pd.to_numeric(df['EUR'], errors='coerce')
+
+    for column in CATEGORICAL_COLUMNS:
+        # Empty columns are read as floats and left alone
+        if column in df.columns and df[column].notna().any():
+            # 'YYYY-MM' months sort chronologically, so Month is ordered
+            categories = sorted(df[column].dropna().unique())
+            df[column] = df[column].astype(pd.CategoricalDtype(categories, ordered=column == 'Month'))
+    return df
+
+
+def classify_flows(df):
+    """
+    Adds the Income, Expense, TransferIn, TransferOut and Net columns to the ledger.
+
+    Each flow column holds the EUR amount of the rows of its flow type and 0 elsewhere,
+    and Net is the signed amount (income and transfers in are positive, expenses and
+    transfers out negative, other flow types 0). Everything is computed from the
+    category codes of Income/Expense in whole-column operations, without a Python loop over rows.
+
+    Parameters:
+        df (pd.DataFrame): The ledger, e.g. from load_ledger. Modified in place.
+
+    Returns:
+        pd.DataFrame: The same DataFrame, with the flow columns.
+    """
+    flow = df['Income/Expense']
+    if not isinstance(flow.dtype, pd.CategoricalDtype) or list(flow.cat.categories[:len(FLOW_TYPES)]) != FLOW_TYPES:
+        flow = flow.astype(pd.CategoricalDtype(FLOW_TYPES))
+    # Missing flow types have code -1, unknown ones codes past the known ones
+    codes = flow.cat.codes.to_numpy()
+    amount = df['EUR'].to_numpy(dtype='float64')
+
+    for code, column in enumerate(FLOW_COLUMNS):
+        df[column] = np.where(codes == code, amount, 0.0)
+
+    # One sign per category, and a last 0 that code -1 picks
+    signs = np.zeros(len(flow.cat.categories) + 1)
+    signs[:len(FLOW_SIGNS)] = FLOW_SIGNS
+    row_signs = signs[codes]
+    df['Net'] = np.where(row_signs != 0, amount * row_signs, 0.0)
+    return df
+
+
+def file_sha256(path):
+    """
+    Computes the SHA-256 digest of a file's contents.
+
+    Parameters:
+        path (str): Path to the file.
+
+    Returns:
+        str: The hex digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_ledger(csv_file='PerFinData.csv', cache_dir=None, use_cache=True):
+    """
+    Loads the normalized ledger, parsing the CSV only if it changed since it was last cached.
+
+    The cache is a Parquet file named after the CSV's SHA-256 hash. The hash is only
+    computed again when the CSV's modification time or size changed, so an unchanged
+    ledger is loaded without reading the CSV at all. Without pyarrow the CSV is parsed
+    on every call.
+
+    Parameters:
+        csv_file (str or pd.DataFrame): Path to the input CSV file. A ledger that is already loaded is returned as is.
+        cache_dir (str): Directory of the cache. Defaults to '.ledger_cache' next to the CSV file.
+        use_cache (bool): Whether to read and write the cache.
+
+    Returns:
+        pd.DataFrame: The normalized ledger, see parse_ledger.
+    """
+    if isinstance(csv_file, pd.DataFrame):
+        return csv_file
+    if not use_cache:
+        return parse_ledger(csv_file)
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(csv_file)), CACHE_DIR_NAME)
+    name = os.path.splitext(os.path.basename(csv_file))[0]
+    meta_path = os.path.join(cache_dir, f'{name}.json')
+
+    stat = os.stat(csv_file)
+    meta = {}
+    if os.path.exists(meta_path):
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+
+    if (meta.get('version') == CACHE_VERSION
+            and meta.get('mtime_ns') == stat.st_mtime_ns
+            and meta.get('size') == stat.st_size):
+        sha256 = meta['sha256']
+    else:
+        sha256 = file_sha256(csv_file)
+    cache_path = os.path.join(cache_dir, f'{name}-{sha256[:16]}.parquet')
+
+    try:
+        if os.path.exists(cache_path):
+            df = pd.read_parquet(cache_path)
+        else:
+            df = parse_ledger(csv_file)
+            write_ledger_cache(df, cache_dir, name, cache_path)
+    except (ImportError, OSError, ValueError) as e:
+        print(f"⚠️ Ledger cache unavailable, parsing '{csv_file}': {e}")
+        return parse_ledger(csv_file)
+
+    if meta.get('sha256') != sha256 or meta.get('mtime_ns') != stat.st_mtime_ns:
+        write_json_atomically(meta_path, {
+            'version': CACHE_VERSION,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': sha256,
+        })
+    return df
+
+
+def write_ledger_cache(df, cache_dir, name, cache_path):
+    """
+    Writes the normalized ledger to the cache, replacing the cache of earlier versions of the CSV.
+
+    Parameters:
+        df (pd.DataFrame): The normalized ledger.
+        cache_dir (str): Directory of the cache.
+        name (str): The CSV file name without its extension.
+        cache_path (str): Path of the Parquet file to write.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    ignore_file = os.path.join(cache_dir, '.gitignore')
+    if not os.path.exists(ignore_file):
+        with open(ignore_file, 'w') as f:
+            f.write('*\n')
+
+    tmp_path = cache_path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+
+    for file_name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, file_name)
+        if file_name.startswith(f'{name}-') and file_name.endswith('.parquet') and path != cache_path:
+            os.remove(path)
+
+
+def write_json_atomically(path, data):
+    """
+    Writes a JSON file so that readers never see it half written.
+
+    Parameters:
+        path (str): Path to the JSON file.
+        data (dict): The data to write.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
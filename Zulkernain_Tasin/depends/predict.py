@@ -12,11 +12,12 @@ Note:
 """
 
 import pandas as pd
-import matplotlib.pyplot as plt
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_squared_error
 from datetime import datetime
 import numpy as np
+from depends.ledger import classify_flows, load_ledger
+from depends.render import ChartRenderer
 
 # ----------------- CONFIGURATION -----------------
 
@@ -38,37 +39,32 @@ account_groups = {
 
 # ----------------- MAIN FUNCTION -----------------
 
-def predict_savings(csv_file, group_name):
-    # Load CSV
-    df = pd.read_csv(csv_file)
-    df['Period'] = pd.to_datetime(df['Period'], dayfirst=True, errors='coerce')
-    df['Month'] = df['Period'].dt.to_period('M').astype(str)
-    df['EUR'] = pd.to_numeric(df['EUR'], errors='coerce')
-    
-    # Standardize Income/Expense column
-    df['Income/Expense'] = (
-        df['Income/Expense']
-        .str.strip()
-        .str.lower()
-        .replace({'exp.': 'expense'})
-    )
+def predict_savings(csv_file, group_name, renderer=None):
+    """
+    Predicts the running balance of an account group for the next 6 months with a linear trend.
+
+    Parameters:
+        csv_file (str or pd.DataFrame): Path to the CSV file, or the ledger returned by load_ledger.
+        group_name (str): The account group to predict, e.g. 'Savings'.
+        renderer (ChartRenderer): Renders the chart. Defaults to showing it in a window.
+
+    Returns:
+        pd.DataFrame: The actual and predicted running balance per MonthIndex, predicted months have Month 'Future'.
+    """
+    # Load the normalized ledger
+    df = load_ledger(csv_file).copy()
     
     # Map account group
     df['AccountGroup'] = df['Accounts'].map(account_groups)
 
     # Filter only savings accounts
-    df = df[df['AccountGroup'] == group_name]
+    df = df[df['AccountGroup'] == group_name].copy()
 
     # Classify flows
-    df['Income'] = df.apply(lambda row: row['EUR'] if row['Income/Expense'] == 'income' else 0, axis=1)
-    df['Expense'] = df.apply(lambda row: row['EUR'] if row['Income/Expense'] == 'expense' else 0, axis=1)
-    df['TransferIn'] = df.apply(lambda row: row['EUR'] if row['Income/Expense'] == 'transfer-in' else 0, axis=1)
-    df['TransferOut'] = df.apply(lambda row: row['EUR'] if row['Income/Expense'] == 'transfer-out' else 0, axis=1)
-
-    df['Net'] = df['Income'] - df['Expense'] + df['TransferIn'] - df['TransferOut']
+    df = classify_flows(df)
 
     # Monthly aggregation
-    monthly = df.groupby('Month').agg({
+    monthly = df.groupby('Month', observed=True).agg({
         'Income': 'sum',
         'Expense': 'sum',
         'Net': 'sum'
@@ -101,17 +97,38 @@ def predict_savings(csv_file, group_name):
         future_df.rename(columns={'PredictedSavings': 'Savings'}).assign(Month='Future')
     ])
 
+    prediction_start = X['MonthIndex'].iloc[-1]
+    (renderer or ChartRenderer()).render(
+        f'prediction_{group_name.lower()}', plot_savings_prediction, combined, prediction_start, group_name
+    )
+    return combined
+
+
+def plot_savings_prediction(combined, prediction_start, group_name):
+    """
+    Draws the actual and predicted running balance of an account group.
+
+    Parameters:
+        combined (pd.DataFrame): The balances returned by predict_savings.
+        prediction_start (int): The MonthIndex of the last actual month.
+        group_name (str): The account group.
+
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    """
+    import matplotlib.pyplot as plt
+
     # Plot
-    plt.figure(figsize=(10, 6))
+    figure = plt.figure(figsize=(10, 6))
     plt.plot(combined['MonthIndex'], combined['Savings'], marker='o', label='Savings (Actual & Predicted)')
-    plt.axvline(x=X['MonthIndex'].iloc[-1], color='gray', linestyle='--', label='Prediction Start')
+    plt.axvline(x=prediction_start, color='gray', linestyle='--', label='Prediction Start')
     plt.title(f"Predicted Savings using Linear Regression ({group_name})")
     plt.xlabel("Month Index")
     plt.ylabel("Cumulative Savings (EUR)")
     plt.legend()
     plt.grid(True)
     plt.tight_layout()
-    plt.show()
+    return figure
 
 # ----------------- RUN -----------------
 
@@ -0,0 +1,177 @@
+"""
+Author: Zulkernain Tasin
+Institution: Vilnius University Business School
+Project: Financial Assistant (FINASS)
+Version: 1.0
+Description:
+    Renders the FINASS charts. A chart is a plot function that draws data into a new
+    matplotlib figure and returns it, and the renderer decides what happens to it:
+    - 'show': opens a window and waits for it to be closed, like plt.show()
+    - 'files': saves PNG, SVG and/or HTML files to a directory with the Agg backend,
+      in worker processes, so the analysis goes on while the charts are drawn
+    - 'none': draws nothing, the stages only return their data
+
+    matplotlib is only imported once a chart is rendered, never by importing this module.
+
+Note:
+    This version was submitted and demonstrated during the academic exam session.
+    All features reflect Version 1 functionality.
+"""
+
+import base64
+import html
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+RENDER_MODES = ['show', 'files', 'none']
+FILE_FORMATS = ['png', 'svg', 'html']
+
+
+class ChartRenderer:
+    """
+    Renders charts in one of the RENDER_MODES.
+
+    Parameters:
+        mode (str): 'show', 'files' or 'none'.
+        output_dir (str): Directory the chart files are saved to in 'files' mode.
+        formats (list): File formats saved in 'files' mode, any of FILE_FORMATS.
+        workers (int): Number of rendering processes in 'files' mode. Defaults to one per CPU core.
+        dpi (int): Resolution of PNG files.
+    """
+
+    def __init__(self, mode='show', output_dir='charts', formats=('png',), workers=None, dpi=150):
+        if mode not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode '{mode}', expected one of {RENDER_MODES}")
+        unknown_formats = set(formats) - set(FILE_FORMATS)
+        if unknown_formats:
+            raise ValueError(f"Unknown chart formats {sorted(unknown_formats)}, expected any of {FILE_FORMATS}")
+
+        self.mode = mode
+        self.output_dir = output_dir
+        self.formats = list(formats)
+        self.workers = workers
+        self.dpi = dpi
+        self._executor = None
+        self._futures = []
+
+    def render(self, name, plot_function, *args):
+        """
+        Renders a chart.
+
+        Parameters:
+            name (str): The chart name, used as the file name in 'files' mode.
+            plot_function (callable): A module level function drawing args into a new figure and returning it.
+                It has to be importable by the worker processes, so no lambdas or nested functions.
+            *args: The data of the chart.
+
+        Returns:
+            Future or None: In 'files' mode, the future of the list of saved file paths, otherwise None.
+        """
+        if self.mode == 'none':
+            return None
+
+        if self.mode == 'show':
+            import matplotlib.pyplot as plt
+
+            plot_function(*args)
+            plt.show()
+            return None
+
+        if self._executor is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=use_headless_backend)
+        future = self._executor.submit(
+            save_chart, name, plot_function, args, self.output_dir, self.formats, self.dpi
+        )
+        self._futures.append(future)
+        return future
+
+    def close(self):
+        """
+        Waits for the charts being rendered and stops the worker processes.
+
+        Returns:
+            list: The paths of every saved chart file.
+        """
+        paths = []
+        try:
+            for future in self._futures:
+                paths.extend(future.result())
+        finally:
+            self._futures = []
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+        return paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def use_headless_backend():
+    """
+    Switches matplotlib to the Agg backend, which draws without a display. Runs in every worker process.
+    """
+    import matplotlib
+
+    matplotlib.use('Agg')
+
+
+def save_chart(name, plot_function, args, output_dir, formats, dpi=150):
+    """
+    Draws a chart and saves it in every format. Runs inside a rendering worker process.
+
+    Parameters:
+        name (str): The chart name, used as the file name.
+        plot_function (callable): The function drawing args into a new figure and returning it.
+        args (tuple): The data of the chart.
+        output_dir (str): Directory the files are saved to.
+        formats (list): File formats, any of FILE_FORMATS.
+        dpi (int): Resolution of PNG files.
+
+    Returns:
+        list: The paths of the saved files.
+    """
+    import matplotlib.pyplot as plt
+
+    figure = plot_function(*args)
+    paths = []
+    try:
+        for file_format in formats:
+            path = os.path.join(output_dir, f'{name}.{file_format}')
+            if file_format == 'html':
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(figure_to_html(figure, name, dpi))
+            else:
+                figure.savefig(path, format=file_format, dpi=dpi)
+            paths.append(path)
+    finally:
+        plt.close(figure)
+    return paths
+
+
+def figure_to_html(figure, title, dpi=150):
+    """
+    Builds a standalone HTML page showing a figure, embedded as a PNG image.
+
+    Parameters:
+        figure (matplotlib.figure.Figure): The figure.
+        title (str): The page title.
+        dpi (int): Resolution of the embedded image.
+
+    Returns:
+        str: The HTML page.
+    """
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', dpi=dpi)
+    image = base64.b64encode(buffer.getvalue()).decode('ascii')
+    title = html.escape(title)
+    return (
+        '<!DOCTYPE html>\n'
+        f'<html><head><meta charset="utf-8"><title>{title}</title></head>\n'
+        f'<body><img src="data:image/png;base64,{image}" alt="{title}" style="max-width: 100%"></body></html>\n'
+    )
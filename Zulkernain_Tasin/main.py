@@ -16,8 +16,7 @@ Note:
     All features reflect Version 1 functionality.
 """
 
-print("Financial Assistant V1.0")
-
+import argparse
 import os
 import depends
 
@@ -25,12 +24,13 @@ import depends
 os.environ["OPENBLAS_NUM_THREADS"] = "1"
 
 import pandas as pd
-import matplotlib.pyplot as plt
 pd.options.display.float_format = '{:,.2f}'.format
 
 # Importing Custom Functions
+from depends.ledger import load_ledger
 from depends.groups import load_account_groups 
 from depends.analysis import analyze_account_groups_monthly
+from depends.render import ChartRenderer, FILE_FORMATS, RENDER_MODES
 
 from FinAss import finAss 
 from depends.predict import predict_savings
@@ -38,14 +38,44 @@ from depends.predict import predict_savings
 # Defining input Files
 GROUP_FILE = 'depends/account_groups.txt'
 CSV_FILE = 'depends/PerFinData.csv'
+# Monthly sums kept between runs, so only new transactions are aggregated
+AGGREGATE_STORE = 'depends/.ledger_cache/monthly_aggregates.sqlite'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Financial Assistant (FINASS)')
+    parser.add_argument('--render', choices=RENDER_MODES, default='show',
+                        help="'show' opens the charts one by one, 'files' saves them without a display, 'none' skips them")
+    parser.add_argument('--output-dir', default='charts', help="Directory of the chart files in 'files' mode.")
+    parser.add_argument('--formats', default='png', help=f"Comma separated chart file formats, any of {FILE_FORMATS}.")
+    parser.add_argument('--workers', type=int, default=None, help='Number of chart rendering processes.')
+    args = parser.parse_args()
+
+    print("Financial Assistant V1.0")
+
+    renderer = ChartRenderer(args.render, args.output_dir, args.formats.split(','), args.workers)
+    try:
+        # Load and normalize the ledger once, every stage below shares it
+        ledger = load_ledger(CSV_FILE)
+
+        # Load Accounts and Groups
+        account_groups = load_account_groups(ledger,GROUP_FILE)
+        # Analyze and plot monthly data by account group
+        group_summary, group_totals = analyze_account_groups_monthly(ledger,account_groups,renderer,AGGREGATE_STORE)
+
+        # Plotting brift view of Income Expense Net and Balance
+        finAss(ledger,renderer,AGGREGATE_STORE if account_groups else None)
+        print(group_summary)
+        print(group_totals)
+        # Future Prediction 
+        predict_savings(ledger,'Savings',renderer) # Need to work on this part to predict all of the accounts in the CSV after grouping
+    finally:
+        # Waits for the charts still being rendered in 'files' mode
+        saved_paths = renderer.close()
+
+    for path in saved_paths:
+        print(f"📈 Saved {path}")
 
-# Load Accounts and Groups
-account_groups = load_account_groups(CSV_FILE,GROUP_FILE)
-# Analyze and plot monthly data by account group
-all_group_dfs = analyze_account_groups_monthly(CSV_FILE,account_groups)
 
-# Plotting brift view of Income Expense Net and Balance
-finAss(CSV_FILE)
-print(all_group_dfs)
-# Future Prediction 
-predict_savings(CSV_FILE,'Savings') # Need to work on this part to predict all of the accounts in the CSV after grouping 
\ No newline at end of file
+if __name__ == '__main__':
+    main()
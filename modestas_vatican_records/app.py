@@ -1,48 +1,137 @@
 # Based on https://github.com/Chainlit/cookbook/blob/main/anthropic-chat/app.py
 
+import asyncio
 from typing import Dict, List
 
 import chainlit as cl
-from chromadb.api.models import Collection
-
-from chatbot.session import (
-    perform_rag,
-    prepare_user_session,
-)
-from chatbot.llm import LLM
-from chatbot.reranking import Reranker
+from chainlit.server import app as chainlit_app
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.routing import BaseRoute
+
+from chatbot.registry import registry
+from chatbot.session import perform_rag
+from chatbot.tracing import tracer
 from chatbot.utils.logging_config import configure_logging
 
 Logger = configure_logging()
 
+#* Keeps a reference to the background warm-up, so it is not garbage collected mid-way
+warm_up_tasks = set()
 
-@cl.on_chat_start
-async def on_chat_start() -> None:
-    """Initializes the chat session and loads necessary resources.
+
+async def models_health() -> JSONResponse:
+    """Reports the load status of the shared models and the collection."""
+
+    health = registry.health()
+    return JSONResponse(health, status_code=200 if health["status"] == "ready" else 503)
+
+
+async def models_warm_up() -> JSONResponse:
+    """Starts loading the shared models and the collection in the background."""
+
+    if not registry.is_ready and not warm_up_tasks:
+        task = asyncio.create_task(registry.warm_up())
+        warm_up_tasks.add(task)
+        task.add_done_callback(warm_up_tasks.discard)
+    return JSONResponse(registry.health(), status_code=202)
+
+
+async def metrics() -> PlainTextResponse:
+    """Serves the per-stage latency histograms and counters in the Prometheus text format."""
+
+    return PlainTextResponse(tracer.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def traces() -> JSONResponse:
+    """Serves the spans of the recent requests as OpenTelemetry OTLP/JSON."""
+
+    return JSONResponse(tracer.export_otlp_json())
+
+
+#* Chainlit serves its frontend from a catch-all route, which would shadow any route registered after it
+CHAINLIT_CATCH_ALL_PATH = "/{full_path:path}"
+
+
+def serves_path(route: BaseRoute, path: str) -> bool:
+    """Checks whether a route of the app, or any route of a router included as a whole, is registered under a path.
+
+    Args:
+        route (BaseRoute): The route of the app.
+        path (str): The path to look for.
+
+    Returns:
+        bool: True if the route serves the path.
     """
 
-    Logger.info("Chat started.")
-    await cl.Message(
-        content=(
-            "Hey! I'm here to help you with your PDFs"
-            " But before that I need to load some resources."
-            " Please wait, I will notify you when loading is complete."
+    if getattr(route, "path", None) == path:
+        return True
+    #* Newer FastAPI versions keep an included router as a single route instead of copying its routes
+    included = getattr(route, "original_router", None)
+    return included is not None and any(serves_path(sub_route, path) for sub_route in included.routes)
+
+
+def include_before_catch_all(app: FastAPI, router: APIRouter) -> None:
+    """Includes a router in the Chainlit app, just before its frontend catch-all route.
+
+    Args:
+        app (FastAPI): The Chainlit app.
+        router (APIRouter): The router with the custom routes.
+
+    Raises:
+        RuntimeError: If the catch-all route is not found, i.e. Chainlit changed how it serves its frontend.
+    """
+
+    routes = app.router.routes
+    catch_all = next((i for i, route in enumerate(routes) if serves_path(route, CHAINLIT_CATCH_ALL_PATH)), None)
+    if catch_all is None:
+        raise RuntimeError(
+            f"Chainlit's catch-all route {CHAINLIT_CATCH_ALL_PATH} was not found, the custom routes can't be registered."
         )
-    ).send()
-    #* Sleep 1 s, to output the greeting message before loading is done.
-    await cl.sleep(1)
+    included_from = len(routes)
+    app.include_router(router)
+    included = routes[included_from:]
+    del routes[included_from:]
+    routes[catch_all:catch_all] = included
+
+
+custom_router = APIRouter()
+custom_router.add_api_route("/models/health", models_health, methods=["GET"])
+custom_router.add_api_route("/models/warm-up", models_warm_up, methods=["POST"])
+custom_router.add_api_route("/metrics", metrics, methods=["GET"])
+custom_router.add_api_route("/traces", traces, methods=["GET"])
+include_before_catch_all(chainlit_app, custom_router)
 
-    collection, llm, reranker = await prepare_user_session()
 
-    cl.user_session.set("collection", collection)
+@cl.on_chat_start
+async def on_chat_start() -> None:
+    """Initializes the chat session, loading the shared resources if this is the first session.
+    """
+
+    Logger.info("Chat started.")
     cl.user_session.set("conversation_history", [])
-    cl.user_session.set("llm", llm)
-    cl.user_session.set("reranker", reranker)
 
-    Logger.info("Preparation to chat work completed.")
-    await cl.Message(
-        content="Loading complete. Please, ask me anything."
-    ).send()
+    if not registry.is_ready:
+        await cl.Message(
+            content=(
+                "Hey! I'm here to help you with your PDFs"
+                " But before that I need to load some resources."
+                " Please wait, I will notify you when loading is complete."
+            )
+        ).send()
+        #* Sleep 1 s, to output the greeting message before loading is done.
+        await cl.sleep(1)
+
+        await registry.warm_up()
+
+        Logger.info("Preparation to chat work completed.")
+        await cl.Message(
+            content="Loading complete. Please, ask me anything."
+        ).send()
+    else:
+        await cl.Message(
+            content="Hey! I'm here to help you with your PDFs. Please, ask me anything."
+        ).send()
 
 
 @cl.on_message
@@ -53,12 +142,15 @@ async def on_message(message: cl.Message) -> None:
         message (cl.Message): The message received from the user.
     """
 
-    collection: Collection = cl.user_session.get("collection")
     conversation_history: List[Dict[str, str]] = cl.user_session.get(
         "conversation_history"
     )
-    llm: LLM = cl.user_session.get("llm")
-    reranker: Reranker = cl.user_session.get("reranker")
+    collection = await registry.get_collection()
+    llm = await registry.get_llm()
+    reranker = await registry.get_reranker()
+    answer_cache = await registry.get_answer_cache()
+    query_expander = await registry.get_query_expander()
+    sparse_index = await registry.get_sparse_index()
 
     query = message.content.strip()
     Logger.info(f"Message received: {query}")
@@ -68,11 +160,29 @@ async def on_message(message: cl.Message) -> None:
     # Set extracted details
     cl.user_session.set("conversation_history", conversation_history)
 
-    #* Perform RAG to generate an answer to the user's query
-    answer, titles = await perform_rag(query, collection, conversation_history, llm, reranker)
-    answer = f"{answer}\n\n\nRetrieved from PDFs:\n{'\n'.join(titles)}"
-    
+    #* Perform RAG to generate an answer to the user's query, streaming it into the message as it is generated
+    response_message = cl.Message(content="")
+    _, titles = await perform_rag(
+        query, collection, conversation_history, llm, reranker,
+        on_token=response_message.stream_token,
+        answer_cache=answer_cache,
+        query_expander=query_expander,
+        session_id=cl.user_session.get("id"),
+        sparse_index=sparse_index,
+    )
+    await response_message.stream_token(f"\n\n\nRetrieved from PDFs:\n{'\n'.join(titles)}")
+
     cl.user_session.set("conversation_history", conversation_history)
-    Logger.info(f"User message processing complete:\n{answer}")
+    Logger.info(f"User message processing complete:\n{response_message.content}")
+
+    await response_message.send()
+
+
+@cl.on_chat_end
+async def on_chat_end() -> None:
+    """Frees the resources held for the chat session."""
 
-    await cl.Message(content=answer).send()
+    if registry.is_ready:
+        llm = await registry.get_llm()
+        llm.release_session(cl.user_session.get("id"))
+    Logger.info("Chat ended.")
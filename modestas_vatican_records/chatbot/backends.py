@@ -0,0 +1,124 @@
+from pathlib import Path
+from typing import Any
+
+import torch
+from sentence_transformers import CrossEncoder
+from transformers import AutoModelForCausalLM
+
+from chatbot.config import HF_CACHE_DIR
+from chatbot.utils.logging_config import configure_logging
+
+Logger = configure_logging()
+
+TORCH = "torch"
+INT8 = "int8"
+ONNX = "onnx"
+ENCODER_BACKENDS = (TORCH, INT8)
+LLM_BACKENDS = (TORCH, INT8, ONNX)
+
+
+def validate_backend(backend: str, supported: tuple) -> str:
+    """Checks that an inference backend is supported.
+
+    Args:
+        backend (str): The backend name.
+        supported (tuple): The supported backend names.
+
+    Returns:
+        str: The backend name.
+
+    Raises:
+        ValueError: If the backend is not supported.
+    """
+
+    if backend not in supported:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {supported}.")
+    return backend
+
+
+def quantize_dynamic_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """Quantizes the linear layers of a model to int8 with dynamic activation quantization.
+
+    Weights are stored in int8 and activations are quantized on the fly, which roughly
+    quarters the memory of the linear layers and speeds up CPU inference. It is CPU only.
+
+    Args:
+        model (torch.nn.Module): The float model, on the CPU.
+
+    Returns:
+        torch.nn.Module: The quantized model.
+    """
+
+    model = model.float().eval()
+    quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    Logger.info(f"Quantized {type(model).__name__} linear layers to dynamic int8.")
+    return quantized
+
+
+def quantize_sentence_transformer(model: Any) -> None:
+    """Quantizes the transformer of a SentenceTransformer or CrossEncoder in place.
+
+    Args:
+        model (Any): The SentenceTransformer or CrossEncoder, loaded on the CPU.
+    """
+
+    #* Chroma shares SentenceTransformer instances between embedding functions of the same model
+    if getattr(model, "is_int8_quantized", False):
+        return
+    model.is_int8_quantized = True
+    if isinstance(model, CrossEncoder):
+        model.model = quantize_dynamic_int8(model.model)
+    else:
+        transformer = model[0]
+        transformer.auto_model = quantize_dynamic_int8(transformer.auto_model)
+
+
+def load_causal_lm(
+    pretrained_model_name_or_path: str | Path,
+    backend: str,
+) -> Any:
+    """Loads a causal language model for the given inference backend.
+
+    Args:
+        pretrained_model_name_or_path (str | Path): The path or name of the pretrained model.
+        backend (str): "torch" loads the model as is, "int8" dynamically quantizes it
+            for the CPU, and "onnx" exports it to ONNX Runtime (requires the optional
+            optimum[onnxruntime] dependency).
+
+    Returns:
+        Any: A model exposing generate(), generation_config and device.
+
+    Raises:
+        ValueError: If the backend is not supported.
+        ImportError: If the ONNX backend is selected but optimum is not installed.
+    """
+
+    validate_backend(backend, LLM_BACKENDS)
+    if backend == TORCH:
+        return AutoModelForCausalLM.from_pretrained(
+            pretrained_model_name_or_path,
+            torch_dtype="auto",
+            device_map="auto",
+            cache_dir=HF_CACHE_DIR,
+        )
+
+    if backend == INT8:
+        model = AutoModelForCausalLM.from_pretrained(
+            pretrained_model_name_or_path,
+            torch_dtype=torch.float32,
+            cache_dir=HF_CACHE_DIR,
+        )
+        return quantize_dynamic_int8(model)
+
+    try:
+        from optimum.onnxruntime import ORTModelForCausalLM
+    except ImportError as e:
+        raise ImportError(
+            "The 'onnx' LLM backend requires optimum with ONNX Runtime: pip install 'optimum[onnxruntime]'"
+        ) from e
+    return ORTModelForCausalLM.from_pretrained(
+        pretrained_model_name_or_path,
+        export=True,
+        use_cache=True,
+        cache_dir=HF_CACHE_DIR,
+    )
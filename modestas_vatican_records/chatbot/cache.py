@@ -0,0 +1,253 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+from chatbot.config import (
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_SAVE_EVERY,
+    SEMANTIC_CACHE_SIMILARITY_THRESHOLD,
+    SEMANTIC_CACHE_TTL_S,
+)
+from chatbot.utils.logging_config import configure_logging
+
+Logger = configure_logging()
+
+CACHE_FORMAT_VERSION = 1
+
+
+def normalize(embedding: np.ndarray) -> np.ndarray:
+    """Scales an embedding to unit length, so dot products are cosine similarities.
+
+    Args:
+        embedding (np.ndarray): The embedding.
+
+    Returns:
+        np.ndarray: The normalized embedding.
+    """
+
+    embedding = np.asarray(embedding, dtype=np.float32)
+    return embedding / (np.linalg.norm(embedding) or 1.0)
+
+
+class SemanticAnswerCache:
+    """Caches RAG answers keyed by the embedding of the query.
+
+    A query is answered from the cache when a stored query is at least similarity_threshold
+    cosine-similar to it and was stored less than ttl_s seconds ago. The least recently used
+    entry is evicted once max_entries is exceeded. Entries are tied to a collection version
+    and dropped when the collection changes. The cache is persisted to a JSON file every
+    save_every stores and by close(), so it survives restarts.
+    """
+
+    def __init__(
+        self,
+        embedding_function: SentenceTransformerEmbeddingFunction,
+        collection_version: str,
+        path: Path | None = None,
+        similarity_threshold: float | None = None,
+        ttl_s: float | None = None,
+        max_entries: int | None = None,
+        save_every: int | None = None,
+    ) -> None:
+        """Initializes a SemanticAnswerCache instance, loading the persisted entries if there are any.
+
+        Args:
+            embedding_function (SentenceTransformerEmbeddingFunction): The embedding function for queries.
+            collection_version (str): Identifies the collection contents the answers were generated from.
+            path (Path | None, optional): The JSON file the cache is persisted to. Defaults to None, not persisting.
+            similarity_threshold (float | None, optional): The minimum cosine similarity of a hit. Defaults to SEMANTIC_CACHE_SIMILARITY_THRESHOLD.
+            ttl_s (float | None, optional): How long an answer stays valid, in seconds. Defaults to SEMANTIC_CACHE_TTL_S.
+            max_entries (int | None, optional): The maximum number of cached answers. Defaults to SEMANTIC_CACHE_MAX_ENTRIES.
+            save_every (int | None, optional): The number of stores between saves. Defaults to SEMANTIC_CACHE_SAVE_EVERY.
+        """
+
+        self.embedding_function = embedding_function
+        self.collection_version = collection_version
+        self.path = path
+        self.similarity_threshold = similarity_threshold or SEMANTIC_CACHE_SIMILARITY_THRESHOLD
+        self.ttl_s = ttl_s or SEMANTIC_CACHE_TTL_S
+        self.max_entries = max_entries or SEMANTIC_CACHE_MAX_ENTRIES
+        self.save_every = save_every or SEMANTIC_CACHE_SAVE_EVERY
+
+        self._entries: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._keys: List[str] = []
+        self._matrix: np.ndarray | None = None
+        self.hits = 0
+        self.misses = 0
+        self._unsaved_num = 0
+        #* Saves run in a thread, one at a time, so an older snapshot never replaces a newer one
+        self._save_lock = asyncio.Lock()
+
+        if self.path:
+            self._load()
+
+    async def embed(self, query: str) -> np.ndarray:
+        """Embeds a query, as it is embedded for retrieval too, so the embedding can be reused there.
+
+        Args:
+            query (str): The query.
+
+        Returns:
+            np.ndarray: The query embedding.
+        """
+
+        return np.asarray((await asyncio.to_thread(self.embedding_function, [query]))[0], dtype=np.float32)
+
+    def lookup(self, query_embedding: np.ndarray) -> Tuple[str, List[str]] | None:
+        """Returns the cached answer of the most similar stored query, if it is similar enough.
+
+        Args:
+            query_embedding (np.ndarray): The query embedding.
+
+        Returns:
+            Tuple[str, List[str]] | None: The cached answer and titles, or None on a miss.
+        """
+
+        self._evict_expired()
+        if self._entries:
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.stack([self._entries[key]["embedding"] for key in self._keys])
+            similarities = self._matrix @ normalize(query_embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                key = self._keys[best]
+                self._entries.move_to_end(key)
+                self.hits += 1
+                Logger.info(
+                    f"Answer cache hit for '{key}' (similarity {similarities[best]:.3f})."
+                )
+                entry = self._entries[key]
+                return entry["answer"], list(entry["titles"])
+
+        self.misses += 1
+        return None
+
+    async def store(
+        self, query: str, query_embedding: np.ndarray, answer: str, titles: List[str]
+    ) -> None:
+        """Stores an answer, persisting the cache once save_every answers were stored since the last save.
+
+        Args:
+            query (str): The query.
+            query_embedding (np.ndarray): The query embedding.
+            answer (str): The generated answer.
+            titles (List[str]): The titles of the documents the answer was generated from.
+        """
+
+        self._entries[query] = {
+            "embedding": normalize(query_embedding),
+            "answer": answer,
+            "titles": list(titles),
+            "created_at": time.time(),
+        }
+        self._entries.move_to_end(query)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+        self._unsaved_num += 1
+        if self._unsaved_num >= self.save_every:
+            await self.save()
+
+    def _evict_expired(self) -> None:
+        """Drops the entries older than ttl_s."""
+
+        oldest_valid = time.time() - self.ttl_s
+        expired = [key for key, entry in self._entries.items() if entry["created_at"] < oldest_valid]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    async def save(self) -> None:
+        """Atomically writes the cache to its JSON file, if it has one.
+
+        Only the list of entries is copied on the event loop, they are serialized in a thread.
+        """
+
+        if not self.path:
+            return
+        async with self._save_lock:
+            entries = self._snapshot()
+            try:
+                await asyncio.to_thread(self._write, entries)
+            except OSError as e:
+                Logger.warning(f"Failed to persist the answer cache to {self.path}: {e}")
+
+    def close(self) -> None:
+        """Writes the entries stored since the last save, e.g. on shutdown."""
+
+        if not self.path or not self._unsaved_num:
+            return
+        try:
+            self._write(self._snapshot())
+        except OSError as e:
+            Logger.warning(f"Failed to persist the answer cache to {self.path}: {e}")
+
+    def _snapshot(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Copies the list of entries to save. Entries are replaced on store, never modified, so they are shared."""
+
+        self._unsaved_num = 0
+        return list(self._entries.items())
+
+    def _write(self, entries: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Serializes entries and atomically replaces the JSON file with them.
+
+        Args:
+            entries (List[Tuple[str, Dict[str, Any]]]): The entries, from _snapshot().
+        """
+
+        snapshot = {
+            "version": CACHE_FORMAT_VERSION,
+            "collection_version": self.collection_version,
+            "entries": [
+                {
+                    "query": key,
+                    **entry,
+                    "embedding": entry["embedding"].tolist(),
+                }
+                for key, entry in entries
+            ],
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        #* Every write gets its own temporary file, so concurrent writers never mix their files
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _load(self) -> None:
+        """Loads the persisted entries, unless they belong to another collection version."""
+
+        if not self.path.exists():
+            return
+        try:
+            snapshot = json.loads(self.path.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            Logger.warning(f"Answer cache {self.path} is unreadable, starting empty: {e}")
+            return
+        if snapshot.get("version") != CACHE_FORMAT_VERSION:
+            return
+        if snapshot.get("collection_version") != self.collection_version:
+            Logger.info("Discarding the persisted answer cache, the collection changed.")
+            return
+
+        for entry in snapshot["entries"]:
+            query = entry.pop("query")
+            entry["embedding"] = np.asarray(entry["embedding"], dtype=np.float32)
+            self._entries[query] = entry
+        self._evict_expired()
+        Logger.info(f"Loaded {len(self._entries)} cached answers from {self.path}.")
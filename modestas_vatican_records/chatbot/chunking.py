@@ -0,0 +1,286 @@
+import functools
+import hashlib
+import time
+from pathlib import Path
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Generator, Iterable, Iterator, List, Set, Tuple
+
+from chatbot.config import (
+    CHUNK_OVERLAP,
+    CHUNKING_TOKENIZER,
+    PDF_CHUNK_BATCH_SIZE,
+    SEPARATORS,
+    TOKENS_PER_CHUNK,
+)
+from chatbot.utils.data_models import Article, Chunk
+from chatbot.utils.logging_config import configure_logging
+from chatbot.utils.pdf_utils import iter_pdf_pages
+
+#* This module is imported by the PDF extraction worker processes
+#* Keep it free of heavy imports (chromadb, torch), transformers is only imported to load the tokenizer
+
+Logger = configure_logging()
+
+
+def compute_chunk_id(source: str, page: int, text: str) -> str:
+    """Computes a deterministic chunk id from its file, page and text.
+
+    The same chunk of the same file always gets the same id, so re-ingesting
+    an unchanged file is a no-op and changed files only touch changed chunks.
+
+    Args:
+        source (str): The file name the chunk comes from.
+        page (int): The page number (1-based) the chunk comes from.
+        text (str): The chunk text.
+
+    Returns:
+        str: The hex digest identifying the chunk.
+    """
+
+    digest = hashlib.sha256()
+    for part in (source, str(page), text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def load_tokenizer(tokenizer_name: str) -> Any:
+    """Loads a fast tokenizer once per process.
+
+    Args:
+        tokenizer_name (str): The Hugging Face model id of the tokenizer.
+
+    Returns:
+        Any: The fast tokenizer, which reports token character offsets.
+    """
+
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(tokenizer_name, use_fast=True)
+
+
+class TokenChunker:
+    """Splits text into chunks that fit the embedding model, tokenizing it only once.
+
+    Chunks are cut at token boundaries, preferably after the highest priority separator
+    in the second half of the token budget, and consecutive chunks overlap by up to
+    `overlap` tokens, starting after a separator if there is one. Chunk texts are slices
+    of the original text, so their casing and spacing are kept.
+    """
+
+    def __init__(
+        self,
+        tokenizer: Any,
+        max_tokens: int | None = None,
+        overlap: int | None = None,
+        separators: List[str] | None = None,
+    ) -> None:
+        """Initializes a TokenChunker instance.
+
+        Args:
+            tokenizer (Any): A fast tokenizer, reporting token character offsets.
+            max_tokens (int | None, optional): The context window of the embedding model, special tokens included.
+                Defaults to TOKENS_PER_CHUNK.
+            overlap (int | None, optional): The maximum number of tokens shared by consecutive chunks. Defaults to CHUNK_OVERLAP.
+            separators (List[str] | None, optional): The preferred places to cut after, highest priority first.
+                Defaults to SEPARATORS.
+
+        Raises:
+            ValueError: If the overlap leaves no room for new tokens in a chunk.
+        """
+
+        self.tokenizer = tokenizer
+        #* The model adds its special tokens to every chunk, so they come out of the budget
+        self.max_tokens = (max_tokens or TOKENS_PER_CHUNK) - tokenizer.num_special_tokens_to_add()
+        self.overlap = CHUNK_OVERLAP if overlap is None else overlap
+        self.separators = separators or SEPARATORS
+        if not 0 <= self.overlap < self.max_tokens // 2:
+            raise ValueError(
+                f"Chunk overlap {self.overlap} must be less than half of the {self.max_tokens} tokens per chunk."
+            )
+
+    def split_text(self, text: str) -> List[str]:
+        """Splits a text into chunks of at most max_tokens tokens.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            List[str]: The chunks, in text order.
+        """
+
+        offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        tokens_num = len(offsets)
+        if tokens_num <= self.max_tokens:
+            return [text.strip()] if text.strip() else []
+
+        priorities = self._cut_priorities(text, offsets)
+        chunks: List[str] = []
+        start = 0
+        while True:
+            end = min(start + self.max_tokens, tokens_num)
+            if end < tokens_num:
+                #* Cutting in the second half of the budget keeps chunks from getting too short
+                cut = self._last_cut(priorities, start + self.max_tokens // 2, end)
+                end = cut + 1 if cut is not None else end
+            chunk_text = text[offsets[start][0]:offsets[end - 1][1]].strip()
+            if chunk_text:
+                chunks.append(chunk_text)
+            if end >= tokens_num:
+                return chunks
+
+            next_start = end - self.overlap
+            cut = self._first_cut(priorities, next_start - 1, end - 1)
+            start = cut + 1 if cut is not None else next_start
+
+    def _cut_priorities(self, text: str, offsets: List[Tuple[int, int]]) -> List[int]:
+        """Returns the priority of cutting after every token, 0 if it is not followed by a separator.
+
+        Args:
+            text (str): The text.
+            offsets (List[Tuple[int, int]]): The character offsets of the tokens.
+
+        Returns:
+            List[int]: The priority of every token boundary, higher is better.
+        """
+
+        priorities = [0] * len(offsets)
+        for i in range(len(offsets) - 1):
+            #* The token itself and the whitespace after it
+            boundary = text[offsets[i][0]:offsets[i + 1][0]]
+            for rank, separator in enumerate(self.separators):
+                if separator in boundary:
+                    priorities[i] = len(self.separators) - rank
+                    break
+        return priorities
+
+    @staticmethod
+    def _last_cut(priorities: List[int], low: int, high: int) -> int | None:
+        """Finds the last token in [low, high) followed by the highest priority separator in that range."""
+
+        best = None
+        for i in range(high - 1, low - 1, -1):
+            if priorities[i] and (best is None or priorities[i] > priorities[best]):
+                best = i
+        return best
+
+    @staticmethod
+    def _first_cut(priorities: List[int], low: int, high: int) -> int | None:
+        """Finds the first token in [low, high) followed by the highest priority separator in that range."""
+
+        best = None
+        for i in range(max(low, 0), high):
+            if priorities[i] and (best is None or priorities[i] > priorities[best]):
+                best = i
+        return best
+
+    def iter_chunks(self, pages: Iterable[str], title: str, source: str) -> Iterator[Chunk]:
+        """Splits pages into content-hashed chunks as they arrive, numbering them from 1.
+
+        Each page is chunked before the next one is taken, so pages can be streamed in
+        straight from the PDF. Chunks repeating within the same page are kept only once,
+        as they share an id.
+
+        Args:
+            pages (Iterable[str]): The page texts, in page order.
+            title (str): The title of the article.
+            source (str): The file name of the article.
+
+        Yields:
+            Chunk: The chunks, in page order.
+        """
+
+        for page_number, page_text in enumerate(pages, start=1):
+            if not page_text:
+                continue
+            seen_ids: Set[str] = set()
+            for chunk_text in self.split_text(page_text):
+                chunk_id = compute_chunk_id(source, page_number, chunk_text)
+                if chunk_id in seen_ids:
+                    continue
+                seen_ids.add(chunk_id)
+                yield Chunk(id=chunk_id, document=chunk_text, title=title, page=page_number)
+
+    def chunk_article(self, article: Article) -> List[Chunk]:
+        """Splits an article page by page into content-hashed chunks.
+
+        Args:
+            article (Article): The article to split.
+
+        Returns:
+            List[Chunk]: The article chunks.
+        """
+
+        return list(self.iter_chunks(article.pages, article.title, article.source or article.title))
+
+
+def create_chunker() -> TokenChunker:
+    """Creates the chunker of the embedding model.
+
+    Returns:
+        TokenChunker: The chunker.
+    """
+
+    return TokenChunker(load_tokenizer(CHUNKING_TOKENIZER))
+
+
+def extract_chunks(filepath: str, batch_size: int | None = None) -> Generator[List[Chunk], None, Dict[str, Any]]:
+    """Reads a PDF file page by page, chunking every page as it is read. Runs inside an extraction worker process.
+
+    Chunks are yielded in batches as they are made, so neither the pages nor the chunks
+    of the whole file are ever held in memory at once.
+
+    Args:
+        filepath (str): The path to the PDF file.
+        batch_size (int | None, optional): The number of chunks per batch. Defaults to PDF_CHUNK_BATCH_SIZE.
+
+    Yields:
+        List[Chunk]: The chunks, in page order.
+
+    Returns:
+        Dict[str, Any]: The "characters" of text read, the number of "chunks"
+                        and the "seconds" spent reading and chunking, waits for the consumer excluded.
+    """
+
+    path = Path(filepath)
+    batch_size = batch_size or PDF_CHUNK_BATCH_SIZE
+    stats: Dict[str, Any] = {"characters": 0, "chunks": 0, "seconds": 0.0}
+
+    def read_pages() -> Iterator[str]:
+        for page_text in iter_pdf_pages(path):
+            stats["characters"] += len(page_text)
+            yield page_text
+
+    batch: List[Chunk] = []
+    start = time.perf_counter()
+    for chunk in create_chunker().iter_chunks(read_pages(), title=path.stem, source=path.name):
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            stats["seconds"] += time.perf_counter() - start
+            stats["chunks"] += len(batch)
+            yield batch
+            batch = []
+            start = time.perf_counter()
+    stats["seconds"] += time.perf_counter() - start
+    if batch:
+        stats["chunks"] += len(batch)
+        yield batch
+    return stats
+
+
+async def aiterate(items: Iterable[Any] | AsyncIterable[Any]) -> AsyncIterator[Any]:
+    """Iterates over a synchronous or an asynchronous iterable alike.
+
+    Args:
+        items (Iterable[Any] | AsyncIterable[Any]): The items.
+
+    Yields:
+        Any: The items.
+    """
+
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
@@ -31,6 +31,16 @@ CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 #* Qwen model card: https://huggingface.co/Qwen/Qwen2.5-3B-Instruct
 HF_LLM_MODEL_ID = "Qwen/Qwen2.5-3B-Instruct"
 
+#* Inference backends, as the production boxes are CPU only
+#* "torch" runs the models as they are published (Qwen in its bf16 weights, the encoders in fp32)
+#* "int8" quantizes the linear layers of a model to int8 with dynamic activation quantization (CPU only)
+#* "onnx" (LLM only) exports Qwen to ONNX Runtime, it needs the optional optimum[onnxruntime] dependency
+#* The stored chunks are embedded with the EMBEDDING_BACKEND too, so changing it re-ingests the collection
+#* Run tests/benchmark_backends.py to compare the tokens/s and accuracy of the backends
+LLM_BACKEND = "torch"
+RERANKER_BACKEND = "torch"
+EMBEDDING_BACKEND = "torch"
+
 #* I chose to use ChromaDB database to store the articles semantics
 #* I like ChromaDB for it's convenient and easy use
 #* And an option to pass a SentenceTransformer instance as embedding function
@@ -42,27 +52,81 @@ HF_LLM_MODEL_ID = "Qwen/Qwen2.5-3B-Instruct"
 CHROMA_DB_PERSIST_DIR = "./chroma_db"
 COLLECTION_NAME = "help_center_articles"
 
+#* Re-embedding the whole corpus on every PDF change takes tens of minutes
+#* With incremental ingestion chunk ids are content hashes of (file, page, chunk text)
+#* and a manifest of file mtimes and hashes is kept next to the Chroma DB,
+#* so only new or changed chunks are embedded and stale ones are deleted
+#* Set to False to fall back to populating the collection only when it is empty
+INCREMENTAL_INGESTION = True
+INGESTION_MANIFEST_PATH = "./chroma_db/ingestion_manifest.json"
+
+#* PDFs are parsed in a pool of worker processes and streamed into embedding as they are read
+#* Every worker reads, normalizes and chunks its PDF one page at a time and sends its chunks back
+#* in batches of PDF_CHUNK_BATCH_SIZE through a bounded queue, so memory stays flat for long manuals
+#* None uses one worker per CPU core
+#* A PDF that takes longer than the timeout to parse is skipped and logged
+PDF_EXTRACTION_WORKERS = None
+PDF_EXTRACTION_TIMEOUT_S = 120
+PDF_CHUNK_BATCH_SIZE = 64
+
 #* I think, 5 retrieved documents for this RAG task should be sufficient enough
 NUM_RETRIEVE_DOCUMENTS = 5
 
+#* Dense retrieval misses exact terms like product names and error codes
+#* So a BM25 inverted index of the chunks is built at ingestion time and persisted next to the Chroma DB
+#* Its BM25_NUM_RESULTS best chunks are fused with the dense results of every query with Reciprocal Rank Fusion
+#* RRF_K = 60 is the constant from the original RRF paper, it dampens the advantage of the very top ranks
+#* The RETRIEVAL_NUM_CANDIDATES best fused chunks go on to reranking
+HYBRID_RETRIEVAL = True
+BM25_INDEX_PATH = "./chroma_db/bm25_index.json"
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_NUM_RESULTS = 10
+RRF_K = 60
+RETRIEVAL_NUM_CANDIDATES = 20
+
+#* The cross encoder scores RERANK_BATCH_SIZE (query, document) pairs per forward pass
+#* Scores are cached per (query, chunk) pair, so reranking the same candidates again is free
+#* Documents scoring below RERANK_MIN_SCORE (a cross encoder logit) are not passed to the LLM, None keeps them all
+RERANK_BATCH_SIZE = 32
+RERANK_CACHE_SIZE = 10000
+RERANK_MIN_SCORE = None
+
 #* I use newline character's and end of sentence character as separators for text chunks
 #* To try to maintain the semantic consistency of the retrieved documents
 #* The newline character is still used as a primary option to split chunk paragraph-wise
 SEPARATORS = ["\n", "."]
 
-#* At first text is split in chunks by characters
-#* But there might be some resulting chunks that are too long token-wise
-#* For the SentenceTransformer model - exceed it's context window
-#* Then later these chunks are reworked and split token-wise, if some exceed pre-defined context window
+#* Every page is tokenized once with the embedding model's fast tokenizer and cut into chunks that fit its context window,
+#* preferably after a SEPARATORS boundary, so no chunk is truncated by the model and no text is re-tokenized
 #* The context window of "all-MiniLM-L6-v2" SentenceTransformer model is 256, therefore TOKENS_PER_CHUNK = 256
-#* Exceeding tokens (if not processed by token-wise chunking) are truncated and not included into the Chroma DB
-CHARACTER_SPLIT_CHUNK_SIZE = 500
+#* (the [CLS] and [SEP] tokens included). Consecutive chunks share up to CHUNK_OVERLAP tokens
+CHUNKING_TOKENIZER = "sentence-transformers/all-MiniLM-L6-v2"
 TOKENS_PER_CHUNK = 256
 CHUNK_OVERLAP = 100
 
+#* Chunks are embedded and written to Chroma in batches of this size
+#* Embedding of the next batch overlaps with the write of the current one,
+#* so peak memory is bounded by two batches instead of the whole corpus
+EMBEDDING_BATCH_SIZE = 256
+
 #* 1024 tokens to generate should be sufficient for Qwen and this task
 MAX_NEW_TOKENS = 1024
 
+#* Concurrent LLM.chat calls are queued and generated together as left-padded batches
+#* A batch is started once it has GENERATION_MAX_BATCH_SIZE prompts
+#* or GENERATION_MAX_WAIT_MS milliseconds after its first prompt arrived, whichever comes first
+#* A single user therefore waits at most GENERATION_MAX_WAIT_MS longer than before
+GENERATION_MAX_BATCH_SIZE = 4
+GENERATION_MAX_WAIT_MS = 25
+
+#* The past key values of every system prompt and of each session's conversation so far are kept,
+#* so a new turn only pre-fills its new messages instead of the whole conversation
+#* They take PREFIX_CACHE_MAX_MB at most, the least recently used sessions are evicted beyond it
+#* Qwen2.5-3B keeps 36 KB per token (bf16), so 2048 MB hold around 58K tokens of conversations
+PREFIX_CACHE_ENABLED = True
+PREFIX_CACHE_MAX_MB = 2048
+
 #* To not exceed the already high Qwen context window (128K tokens)
 #* I have added a limit to conversation history (1000 messages)
 #* If a message on average could have 50-100 tokens
@@ -72,6 +136,52 @@ MAX_NEW_TOKENS = 1024
 #* As the latency of the system becomes pretty annoying after 5 messages...
 CONVERSATION_HISTORY_LIMIT = 1000
 
+#* Before retrieval the query can be expanded to find documents phrased differently than the question
+#* "none" retrieves with the query only
+#* "llm" asks the LLM for related questions. It is a whole extra generate call, so it is capped
+#* at QUERY_EXPANSION_MAX_NEW_TOKENS (five short questions fit easily) and cached per query
+#* "embedding" moves the query embedding towards its QUERY_EXPANSION_NEIGHBOURS nearest chunks, without any generation
+#* If a strategy takes longer than its QUERY_EXPANSION_TIMEOUT_S budget, retrieval proceeds with the query only
+QUERY_EXPANSION_STRATEGY = "embedding"
+QUERY_EXPANSION_MAX_NEW_TOKENS = 96
+QUERY_EXPANSION_CACHE_SIZE = 512
+QUERY_EXPANSION_NEIGHBOURS = 3
+QUERY_EXPANSION_TIMEOUT_S = {"none": 0.0, "llm": 4.0, "embedding": 0.5}
+
+#* Answers to standalone questions are cached, keyed by the embedding of the question
+#* A new question is answered from the cache if it is at least SEMANTIC_CACHE_SIMILARITY_THRESHOLD
+#* cosine-similar to a cached one, skipping retrieval, reranking and generation altogether
+#* The threshold is kept high, as rephrasings are welcome but different questions on the same topic are not
+#* Cached answers expire after SEMANTIC_CACHE_TTL_S seconds, are dropped when the articles change,
+#* and the least recently used ones are evicted beyond SEMANTIC_CACHE_MAX_ENTRIES
+#* The cache is written to disk every SEMANTIC_CACHE_SAVE_EVERY new answers and on shutdown
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_PATH = "./chroma_db/answer_cache.json"
+SEMANTIC_CACHE_SIMILARITY_THRESHOLD = 0.95
+SEMANTIC_CACHE_TTL_S = 7 * 24 * 60 * 60
+SEMANTIC_CACHE_MAX_ENTRIES = 1000
+SEMANTIC_CACHE_SAVE_EVERY = 20
+
+#* The history limit alone leaves the prompt length, and therefore the prefill time, unbounded
+#* So every RAG prompt is fitted into RAG_CONTEXT_TOKEN_BUDGET tokens, counted with Qwen's tokenizer
+#* The query always goes in, then the reranked documents best first, then the most recent conversation turns
+#* Older turns that don't fit are dropped. A document that doesn't fit whole is truncated,
+#* unless less than RAG_MIN_DOCUMENT_TOKENS tokens of it would be left
+RAG_CONTEXT_TOKEN_BUDGET = 6144
+RAG_MIN_DOCUMENT_TOKENS = 64
+
+#* Every request records spans of its stages (retrieval, reranking, generation...) with their durations,
+#* token counts, cache hits and candidate counts. The last TRACING_MAX_SPANS spans are served as
+#* OpenTelemetry JSON on /traces, and per-stage histograms and counters in the Prometheus format on /metrics
+TRACING_ENABLED = True
+TRACING_MAX_SPANS = 2048
+TRACING_DURATION_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+#* tests/inspect_chroma.py caches the fitted UMAP and the projected coordinates of every chunk,
+#* keyed by the collection version, so only chunks added since are projected, in batches
+UMAP_CACHE_DIR = "./chroma_db/umap_cache"
+UMAP_TRANSFORM_BATCH_SIZE = 4096
+
 #* Some system prompts for Qwen to operate on. RAG task has a dedicated separate, task-based system prompt
 GENERAL_SYSTEM_PROMPT = "You are a helpful assistant."
 RAG_SYSTEM_PROMPT = """You are a helpful expert help center assistant.
@@ -90,4 +200,12 @@ Provide an example answer to the given question, that might be found in a networ
 DATA_ARTICLES_PATH = "chatbot/data/"
 ASSESSMENT_RESULTS_PATH = "results/assessment_result.txt"
 
+#* Evaluation cases are judged concurrently, at most EVALUATION_CONCURRENCY requests in flight
+#* Rate limited requests are retried up to EVALUATION_MAX_RETRIES times with jittered exponential backoff
+#* Judgements are cached by the evaluator, prompt and case, so reruns only judge changed answers
+EVALUATION_CONCURRENCY = 8
+EVALUATION_MAX_RETRIES = 5
+EVALUATION_RETRY_BASE_DELAY_S = 2.0
+EVALUATION_CACHE_PATH = "results/evaluation_cache.json"
+
 HF_CACHE_DIR = ".hf_cache"
\ No newline at end of file
@@ -0,0 +1,139 @@
+from typing import Any, Callable, Dict, List, Tuple
+
+from chatbot.config import RAG_CONTEXT_TOKEN_BUDGET, RAG_MIN_DOCUMENT_TOKENS
+from chatbot.tracing import current_span
+from chatbot.utils.logging_config import configure_logging
+
+Logger = configure_logging()
+
+
+class ContextBuilder:
+    """Fits the RAG prompt into a token budget, counting tokens with the LLM's tokenizer.
+
+    The budget is filled in priority order: the system prompt and the query are always kept,
+    then the reranked documents are added best first (the last one that does not fit whole
+    is truncated), and the remaining tokens go to the most recent conversation turns.
+    Older turns that do not fit are dropped.
+    """
+
+    def __init__(self, tokenizer: Any, token_budget: int | None = None) -> None:
+        """Initializes a ContextBuilder instance.
+
+        Args:
+            tokenizer (Any): The LLM's tokenizer, with a chat template.
+            token_budget (int | None, optional): The maximum number of prompt tokens. Defaults to RAG_CONTEXT_TOKEN_BUDGET.
+        """
+
+        self.tokenizer = tokenizer
+        self.token_budget = token_budget or RAG_CONTEXT_TOKEN_BUDGET
+        #* The tokens the chat template adds around the system message, every other message and after the last one
+        #* Measured relative to a system message, as Qwen's template inserts a default one when there is none
+        system_only = [{"role": "system", "content": ""}]
+        with_message = [*system_only, {"role": "user", "content": ""}]
+        self.system_overhead = len(self.tokenizer.apply_chat_template(system_only, tokenize=True))
+        self.message_overhead = (
+            len(self.tokenizer.apply_chat_template(with_message, tokenize=True)) - self.system_overhead
+        )
+        self.generation_prompt_overhead = len(
+            self.tokenizer.apply_chat_template(with_message, tokenize=True, add_generation_prompt=True)
+        ) - self.system_overhead - self.message_overhead
+
+    def count_tokens(self, text: str) -> int:
+        """Counts the tokens of a text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            int: The number of tokens.
+        """
+
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Truncates a text to its first max_tokens tokens.
+
+        Args:
+            text (str): The text.
+            max_tokens (int): The maximum number of tokens.
+
+        Returns:
+            str: The truncated text.
+        """
+
+        token_ids = self.tokenizer(text, add_special_tokens=False).input_ids
+        return self.tokenizer.decode(token_ids[:max_tokens], skip_special_tokens=True)
+
+    def build(
+        self,
+        query: str,
+        documents: List[str],
+        conversation_history: List[Dict[str, str]] | None,
+        system_prompt: str,
+        build_user_prompt: Callable[[str, List[str]], str],
+    ) -> Tuple[str, List[Dict[str, str]]]:
+        """Selects the documents and conversation turns that fit into the token budget.
+
+        Args:
+            query (str): The user's query.
+            documents (List[str]): The reranked documents, most relevant first.
+            conversation_history (List[Dict[str, str]] | None): The conversation history, oldest first.
+            system_prompt (str): The system prompt.
+            build_user_prompt (Callable[[str, List[str]], str]): Builds the user prompt from the query and the selected documents.
+
+        Returns:
+            Tuple[str, List[Dict[str, str]]]: The user prompt and the conversation turns to keep.
+        """
+
+        conversation_history = conversation_history or []
+        system_tokens = self.count_tokens(system_prompt) + self.system_overhead
+        base_prompt_tokens = (
+            self.count_tokens(build_user_prompt(query, [])) + self.message_overhead + self.generation_prompt_overhead
+        )
+        remaining = self.token_budget - system_tokens - base_prompt_tokens
+
+        #* Documents come before the conversation history, as the answer has to be grounded in them
+        selected_documents: List[str] = []
+        document_tokens = 0
+        separator_tokens = (
+            self.count_tokens(build_user_prompt("", ["", ""])) - self.count_tokens(build_user_prompt("", [""]))
+        )
+        for document in documents:
+            tokens = self.count_tokens(document) + (separator_tokens if selected_documents else 0)
+            if tokens <= remaining - document_tokens:
+                selected_documents.append(document)
+                document_tokens += tokens
+                continue
+            separator = separator_tokens if selected_documents else 0
+            available = remaining - document_tokens - separator
+            if available >= RAG_MIN_DOCUMENT_TOKENS:
+                selected_documents.append(self.truncate(document, available))
+                document_tokens += available + separator
+            break
+        remaining -= document_tokens
+
+        #* The most recent turns are kept, the older ones dropped, so the history stays contiguous
+        history_tokens = 0
+        kept_turns_num = 0
+        for message in reversed(conversation_history):
+            tokens = self.count_tokens(message["content"]) + self.message_overhead
+            if tokens > remaining - history_tokens:
+                break
+            history_tokens += tokens
+            kept_turns_num += 1
+        kept_history = conversation_history[len(conversation_history) - kept_turns_num:]
+
+        Logger.info(
+            f"RAG context tokens: system {system_tokens}, query {base_prompt_tokens}, "
+            f"documents {document_tokens} ({len(selected_documents)} of {len(documents)}), "
+            f"history {history_tokens} ({len(kept_history)} of {len(conversation_history)} messages), "
+            f"total {system_tokens + base_prompt_tokens + document_tokens + history_tokens} of {self.token_budget}."
+        )
+        span = current_span()
+        if span:
+            span.set(
+                context_tokens=system_tokens + base_prompt_tokens + document_tokens + history_tokens,
+                context_documents=len(selected_documents),
+                context_history_messages=len(kept_history),
+            )
+        return build_user_prompt(query, selected_documents), kept_history
@@ -1,83 +1,306 @@
-import pypdf
-import uuid
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Generator, Iterable, List, Set, Tuple
 
 import chromadb
 from chromadb.api.models import Collection
 from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-from langchain.text_splitter import (
-    RecursiveCharacterTextSplitter,
-    SentenceTransformersTokenTextSplitter,
-)
 
 from chatbot.config import (
-    CHARACTER_SPLIT_CHUNK_SIZE,
-    CHUNK_OVERLAP,
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
     EMBEDDING_MODEL,
-    SEPARATORS,
-    TOKENS_PER_CHUNK,
+    PDF_EXTRACTION_TIMEOUT_S,
+    PDF_EXTRACTION_WORKERS,
 )
-from chatbot.utils.data_models import Article
-from chatbot.utils.text_utils import preprocess_text
+from chatbot.chunking import aiterate, extract_chunks
+from chatbot.backends import ENCODER_BACKENDS, INT8, quantize_sentence_transformer, validate_backend
+from chatbot.sparse_index import BM25Index, analyze_chunks
+from chatbot.utils.data_models import Article, Chunk, ChunkBatch
+from chatbot.utils.pdf_utils import DONE, FAILED, RESULT, set_result_queue, stream_pdf_results
 from chatbot.utils.logging_config import configure_logging
 
 Logger = configure_logging()
 
+#* Seconds between checks for timed out and crashed PDF workers while no events arrive
+EVENT_POLL_S = 0.5
+
 
-async def load_articles(directory_path: Path) -> List[Dict[str, str]]:
-    """Loads articles from PDF files in a directory.
+def list_pdf_files(directory_path: Path) -> List[Path]:
+    """Lists the PDF files in a directory.
 
     Args:
         directory_path (Path): The path to the directory containing PDF files.
 
     Returns:
-        List[Dict[str, str]]: A list of articles, where each article is a dictionary
-                             with "title" (filename) and "body" (text content).
+        List[Path]: The paths of the PDF files, sorted by name.
 
     Raises:
-        Exception: If the directory is not found or if there is an error during PDF processing.
+        FileNotFoundError: If the directory is not found.
     """
 
+    if not directory_path.is_dir():
+        Logger.error(f"Failed to load articles from {directory_path}: directory not found")
+        raise FileNotFoundError(f"Directory not found: {directory_path}")
+    return sorted(
+        filepath for filepath in directory_path.iterdir() if filepath.name.endswith(".pdf")
+    )
+
+
+def terminate_workers(executor: ProcessPoolExecutor) -> None:
+    """Stops the worker processes of a pool, including ones stuck on a file, and shuts the pool down.
+
+    ProcessPoolExecutor has no public way to stop a running task, so this relies on its private
+    _processes mapping. If it is not there, the stuck workers are left to finish in the background.
+
+    Args:
+        executor (ProcessPoolExecutor): The pool.
+    """
+
+    processes = getattr(executor, "_processes", None)
+    if isinstance(processes, dict):
+        for process in list(processes.values()):
+            process.terminate()
+    else:
+        Logger.warning("Cannot stop the stuck PDF workers, leaving them to finish in the background.")
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def read_events(events: Any, wait_s: float, max_events: int) -> List[Tuple[str, str, Any]]:
+    """Reads the events waiting in a worker result queue, waiting for the first one for up to wait_s seconds.
+
+    Args:
+        events (Any): The multiprocessing queue.
+        wait_s (float): The maximum number of seconds to wait for the first event.
+        max_events (int): The maximum number of events to read.
+
+    Returns:
+        List[Tuple[str, str, Any]]: The (filepath, event, payload) events, empty if none arrived in time.
+    """
+
+    received: List[Tuple[str, str, Any]] = []
+    try:
+        received.append(events.get(timeout=wait_s))
+        while len(received) < max_events:
+            received.append(events.get_nowait())
+    except queue.Empty:
+        pass
+    return received
+
+
+async def iter_pdf_results(
+    worker: Callable[[str], Generator[Any, None, Any]],
+    filepaths: Iterable[Path],
+    max_workers: int | None = None,
+    timeout: float | None = None,
+) -> AsyncIterator[Tuple[Path, str, Any]]:
+    """Runs a generator worker on PDF files in a process pool, streaming what it yields as it yields it.
+
+    Parsing runs outside the event loop thread, and workers send their items through a queue
+    of two items per worker, so a worker that gets ahead of the consumer waits for it and neither
+    a whole file's results nor the corpus text is ever held in memory. At most one file per worker
+    is in flight, so the timeout clock of a file starts when a worker picks it up, and time the
+    consumer spends on a yielded event is not counted, as workers may be waiting for it meanwhile.
+    A worker stuck on a timed out file keeps its slot, and once every worker is stuck, the pool is replaced.
+
+    Args:
+        worker (Callable[[str], Generator[Any, None, Any]]): The picklable generator function
+            processing the PDF file at a path.
+        filepaths (Iterable[Path]): The paths of the PDF files.
+        max_workers (int | None, optional): The number of worker processes. Defaults to PDF_EXTRACTION_WORKERS.
+        timeout (float | None, optional): Seconds allowed per file. Defaults to PDF_EXTRACTION_TIMEOUT_S.
+
+    Yields:
+        Tuple[Path, str, Any]: (filepath, RESULT, item) for every item the worker yields, then
+            (filepath, DONE, its return value), or (filepath, FAILED, the error) if it fails or times out.
+            The events of a file are in order, but the events of different files are interleaved.
+    """
+
+    if not max_workers:
+        max_workers = PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+    if not timeout:
+        timeout = PDF_EXTRACTION_TIMEOUT_S
+
+    def start_pool() -> Tuple[ProcessPoolExecutor, Any]:
+        #* A terminated worker may leave the queue unusable, so every pool gets a new one
+        events = multiprocessing.Queue(maxsize=2 * max_workers)
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers, initializer=set_result_queue, initargs=(events,)
+        )
+        return executor, events
+
+    loop = asyncio.get_running_loop()
+    executor, events = start_pool()
+    remaining = iter(filepaths)
+    next_filepath = next(remaining, None)
+    #* Files being processed with their futures and start times, and the futures of timed out files still taking a worker
+    running: Dict[str, Tuple[Path, asyncio.Future, float]] = {}
+    stuck: Set[asyncio.Future] = set()
+    broken = False
+    loaded_num = 0
+    #* The clock of the timeouts, stopped while the consumer has an event
+    away_s = 0.0
+
+    def clock() -> float:
+        return loop.time() - away_s
+
     try:
-        if not directory_path.is_dir():
-            raise FileNotFoundError(f"Directory not found: {directory_path}")
-        articles: List[Dict[str, str]] = []
-        for filepath in directory_path.iterdir():
-            if filepath.name.endswith(".pdf"):
-                try:
-                    with open(filepath, "rb") as f:
-                        reader = pypdf.PdfReader(f)
-                        pages_text = []
-                        for page in reader.pages:
-                            pages_text.append(preprocess_text(page.extract_text()))
-                        text = ".\n".join(pages_text)
-                        articles.append(
-                            {"title": filepath.stem, "body": text}
-                        )
-                except Exception as e:
-                    Logger.error(f"Failed to process PDF {filepath.name}: {e}")
-                    # Continue processing other PDFs even if one fails
+        while True:
+            stuck = {future for future in stuck if not future.done()}
+            if next_filepath is not None and (broken or len(stuck) >= max_workers):
+                Logger.warning("Every PDF worker is stuck on a timed out file or has crashed, restarting them.")
+                terminate_workers(executor)
+                events.close()
+                executor, events = start_pool()
+                stuck.clear()
+                broken = False
+
+            while next_filepath is not None and len(running) + len(stuck) < max_workers:
+                future = loop.run_in_executor(executor, stream_pdf_results, worker, str(next_filepath))
+                running[str(next_filepath)] = (next_filepath, future, clock())
+                next_filepath = next(remaining, None)
+            if not running:
+                break
+
+            outcomes: List[Tuple[Path, str, Any]] = []
+            deadline = min(started for _, _, started in running.values()) + timeout
+            wait_s = min(max(deadline - clock(), 0), EVENT_POLL_S)
+            for path, event, payload in await asyncio.to_thread(read_events, events, wait_s, 2 * max_workers):
+                if path not in running:
+                    #* Events of a file that already timed out
                     continue
+                filepath = running[path][0]
+                if event == DONE:
+                    del running[path]
+                    loaded_num += 1
+                elif event == FAILED:
+                    del running[path]
+                    Logger.error(f"Failed to process PDF {filepath.name}: {payload}")
+                outcomes.append((filepath, event, payload))
+
+            now = clock()
+            for path, (filepath, future, started) in list(running.items()):
+                if future.done() and (future.cancelled() or future.exception()):
+                    #* The worker process crashed before it could report the file
+                    error = "cancelled" if future.cancelled() else future.exception()
+                    broken = broken or isinstance(error, BrokenProcessPool)
+                    Logger.error(f"Failed to process PDF {filepath.name}: {error}")
+                elif not future.done() and now - started >= timeout:
+                    error = f"timed out after {timeout} s"
+                    Logger.error(f"Failed to process PDF {filepath.name}: {error}")
+                    stuck.add(future)
+                    #* The result of a stuck worker is dropped whenever it finishes
+                    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                else:
+                    continue
+                del running[path]
+                outcomes.append((filepath, FAILED, str(error)))
+
+            for outcome in outcomes:
+                away_start = loop.time()
+                yield outcome
+                away_s += loop.time() - away_start
+    finally:
+        for _, future, _ in running.values():
+            future.cancel()
+        if running or any(not future.done() for future in stuck):
+            #* Workers may be stuck on a file or waiting for the consumer to read their events
+            terminate_workers(executor)
+        else:
+            executor.shutdown(wait=True, cancel_futures=True)
+        events.close()
+        Logger.info(f"Extracted {loaded_num} articles.")
+
+
+async def iter_pdf_chunks(
+    filepaths: Iterable[Path],
+    max_workers: int | None = None,
+    timeout: float | None = None,
+) -> AsyncIterator[ChunkBatch]:
+    """Chunks PDF files in a process pool, streaming the chunks of every article in batches as they are made.
+
+    Every worker chunks the pages of its file as it reads them and sends the chunks back
+    in batches of PDF_CHUNK_BATCH_SIZE, so neither the worker nor the event loop ever holds
+    the whole text or all chunks of a long document, and memory stays flat however many
+    pages the file has. The reading and chunking throughput is logged at the end.
 
-        Logger.info(f"Loaded {len(articles)} articles from {directory_path}")
-        return articles
+    Args:
+        filepaths (Iterable[Path]): The paths of the PDF files.
+        max_workers (int | None, optional): The number of worker processes. Defaults to PDF_EXTRACTION_WORKERS.
+        timeout (float | None, optional): Seconds allowed per file. Defaults to PDF_EXTRACTION_TIMEOUT_S.
+
+    Yields:
+        ChunkBatch: The batches of every article, in page order within an article, articles interleaved.
+            Every article ends with a batch marked last, which is also marked failed if the article
+            could not be read, and then its earlier batches are incomplete.
+    """
 
-    except FileNotFoundError as e:
-        Logger.error(f"Failed to load articles from {directory_path}: {e}")
-        raise
-    except Exception as e:
-        Logger.error(f"An unexpected error occurred: {e}")
-        raise
+    if not max_workers:
+        max_workers = PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+
+    articles_num = chunks_num = characters_num = 0
+    chunking_s = 0.0
+    start = time.perf_counter()
+    async for filepath, event, payload in iter_pdf_results(extract_chunks, filepaths, max_workers, timeout):
+        article = Article(title=filepath.stem, source=filepath.name)
+        if event == RESULT:
+            yield ChunkBatch(article=article, chunks=payload)
+            continue
+        if event == DONE:
+            articles_num += 1
+            chunks_num += payload["chunks"]
+            characters_num += payload["characters"]
+            chunking_s += payload["seconds"]
+        yield ChunkBatch(article=article, last=True, failed=event == FAILED)
+
+    if articles_num:
+        elapsed = time.perf_counter() - start
+        Logger.info(
+            f"Chunked {articles_num} articles into {chunks_num} chunks in {elapsed:.1f} s: "
+            f"{characters_num / max(chunking_s, 1e-9) / 1e6:.2f} MB/s of text per worker, "
+            f"{chunks_num / max(elapsed, 1e-9):.1f} chunks/s overall with {max_workers} workers."
+        )
+
+
+def sentence_transformer_of(embedding_function: SentenceTransformerEmbeddingFunction) -> Any:
+    """Returns the SentenceTransformer model a Chroma embedding function runs.
+
+    Chroma doesn't expose the model publicly, so it is read from the embedding function's private attribute.
+
+    Args:
+        embedding_function (SentenceTransformerEmbeddingFunction): The embedding function.
+
+    Returns:
+        Any: The SentenceTransformer model.
+
+    Raises:
+        AttributeError: If the installed Chroma version stores the model elsewhere.
+    """
+
+    model = getattr(embedding_function, "_model", None)
+    if model is None:
+        raise AttributeError(
+            "SentenceTransformerEmbeddingFunction has no '_model' attribute in this Chroma version,"
+            " so its model can't be quantized. Use the 'torch' embedding backend instead."
+        )
+    return model
 
 
 async def create_embedding_function(
     embedding_model_name: str | None = None,
+    backend: str | None = None,
 ) -> SentenceTransformerEmbeddingFunction:
     """Creates a SentenceTransformerEmbeddingFunction asynchronously.
 
     Args:
         embedding_model_name (str | None, optional): The name of the embedding model. Defaults to None.
+        backend (str | None, optional): The inference backend, "torch" or "int8". Defaults to EMBEDDING_BACKEND.
 
     Returns:
         SentenceTransformerEmbeddingFunction: The embedding function.
@@ -89,10 +312,15 @@ async def create_embedding_function(
         if not embedding_model_name:
             embedding_model_name = EMBEDDING_MODEL
 
+        backend = validate_backend(backend or EMBEDDING_BACKEND, ENCODER_BACKENDS)
+
         embedding_function = SentenceTransformerEmbeddingFunction(
             model_name=embedding_model_name
         )
-        Logger.info("Embedding function initialized.")
+        if backend == INT8:
+            #* The embedding function runs on the CPU, where dynamic int8 quantization is supported
+            quantize_sentence_transformer(sentence_transformer_of(embedding_function))
+        Logger.info(f"Embedding function initialized ({backend} backend).")
         return embedding_function
     except Exception as e:
         Logger.error(f"Error initializing embedding function: {e}")
@@ -138,7 +366,9 @@ async def get_or_create_collection(
     """
 
     try:
-        collection = client.get_collection(name=collection_name)
+        collection = client.get_collection(
+            name=collection_name, embedding_function=embedding_function
+        )
         Logger.info(f"Found existing collection '{collection_name}'.")
     except chromadb.errors.InvalidCollectionException:
         Logger.info(f"Collection '{collection_name}' not found. Creating a new one.")
@@ -148,65 +378,215 @@ async def get_or_create_collection(
     return collection
 
 
-async def populate_collection(
-    collection: Collection, articles: List[Dict[str, Any]]
+def upsert_chunks(
+    collection: Collection,
+    chunks: List[Chunk],
+    embeddings: List[Any] | None = None,
 ) -> None:
-    """Populates a ChromaDB collection with articles.
+    """Upserts chunks into a ChromaDB collection.
+
+    Upserting keeps re-ingestion idempotent, as chunk ids are content hashes.
 
     Args:
         collection (Collection): The ChromaDB collection.
-        articles (List[Dict[str, Any]]): The articles to add to the collection.
+        chunks (List[Chunk]): The chunks to upsert.
+        embeddings (List[Any] | None, optional): Precomputed chunk embeddings.
+            Defaults to None, letting the collection embed the chunks.
 
     Raises:
-        chromadb.APIError: If there is an error populating the collection.
+        chromadb.APIError: If there is an error upserting the chunks.
     """
 
-    ids: List[str] = []
-    documents: List[str] = []
-    metadatas: List[Dict[str, Any]] = []
+    if not chunks:
+        return
+    try:
+        collection.upsert(
+            ids=[chunk.id for chunk in chunks],
+            embeddings=embeddings,
+            documents=[chunk.document for chunk in chunks],
+            metadatas=[{"title": chunk.title, "page": chunk.page} for chunk in chunks],
+        )
+    except chromadb.APIError as e:
+        Logger.error(f"Error populating collection: {e}")
+        raise
 
-    character_splitter = RecursiveCharacterTextSplitter(
-        separators=SEPARATORS,
-        chunk_size=CHARACTER_SPLIT_CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-    )
 
-    token_splitter = SentenceTransformersTokenTextSplitter(
-        chunk_overlap=CHUNK_OVERLAP, tokens_per_chunk=TOKENS_PER_CHUNK
-    )
+async def write_chunks(
+    collection: Collection,
+    chunks: Iterable[Chunk] | AsyncIterable[Chunk],
+    embedding_function: SentenceTransformerEmbeddingFunction | None = None,
+    batch_size: int | None = None,
+    sparse_index: BM25Index | None = None,
+) -> int:
+    """Embeds and upserts chunks into a ChromaDB collection in fixed-size batches.
 
-    character_split_chunk_num = 0
-    token_split_chunk_num = 0
+    Embedding of batch N+1 overlaps with the Chroma write of batch N, and at most
+    two batches of embeddings are held in memory at any time. Each batch is also
+    added to the BM25 index, if one is given. Saving the index is up to the caller.
 
-    for entry in articles:
+    Args:
+        collection (Collection): The ChromaDB collection.
+        chunks (Iterable[Chunk] | AsyncIterable[Chunk]): The chunks to write.
+        embedding_function (SentenceTransformerEmbeddingFunction | None, optional): The embedding function.
+            Defaults to None, letting the collection embed each batch while writing it (no overlap).
+        batch_size (int | None, optional): The number of chunks per batch. Defaults to EMBEDDING_BATCH_SIZE.
+        sparse_index (BM25Index | None, optional): The BM25 index to add the chunks to. Defaults to None.
 
-        article = Article(**entry)
-        if not article.body:
-            Logger.warning(
-                f"Article '{article.title}' has no body text content. Skipping."
-            )
-            continue
+    Returns:
+        int: The number of chunks written.
 
-        character_split_texts = character_splitter.split_text(article.body)
-        character_split_chunk_num += len(character_split_texts)
-        chunks = []
-        for text in character_split_texts:
-            chunks += token_splitter.split_text(text)
+    Raises:
+        chromadb.APIError: If there is an error writing the chunks.
+    """
 
-        token_split_chunk_num += len(chunks)
+    if not batch_size:
+        batch_size = EMBEDDING_BATCH_SIZE
 
-        for chunk in chunks:
-            uid = str(uuid.uuid4())
-            ids.append(uid)
-            documents.append(chunk)
-            metadatas.append({"title": article.title})
+    written_num = 0
+    start = time.perf_counter()
+    write_task: asyncio.Task | None = None
+    writing_num = 0
 
     try:
-        collection.add(ids=ids, documents=documents, metadatas=metadatas)
-        Logger.info(
-            f"Added {len(ids)} document chunks to collection '{collection.name}'."
-        )
-        Logger.info(f"Character split chunks = {character_split_chunk_num}.")
-    except chromadb.APIError as e:
-        Logger.error(f"Error populating collection: {e}")
-        raise
+        async for batch in abatched(chunks, batch_size):
+            #* The batch is tokenized for BM25 in a worker thread too, while it is being embedded
+            analyze_task = None
+            if sparse_index is not None:
+                analyze_task = asyncio.create_task(asyncio.to_thread(analyze_chunks, batch))
+            embeddings = None
+            if embedding_function:
+                embeddings = await asyncio.to_thread(
+                    embedding_function, [chunk.document for chunk in batch]
+                )
+            if analyze_task:
+                sparse_index.add_analyzed(await analyze_task)
+            if write_task:
+                await write_task
+                written_num += writing_num
+                log_write_progress(written_num, start)
+            write_task = asyncio.create_task(
+                asyncio.to_thread(upsert_chunks, collection, batch, embeddings)
+            )
+            writing_num = len(batch)
+
+        if write_task:
+            await write_task
+            written_num += writing_num
+            log_write_progress(written_num, start)
+    finally:
+        if write_task and not write_task.done():
+            write_task.cancel()
+
+    return written_num
+
+
+def log_write_progress(written_num: int, start: float) -> None:
+    """Logs how many chunks have been written and the write throughput so far.
+
+    Args:
+        written_num (int): The number of chunks written so far.
+        start (float): The time.perf_counter() value when writing started.
+    """
+
+    elapsed = time.perf_counter() - start
+    throughput = written_num / elapsed if elapsed > 0 else 0.0
+    Logger.info(f"Embedded and stored {written_num} chunks ({throughput:.1f} chunks/s).")
+
+
+async def populate_collection(
+    collection: Collection,
+    filepaths: Iterable[Path],
+    embedding_function: SentenceTransformerEmbeddingFunction | None = None,
+    sparse_index: BM25Index | None = None,
+) -> int:
+    """Populates a ChromaDB collection with the articles of PDF files.
+
+    The files are chunked page by page in the extraction process pool, and the chunks
+    are embedded and written in batches by write_chunks as the workers make them. Chunks of
+    files that fail half way are deleted again. The BM25 index, if one is given, is built
+    alongside and saved once all chunks are written.
+
+    Args:
+        collection (Collection): The ChromaDB collection.
+        filepaths (Iterable[Path]): The paths of the PDF files to add to the collection.
+        embedding_function (SentenceTransformerEmbeddingFunction | None, optional): The embedding function.
+            Defaults to None, letting the collection embed the chunks.
+        sparse_index (BM25Index | None, optional): The BM25 index to build alongside. Defaults to None.
+
+    Returns:
+        int: The number of added chunks.
+
+    Raises:
+        chromadb.APIError: If there is an error populating the collection.
+    """
+
+    #* Chunks of articles that failed half way are written before the failure is known, and deleted after
+    failed_ids: List[str] = []
+    written_num = await write_chunks(
+        collection,
+        iter_chunks(filepaths, failed_ids),
+        embedding_function=embedding_function,
+        sparse_index=sparse_index,
+    )
+    if failed_ids:
+        collection.delete(ids=failed_ids)
+        if sparse_index is not None:
+            sparse_index.delete(failed_ids)
+    if sparse_index is not None:
+        await asyncio.to_thread(sparse_index.save)
+    added_num = written_num - len(failed_ids)
+    Logger.info(
+        f"Added {added_num} document chunks to collection '{collection.name}'."
+    )
+    return added_num
+
+
+async def iter_chunks(filepaths: Iterable[Path], failed_ids: List[str]) -> AsyncIterator[Chunk]:
+    """Chunks PDF files in the extraction process pool, yielding the chunks as they are made.
+
+    Args:
+        filepaths (Iterable[Path]): The paths of the PDF files.
+        failed_ids (List[str]): Receives the ids of the yielded chunks of articles that failed half way.
+
+    Yields:
+        Chunk: The chunks of every article.
+    """
+
+    article_ids: Dict[str, List[str]] = {}
+    async for batch in iter_pdf_chunks(filepaths):
+        chunk_ids = article_ids.setdefault(batch.article.source, [])
+        for chunk in batch.chunks:
+            chunk_ids.append(chunk.id)
+            yield chunk
+
+        if batch.last:
+            del article_ids[batch.article.source]
+            if batch.failed:
+                failed_ids.extend(chunk_ids)
+            elif not chunk_ids:
+                Logger.warning(
+                    f"Article '{batch.article.title}' has no body text content. Skipping."
+                )
+
+
+async def abatched(
+    items: Iterable[Any] | AsyncIterable[Any], batch_size: int
+) -> AsyncIterator[List[Any]]:
+    """Groups a synchronous or an asynchronous iterable into lists of batch_size items.
+
+    Args:
+        items (Iterable[Any] | AsyncIterable[Any]): The items.
+        batch_size (int): The maximum number of items per batch.
+
+    Yields:
+        List[Any]: The batches, the last one possibly shorter.
+    """
+
+    batch: List[Any] = []
+    async for item in aiterate(items):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
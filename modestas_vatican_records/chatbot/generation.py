@@ -0,0 +1,426 @@
+import asyncio
+import copy
+import time
+from typing import Any, AsyncIterator, Dict, List, Set
+
+import torch
+from transformers.generation.stopping_criteria import StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+
+from chatbot.config import GENERATION_MAX_BATCH_SIZE, GENERATION_MAX_WAIT_MS
+from chatbot.prefix_cache import PrefixCache, PromptPrefix
+from chatbot.utils.logging_config import configure_logging
+
+Logger = configure_logging()
+
+
+class GenerationRequest:
+    """A queued prompt waiting to be generated, and the future its caller awaits.
+
+    Streaming requests also get a queue receiving text deltas as they are generated,
+    then None once generation is done (or the exception if it failed). Requests with a
+    prefix can reuse its cached past key values.
+    """
+
+    def __init__(
+        self,
+        prompt: str,
+        max_new_tokens: int,
+        future: asyncio.Future,
+        stream: asyncio.Queue | None = None,
+        prefix: PromptPrefix | None = None,
+    ) -> None:
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.future = future
+        self.stream = stream
+        self.prefix = prefix
+
+
+class BatchTextStreamer(BaseStreamer):
+    """Streams the decoded text of every row of a batched generate call to its request.
+
+    model.generate calls put() from the generation thread, first with the prompt ids and
+    then with one new token per row. Text deltas are handed over to the event loop thread.
+    """
+
+    def __init__(
+        self,
+        tokenizer: Any,
+        requests: List[GenerationRequest],
+        stop_token_ids: Set[int],
+        loop: asyncio.AbstractEventLoop,
+    ) -> None:
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.stop_token_ids = stop_token_ids
+        self.loop = loop
+        self.token_ids: List[List[int]] = [[] for _ in requests]
+        self.sent_text_len = [0] * len(requests)
+        self.finished = [request.stream is None for request in requests]
+        self.prompt_skipped = False
+
+    def put(self, value: Any) -> None:
+        """Receives the next token of every row and streams the new text of each row."""
+
+        if not self.prompt_skipped:
+            self.prompt_skipped = True
+            return
+
+        for row, token_id in enumerate(value.reshape(len(self.requests), -1)[:, -1].tolist()):
+            if self.finished[row]:
+                continue
+            if token_id in self.stop_token_ids:
+                self.finished[row] = True
+                self._send(row, final=True)
+                continue
+            self.token_ids[row].append(token_id)
+            self._send(row, final=False)
+
+    def end(self) -> None:
+        """Flushes the remaining text of every unfinished row."""
+
+        for row in range(len(self.requests)):
+            if not self.finished[row]:
+                self.finished[row] = True
+                self._send(row, final=True)
+
+    def _send(self, row: int, final: bool) -> None:
+        """Hands the not yet streamed text of a row over to its request queue.
+
+        Args:
+            row (int): The batch row.
+            final (bool): Whether the row is finished. Otherwise text ending with an
+                incomplete multi-byte character is held back until the next token.
+        """
+
+        text = self.tokenizer.decode(self.token_ids[row], skip_special_tokens=True)
+        if not final and text.endswith("\ufffd"):
+            return
+        delta = text[self.sent_text_len[row]:]
+        if delta:
+            self.sent_text_len[row] = len(text)
+            self.loop.call_soon_threadsafe(self.requests[row].stream.put_nowait, delta)
+
+
+class CancelledRequestsCriteria(StoppingCriteria):
+    """Stops generating the rows of a batch whose requests were cancelled, e.g. abandoned streams."""
+
+    def __init__(self, requests: List[GenerationRequest]) -> None:
+        self.requests = requests
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs: Any) -> torch.BoolTensor:
+        """Returns which rows are done, i.e. whose requests were cancelled."""
+
+        return torch.tensor(
+            [request.future.cancelled() for request in self.requests], dtype=torch.bool, device=input_ids.device
+        )
+
+
+class GenerationScheduler:
+    """Queues concurrent generation requests and runs them as padded batches.
+
+    A single worker task owns the model: it takes the first waiting request, collects
+    more for up to max_wait_ms (or until max_batch_size is reached), and generates them
+    in one left-padded model.generate call in a worker thread. Each caller gets its own
+    response through a future, or token by token through a stream. As only one batch
+    runs at a time, concurrent users no longer contend for the CPU threads with separate
+    forward passes. A request generated alone reuses the cached past key values of its
+    prompt prefix instead, if a prefix cache is given.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        tokenizer: Any,
+        max_batch_size: int | None = None,
+        max_wait_ms: float | None = None,
+        prefix_cache: PrefixCache | None = None,
+    ) -> None:
+        """Initializes a GenerationScheduler instance.
+
+        Args:
+            model (Any): The causal language model.
+            tokenizer (Any): The model's tokenizer.
+            max_batch_size (int | None, optional): The maximum number of prompts per batch. Defaults to GENERATION_MAX_BATCH_SIZE.
+            max_wait_ms (float | None, optional): How long to wait for more prompts before generating. Defaults to GENERATION_MAX_WAIT_MS.
+            prefix_cache (PrefixCache | None, optional): The cache of prompt prefix past key values. Defaults to None, not caching.
+        """
+
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_cache = prefix_cache
+        self.max_batch_size = max_batch_size or GENERATION_MAX_BATCH_SIZE
+        self.max_wait_ms = GENERATION_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        """Starts the worker task on the running event loop, if it is not running yet.
+
+        Returns:
+            asyncio.Queue: The request queue of the worker.
+        """
+
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        return self._queue
+
+    async def submit(
+        self, prompt: str, max_new_tokens: int, prefix: PromptPrefix | None = None
+    ) -> str:
+        """Queues a prompt for generation and waits for its response.
+
+        Args:
+            prompt (str): The prompt, with the chat template already applied.
+            max_new_tokens (int): The maximum number of tokens to generate.
+            prefix (PromptPrefix | None, optional): The reusable prefix of the prompt. Defaults to None.
+
+        Returns:
+            str: The generated response.
+
+        Raises:
+            Exception: If there is an error during text generation.
+        """
+
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await queue.put(GenerationRequest(prompt, max_new_tokens, future, prefix=prefix))
+        return await future
+
+    async def stream(
+        self, prompt: str, max_new_tokens: int, prefix: PromptPrefix | None = None
+    ) -> AsyncIterator[str]:
+        """Queues a prompt for generation and yields its response text as it is generated.
+
+        Args:
+            prompt (str): The prompt, with the chat template already applied.
+            max_new_tokens (int): The maximum number of tokens to generate.
+            prefix (PromptPrefix | None, optional): The reusable prefix of the prompt. Defaults to None.
+
+        Yields:
+            str: The next piece of the generated response.
+
+        Raises:
+            Exception: If there is an error during text generation.
+        """
+
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        stream: asyncio.Queue = asyncio.Queue()
+        await queue.put(
+            GenerationRequest(prompt, max_new_tokens, future, stream=stream, prefix=prefix)
+        )
+        try:
+            while True:
+                delta = await stream.get()
+                if delta is None:
+                    return
+                if isinstance(delta, Exception):
+                    raise delta
+                yield delta
+        finally:
+            #* A stream abandoned by its consumer, e.g. on a client disconnect, is dropped from the queue
+            #* or stops generating, instead of running up to max_new_tokens for nobody
+            future.cancel()
+
+    async def _collect_batch(self) -> List[GenerationRequest]:
+        """Waits for a request, then collects more until the batch is full or max_wait_ms passes.
+
+        Returns:
+            List[GenerationRequest]: The collected requests.
+        """
+
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        """Worker loop generating collected batches, one at a time."""
+
+        while True:
+            batch = await self._collect_batch()
+
+            #* Requests can only share a generate call if they have the same token limit
+            groups: Dict[int, List[GenerationRequest]] = {}
+            for request in batch:
+                if not request.future.cancelled():
+                    groups.setdefault(request.max_new_tokens, []).append(request)
+
+            for max_new_tokens, requests in groups.items():
+                await self._generate(requests, max_new_tokens)
+
+    async def _generate(self, requests: List[GenerationRequest], max_new_tokens: int) -> None:
+        """Generates a batch of requests and resolves their futures.
+
+        Args:
+            requests (List[GenerationRequest]): The requests to generate.
+            max_new_tokens (int): The maximum number of tokens to generate.
+        """
+
+        streamer = None
+        if any(request.stream for request in requests):
+            streamer = BatchTextStreamer(
+                self.tokenizer, requests, self.stop_token_ids(), asyncio.get_running_loop()
+            )
+
+        stopping_criteria = StoppingCriteriaList([CancelledRequestsCriteria(requests)])
+
+        start = time.perf_counter()
+        try:
+            #* Cached prefixes can't be shared by left-padded rows of different lengths, so only lone requests reuse them
+            if self.prefix_cache and len(requests) == 1 and requests[0].prefix:
+                responses = await asyncio.to_thread(
+                    self.generate_with_prefix,
+                    requests[0].prompt,
+                    requests[0].prefix,
+                    max_new_tokens,
+                    streamer,
+                    stopping_criteria,
+                )
+            else:
+                responses = await asyncio.to_thread(
+                    self.generate_batch,
+                    [request.prompt for request in requests],
+                    max_new_tokens,
+                    streamer,
+                    stopping_criteria,
+                )
+        except Exception as e:
+            Logger.error(f"Error during text generation: {e}")
+            for request in requests:
+                if request.stream:
+                    #* The caller gets the exception through the stream, the future is only resolved
+                    request.stream.put_nowait(e)
+                    request.future.cancel()
+                elif not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        Logger.info(
+            f"Generated a batch of {len(requests)} prompts in {time.perf_counter() - start:.2f} s."
+        )
+        for request, response in zip(requests, responses):
+            if request.stream:
+                request.stream.put_nowait(None)
+            if not request.future.done():
+                request.future.set_result(response)
+
+    def stop_token_ids(self) -> Set[int]:
+        """Returns the token ids that end a generated sequence (EOS and padding).
+
+        Returns:
+            Set[int]: The stop token ids.
+        """
+
+        eos_token_id = self.model.generation_config.eos_token_id
+        if eos_token_id is None:
+            eos_token_id = self.tokenizer.eos_token_id
+        stop_token_ids = set(eos_token_id if isinstance(eos_token_id, list) else [eos_token_id])
+        if self.tokenizer.pad_token_id is not None:
+            stop_token_ids.add(self.tokenizer.pad_token_id)
+        return stop_token_ids
+
+    def generate_batch(
+        self,
+        prompts: List[str],
+        max_new_tokens: int,
+        streamer: BaseStreamer | None = None,
+        stopping_criteria: StoppingCriteriaList | None = None,
+    ) -> List[str]:
+        """Generates responses for a batch of prompts in a single left-padded generate call.
+
+        Args:
+            prompts (List[str]): The prompts, with the chat template already applied.
+            max_new_tokens (int): The maximum number of tokens to generate.
+            streamer (BaseStreamer | None, optional): Receives the tokens as they are generated. Defaults to None.
+            stopping_criteria (StoppingCriteriaList | None, optional): Ends the generation of rows early. Defaults to None.
+
+        Returns:
+            List[str]: The generated responses, in prompt order.
+        """
+
+        model_inputs = self.tokenizer(
+            prompts, return_tensors="pt", padding=True
+        ).to(self.model.device)
+        generated_ids = self.model.generate(
+            **model_inputs,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=self.tokenizer.pad_token_id,
+            streamer=streamer,
+            stopping_criteria=stopping_criteria,
+        )
+        #* Prompts are left-padded, so every response starts right after the padded prompt length
+        generated_ids = generated_ids[:, model_inputs.input_ids.shape[1]:]
+        return self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+
+    def generate_with_prefix(
+        self,
+        prompt: str,
+        prefix: PromptPrefix,
+        max_new_tokens: int,
+        streamer: BaseStreamer | None = None,
+        stopping_criteria: StoppingCriteriaList | None = None,
+    ) -> List[str]:
+        """Generates a response for a single prompt, pre-filling only the tokens after its cached prefix.
+
+        Afterwards the past key values of the system prompt and of the session's conversation
+        are cached, so the next turn of the session only pre-fills its new messages.
+
+        Args:
+            prompt (str): The prompt, with the chat template already applied.
+            prefix (PromptPrefix): The reusable prefix of the prompt.
+            max_new_tokens (int): The maximum number of tokens to generate.
+            streamer (BaseStreamer | None, optional): Receives the tokens as they are generated. Defaults to None.
+            stopping_criteria (StoppingCriteriaList | None, optional): Ends the generation of rows early. Defaults to None.
+
+        Returns:
+            List[str]: The generated response, as a single element list.
+        """
+
+        input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids[0]
+        past_key_values, cached_len = self.prefix_cache.lookup(prefix, input_ids)
+        Logger.info(f"Reusing {cached_len} cached prompt tokens, pre-filling {len(input_ids) - cached_len}.")
+
+        outputs = self.model.generate(
+            input_ids=input_ids.unsqueeze(0).to(self.model.device),
+            attention_mask=torch.ones(1, len(input_ids), dtype=torch.long, device=self.model.device),
+            past_key_values=past_key_values,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=self.tokenizer.pad_token_id,
+            streamer=streamer,
+            stopping_criteria=stopping_criteria,
+            return_dict_in_generate=True,
+        )
+
+        conversation_key, system_key = self.prefix_cache.keys(prefix)
+        cacheable = [] if system_key in self.prefix_cache else [(system_key, prefix.system_text)]
+        if conversation_key:
+            cacheable.append((conversation_key, prefix.conversation_text))
+        for i, (key, text) in enumerate(cacheable):
+            prefix_ids = self.tokenizer(text, return_tensors="pt").input_ids[0]
+            if len(prefix_ids) >= len(input_ids) or not torch.equal(input_ids[:len(prefix_ids)], prefix_ids):
+                continue
+            #* The longest prefix comes last and can take over the generation cache without a copy
+            prefix_past_key_values = outputs.past_key_values
+            if i < len(cacheable) - 1:
+                prefix_past_key_values = copy.deepcopy(prefix_past_key_values)
+            prefix_past_key_values.crop(len(prefix_ids))
+            self.prefix_cache.store(key, prefix_ids, prefix_past_key_values)
+
+        generated_ids = outputs.sequences[:, len(input_ids):]
+        return self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Set
+
+from chromadb.api.models import Collection
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+from chatbot.config import EMBEDDING_BACKEND, EMBEDDING_MODEL
+from chatbot.database import (
+    iter_pdf_chunks,
+    list_pdf_files,
+    write_chunks,
+)
+from chatbot.sparse_index import BM25Index, analyze_chunks
+from chatbot.utils.data_models import Chunk
+from chatbot.utils.logging_config import configure_logging
+
+Logger = configure_logging()
+
+#* Version 2 chunks with the token-aware chunker. As its chunks differ, older collections are re-ingested once
+MANIFEST_VERSION = 2
+
+
+def file_sha256(filepath: Path) -> str:
+    """Computes the SHA-256 digest of a file's contents.
+
+    Args:
+        filepath (Path): The path to the file.
+
+    Returns:
+        str: The hex digest of the file.
+    """
+
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def embedding_signature(embedding_model: str | None = None, embedding_backend: str | None = None) -> Dict[str, str]:
+    """Describes the model variant the chunks are embedded with.
+
+    Args:
+        embedding_model (str | None, optional): The embedding model. Defaults to EMBEDDING_MODEL.
+        embedding_backend (str | None, optional): The embedding inference backend. Defaults to EMBEDDING_BACKEND.
+
+    Returns:
+        Dict[str, str]: The embedding model and backend.
+    """
+
+    return {"model": embedding_model or EMBEDDING_MODEL, "backend": embedding_backend or EMBEDDING_BACKEND}
+
+
+def load_manifest(manifest_path: Path) -> Dict[str, Any]:
+    """Loads the ingestion manifest, or returns an empty one if it does not exist.
+
+    The manifest maps each ingested file name to its modification time,
+    content hash and the ids of the chunks it produced, and records the embedding model and backend.
+
+    Args:
+        manifest_path (Path): The path to the manifest JSON file.
+
+    Returns:
+        Dict[str, Any]: The manifest.
+    """
+
+    empty_manifest: Dict[str, Any] = {"version": MANIFEST_VERSION, "files": {}}
+    if not manifest_path.exists():
+        return empty_manifest
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (OSError, json.JSONDecodeError) as e:
+        Logger.warning(f"Ingestion manifest {manifest_path} is unreadable, rebuilding it: {e}")
+        return empty_manifest
+    if manifest.get("version") != MANIFEST_VERSION:
+        Logger.warning(f"Ingestion manifest {manifest_path} has an unknown version, rebuilding it.")
+        return empty_manifest
+    return manifest
+
+
+def save_manifest(manifest: Dict[str, Any], manifest_path: Path) -> None:
+    """Atomically writes the ingestion manifest to disk.
+
+    Args:
+        manifest (Dict[str, Any]): The manifest.
+        manifest_path (Path): The path to the manifest JSON file.
+    """
+
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_suffix(manifest_path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(manifest))
+    os.replace(tmp_path, manifest_path)
+
+
+def manifest_fingerprint(manifest_path: Path) -> str:
+    """Computes a fingerprint of the ingested file contents and the embedding recorded in the manifest.
+
+    The fingerprint changes whenever an article is added, changed or removed,
+    or the chunks are re-embedded by another model variant, so it identifies the version of the collection.
+
+    Args:
+        manifest_path (Path): The path to the manifest JSON file.
+
+    Returns:
+        str: The hex digest of the embedding, the ingested file names and content hashes.
+    """
+
+    manifest = load_manifest(manifest_path)
+    files = manifest["files"]
+    digest = hashlib.sha256()
+    digest.update(f"{json.dumps(manifest.get('embedding'), sort_keys=True)}\x00".encode("utf-8"))
+    for name in sorted(files):
+        digest.update(f"{name}\x00{files[name]['sha256']}\x00".encode("utf-8"))
+    return digest.hexdigest()
+
+
+async def rebuild_sparse_index(
+    collection: Collection, sparse_index: BM25Index, page_size: int = 1000
+) -> None:
+    """Rebuilds the BM25 index from the chunks stored in a ChromaDB collection.
+
+    Used when the index is missing or out of sync, e.g. after upgrading an existing collection.
+
+    Args:
+        collection (Collection): The ChromaDB collection.
+        sparse_index (BM25Index): The BM25 index to rebuild.
+        page_size (int, optional): The number of chunks read from the collection at a time. Defaults to 1000.
+    """
+
+    Logger.info(f"Rebuilding the BM25 index of collection '{collection.name}'.")
+    sparse_index.clear()
+    for offset in range(0, collection.count(), page_size):
+        page = await asyncio.to_thread(
+            collection.get, include=["documents", "metadatas"], limit=page_size, offset=offset
+        )
+        chunks = [
+            Chunk(
+                id=chunk_id,
+                document=document,
+                title=metadata.get("title", ""),
+                page=metadata.get("page", 0),
+            )
+            for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+        ]
+        sparse_index.add_analyzed(await asyncio.to_thread(analyze_chunks, chunks))
+
+
+def delete_chunks(collection: Collection, ids: List[str]) -> None:
+    """Deletes chunks from a ChromaDB collection by id.
+
+    Args:
+        collection (Collection): The ChromaDB collection.
+        ids (List[str]): The ids of the chunks to delete.
+    """
+
+    if ids:
+        collection.delete(ids=ids)
+
+
+async def sync_collection(
+    collection: Collection,
+    directory_path: Path,
+    manifest_path: Path,
+    embedding_function: SentenceTransformerEmbeddingFunction | None = None,
+    sparse_index: BM25Index | None = None,
+    embedding_model: str | None = None,
+    embedding_backend: str | None = None,
+) -> bool:
+    """Incrementally synchronizes a ChromaDB collection with the PDFs in a directory.
+
+    Only new or changed files are parsed and chunked page by page (in the extraction process pool),
+    and only chunks that are not already stored get embedded. Chunks of changed or
+    removed files that no longer exist are deleted. The BM25 index, if one is given,
+    receives the same changes and is saved along with the manifest.
+    If the chunks were embedded by another model or backend, the collection is re-ingested from scratch.
+
+    Args:
+        collection (Collection): The ChromaDB collection.
+        directory_path (Path): The path to the directory containing PDF files.
+        manifest_path (Path): The path to the ingestion manifest JSON file.
+        embedding_function (SentenceTransformerEmbeddingFunction | None, optional): The embedding function.
+            Defaults to None, letting the collection embed the chunks.
+        sparse_index (BM25Index | None, optional): The BM25 index kept in sync with the collection. Defaults to None.
+        embedding_model (str | None, optional): The model embedding the chunks. Defaults to EMBEDDING_MODEL.
+        embedding_backend (str | None, optional): The backend embedding the chunks. Defaults to EMBEDDING_BACKEND.
+
+    Returns:
+        bool: True if the collection was modified.
+
+    Raises:
+        FileNotFoundError: If the directory is not found.
+    """
+
+    pdf_paths = {filepath.name: filepath for filepath in list_pdf_files(directory_path)}
+    manifest = load_manifest(manifest_path)
+    files: Dict[str, Dict[str, Any]] = manifest["files"]
+    modified = False
+    embedding = embedding_signature(embedding_model, embedding_backend)
+
+    if files and manifest.get("embedding") != embedding:
+        #* Vectors of another model variant don't match the query embeddings, or even their dimension
+        Logger.warning(
+            f"Collection '{collection.name}' was embedded with {manifest.get('embedding')}, not {embedding}."
+            " Re-ingesting it from scratch."
+        )
+        delete_chunks(collection, collection.get(include=[])["ids"])
+        if sparse_index is not None:
+            sparse_index.clear()
+        files.clear()
+        modified = True
+    elif not files and collection.count() > 0:
+        #* Collections populated before the manifest existed have random uuid chunk ids
+        #* They can't be matched against files, so they are dropped once and re-ingested
+        Logger.warning(
+            f"Collection '{collection.name}' has no ingestion manifest. Re-ingesting it from scratch."
+        )
+        delete_chunks(collection, collection.get(include=[])["ids"])
+        if sparse_index is not None:
+            sparse_index.clear()
+        modified = True
+    elif files and collection.count() == 0:
+        Logger.warning("Collection is empty but the ingestion manifest is not. Resetting the manifest.")
+        files.clear()
+    manifest["embedding"] = embedding
+
+    for name in sorted(set(files) - set(pdf_paths)):
+        Logger.info(f"Removing chunks of deleted article {name}")
+        removed_ids = files.pop(name)["chunk_ids"]
+        delete_chunks(collection, removed_ids)
+        if sparse_index is not None:
+            sparse_index.delete(removed_ids)
+        save_manifest(manifest, manifest_path)
+        modified = True
+
+    changed_files: Dict[str, Dict[str, Any]] = {}
+    for name, filepath in pdf_paths.items():
+        mtime = filepath.stat().st_mtime
+        entry = files.get(name)
+        if entry and entry["mtime"] == mtime:
+            continue
+
+        sha256 = await asyncio.to_thread(file_sha256, filepath)
+        if entry and entry["sha256"] == sha256:
+            entry["mtime"] = mtime
+            continue
+
+        changed_files[name] = {"mtime": mtime, "sha256": sha256}
+
+    ingested_files: Dict[str, Dict[str, Any]] = {}
+    stale_ids: List[str] = []
+
+    async def iter_new_chunks() -> AsyncIterator[Chunk]:
+        changed_paths = [pdf_paths[name] for name in sorted(changed_files)]
+        #* The old and new chunk ids of the files being read, whose batches arrive interleaved
+        old_ids: Dict[str, Set[str]] = {}
+        new_ids: Dict[str, List[str]] = {}
+        async for batch in iter_pdf_chunks(changed_paths):
+            name = batch.article.source
+            if name not in old_ids:
+                old_ids[name] = set(files[name]["chunk_ids"]) if name in files else set()
+                new_ids[name] = []
+            new_ids[name].extend(chunk.id for chunk in batch.chunks)
+            for chunk in batch.chunks:
+                if chunk.id not in old_ids[name]:
+                    yield chunk
+            if not batch.last:
+                continue
+
+            file_old_ids = old_ids.pop(name)
+            file_chunk_ids = new_ids.pop(name)
+            file_new_ids = set(file_chunk_ids)
+            if batch.failed:
+                #* The chunks of a file that failed half way are dropped and its manifest entry is kept,
+                #* so the next run tries it again
+                stale_ids.extend(sorted(file_new_ids - file_old_ids))
+                continue
+            stale_ids.extend(sorted(file_old_ids - file_new_ids))
+            ingested_files[name] = {
+                **changed_files[name],
+                "chunk_ids": file_chunk_ids,
+            }
+            Logger.info(
+                f"Ingested {name}: {len(file_new_ids - file_old_ids)} chunks added, "
+                f"{len(file_old_ids - file_new_ids)} chunks to delete."
+            )
+
+    #* Chunk ids are content hashes and writes are upserts,
+    #* so if ingestion is interrupted before the manifest is saved, the next run simply redoes it
+    added_num = await write_chunks(
+        collection,
+        iter_new_chunks(),
+        embedding_function=embedding_function,
+        sparse_index=sparse_index,
+    )
+    delete_chunks(collection, stale_ids)
+    if sparse_index is not None:
+        sparse_index.delete(stale_ids)
+        if len(sparse_index) != collection.count():
+            await rebuild_sparse_index(collection, sparse_index)
+        await asyncio.to_thread(sparse_index.save)
+    files.update(ingested_files)
+    modified = modified or bool(ingested_files)
+    deleted_num = len(stale_ids)
+
+    save_manifest(manifest, manifest_path)
+    Logger.info(
+        f"Collection '{collection.name}' is in sync with {directory_path}: "
+        f"{added_num} chunks added, {deleted_num} chunks deleted, {collection.count()} chunks in total."
+    )
+    return modified
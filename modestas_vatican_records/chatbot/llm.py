@@ -1,9 +1,8 @@
-import asyncio
 from pathlib import Path
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List
 
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoTokenizer
 from huggingface_hub.errors import HFValidationError
 
 from chatbot.config import (
@@ -11,10 +10,17 @@ from chatbot.config import (
     GENERAL_SYSTEM_PROMPT,
     HF_CACHE_DIR,
     HF_LLM_MODEL_ID,
+    LLM_BACKEND,
     MAX_NEW_TOKENS,
+    PREFIX_CACHE_ENABLED,
     QUESTIONS_SYSTEM_PROMPT,
     RAG_SYSTEM_PROMPT,
 )
+from chatbot.backends import ONNX, load_causal_lm
+from chatbot.context import ContextBuilder
+from chatbot.generation import GenerationScheduler
+from chatbot.prefix_cache import PrefixCache, PromptPrefix
+from chatbot.tracing import tracer
 from chatbot.utils.logging_config import configure_logging
 
 Logger = configure_logging()
@@ -22,34 +28,48 @@ Logger = configure_logging()
 
 class LLM:
 
-    def __init__(self, pretrained_model_name_or_path: str | Path | None = None):
+    def __init__(
+        self,
+        pretrained_model_name_or_path: str | Path | None = None,
+        backend: str | None = None,
+    ):
         """Initializes an LLM instance.
 
         Args:
             pretrained_model_name_or_path (str | Path | None, optional): The path or name of the pretrained model. Defaults to None.
+            backend (str | None, optional): The inference backend, "torch", "int8" or "onnx". Defaults to LLM_BACKEND.
 
         Raises:
             OSError: If the model or tokenizer cannot be loaded.
+            ValueError: If the backend is not supported.
+            ImportError: If the backend's optional dependency is not installed.
         """
 
         if not pretrained_model_name_or_path:
             pretrained_model_name_or_path = HF_LLM_MODEL_ID
+        self.backend = backend or LLM_BACKEND
 
         Logger.info(
-            f"Loading model and tokenizer from {pretrained_model_name_or_path}"
+            f"Loading model and tokenizer from {pretrained_model_name_or_path} ({self.backend} backend)"
         )
         try:
-            self.model = AutoModelForCausalLM.from_pretrained(
-                pretrained_model_name_or_path, 
-                torch_dtype="auto", 
-                device_map="auto",
-                cache_dir=HF_CACHE_DIR
-            )
+            self.model = load_causal_lm(pretrained_model_name_or_path, self.backend)
             self.tokenizer = AutoTokenizer.from_pretrained(
                 pretrained_model_name_or_path,
-                cache_dir=HF_CACHE_DIR
+                cache_dir=HF_CACHE_DIR,
+                padding_side="left",
             )
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
             self.device: torch.device = self.model.device
+            self.context_builder = ContextBuilder(self.tokenizer)
+            #* ONNX Runtime models manage their own past key values, so prefixes are only cached for torch models
+            self.prefix_cache = (
+                PrefixCache() if PREFIX_CACHE_ENABLED and self.backend != ONNX else None
+            )
+            self.scheduler = GenerationScheduler(
+                self.model, self.tokenizer, prefix_cache=self.prefix_cache
+            )
             Logger.info(
                 f"Model and tokenizer loaded successfully from {pretrained_model_name_or_path}"
             )
@@ -58,13 +78,13 @@ class LLM:
             raise
 
 
-    async def chat(
+    def build_prompt(
         self,
         user_prompt: str,
         conversation_history: List[Dict[str, str]] | None = None,
         system_prompt: str | None = None,
     ) -> str:
-        """Generates a chat response using the language model.
+        """Applies the chat template to the system prompt, the conversation history and the user's prompt.
 
         Args:
             user_prompt (str): The user's prompt.
@@ -72,10 +92,7 @@ class LLM:
             system_prompt (str | None, optional): The system prompt. Defaults to None.
 
         Returns:
-            str: The generated chat response.
-
-        Raises:
-            Exception: If there is an error during text generation.
+            str: The prompt text to generate from.
         """
 
         if not conversation_history:
@@ -90,59 +107,228 @@ class LLM:
             {"role": "user", "content": user_prompt},
         ]
 
-        text = self.tokenizer.apply_chat_template(
+        return self.tokenizer.apply_chat_template(
             messages, tokenize=False, add_generation_prompt=True
         )
-        model_inputs = self.tokenizer([text], return_tensors="pt").to(self.model.device)
 
-        try:
-            generated_ids = await asyncio.to_thread(
-                self.model.generate, **model_inputs, max_new_tokens=MAX_NEW_TOKENS
-            )
-            generated_ids = [
-                output_ids[len(input_ids) :]
-                for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-            ]
-            response = self.tokenizer.batch_decode(
-                generated_ids, skip_special_tokens=True
-            )[0]
+    def build_prompt_prefix(
+        self,
+        conversation_history: List[Dict[str, str]] | None = None,
+        system_prompt: str | None = None,
+        session_id: str | None = None,
+    ) -> PromptPrefix:
+        """Renders the reusable beginning of a prompt: the system prompt and the conversation so far.
+
+        Args:
+            conversation_history (List[Dict[str, str]] | None, optional): The conversation history. Defaults to None.
+            system_prompt (str | None, optional): The system prompt. Defaults to None.
+            session_id (str | None, optional): The chat session the conversation belongs to. Defaults to None.
+
+        Returns:
+            PromptPrefix: The prompt prefix.
+        """
+
+        system_message = {"role": "system", "content": system_prompt or GENERAL_SYSTEM_PROMPT}
+        return PromptPrefix(
+            system_text=self.tokenizer.apply_chat_template([system_message], tokenize=False),
+            conversation_text=self.tokenizer.apply_chat_template(
+                [system_message, *(conversation_history or [])], tokenize=False
+            ),
+            session_id=session_id,
+        )
+
+    def release_session(self, session_id: str) -> None:
+        """Frees the cached conversation prefix of a chat session that ended.
+
+        Args:
+            session_id (str): The chat session.
+        """
+
+        if self.prefix_cache:
+            self.prefix_cache.release_session(session_id)
+
+    async def chat(
+        self,
+        user_prompt: str,
+        conversation_history: List[Dict[str, str]] | None = None,
+        system_prompt: str | None = None,
+        max_new_tokens: int | None = None,
+        session_id: str | None = None,
+    ) -> str:
+        """Generates a chat response using the language model.
+
+        The prompt is queued on the generation scheduler and generated together with
+        other concurrent chat calls.
+
+        Args:
+            user_prompt (str): The user's prompt.
+            conversation_history (List[Dict[str, str]] | None, optional): The conversation history. Defaults to None.
+            system_prompt (str | None, optional): The system prompt. Defaults to None.
+            max_new_tokens (int | None, optional): The maximum number of tokens to generate. Defaults to MAX_NEW_TOKENS.
+            session_id (str | None, optional): The chat session, whose prior turns are cached for its next turn. Defaults to None.
+
+        Returns:
+            str: The generated chat response.
+
+        Raises:
+            Exception: If there is an error during text generation.
+        """
+
+        text = self.build_prompt(user_prompt, conversation_history, system_prompt)
+        prefix = self.build_prompt_prefix(conversation_history, system_prompt, session_id)
+        with tracer.span("llm.chat", backend=self.backend) as span:
+            try:
+                response = await self.scheduler.submit(
+                    text, max_new_tokens=max_new_tokens or MAX_NEW_TOKENS, prefix=prefix
+                )
+            except Exception as e:
+                Logger.error(f"Error during text generation: {e}")
+                raise
+            if tracer.enabled:
+                span.set(prompt_tokens=self.count_tokens(text), completion_tokens=self.count_tokens(response))
             return response
-        except Exception as e:
-            Logger.error(f"Error during text generation: {e}")
-            raise
+
+    async def stream_chat(
+        self,
+        user_prompt: str,
+        conversation_history: List[Dict[str, str]] | None = None,
+        system_prompt: str | None = None,
+        max_new_tokens: int | None = None,
+        session_id: str | None = None,
+    ) -> AsyncIterator[str]:
+        """Generates a chat response using the language model, yielding it as it is generated.
+
+        Args:
+            user_prompt (str): The user's prompt.
+            conversation_history (List[Dict[str, str]] | None, optional): The conversation history. Defaults to None.
+            system_prompt (str | None, optional): The system prompt. Defaults to None.
+            max_new_tokens (int | None, optional): The maximum number of tokens to generate. Defaults to MAX_NEW_TOKENS.
+            session_id (str | None, optional): The chat session, whose prior turns are cached for its next turn. Defaults to None.
+
+        Yields:
+            str: The next piece of the generated chat response.
+
+        Raises:
+            Exception: If there is an error during text generation.
+        """
+
+        text = self.build_prompt(user_prompt, conversation_history, system_prompt)
+        prefix = self.build_prompt_prefix(conversation_history, system_prompt, session_id)
+        with tracer.span("llm.stream_chat", activate=False, backend=self.backend) as span:
+            deltas: List[str] = []
+            try:
+                async for delta in self.scheduler.stream(
+                    text, max_new_tokens=max_new_tokens or MAX_NEW_TOKENS, prefix=prefix
+                ):
+                    if not deltas:
+                        span.set(time_to_first_token_s=span.duration_s)
+                    deltas.append(delta)
+                    yield delta
+            except Exception as e:
+                Logger.error(f"Error during text generation: {e}")
+                raise
+            finally:
+                if tracer.enabled:
+                    span.set(
+                        prompt_tokens=self.count_tokens(text), completion_tokens=self.count_tokens("".join(deltas))
+                    )
+
+    def count_tokens(self, text: str) -> int:
+        """Counts the tokens of a text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            int: The number of tokens.
+        """
+
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    @staticmethod
+    def build_rag_prompt(query: str, documents: List[str]) -> str:
+        """Builds the RAG user prompt from the user's query and the relevant documents.
+
+        Args:
+            query (str): The user's query.
+            documents (List[str]): A list of relevant documents.
+
+        Returns:
+            str: The RAG user prompt.
+        """
+
+        context_information = "\\n\\n".join(documents)
+        return f"Question: {query}. \\n Information: {context_information}"
 
     async def rag(
         self,
         query: str,
         documents: List[str],
         conversation_history: List[Dict[str, str]] | None = None,
+        session_id: str | None = None,
     ) -> str:
         """Performs Retrieval Augmented Generation (RAG) to answer a query using provided documents.
 
         Args:
             query (str): The user's query.
-            documents (List[str]): A list of relevant documents.
+            documents (List[str]): A list of relevant documents, most relevant first.
             conversation_history (List[Dict[str, str]] | None, optional): The conversation history. Defaults to None.
+                The documents and the most recent turns that fit into RAG_CONTEXT_TOKEN_BUDGET are used.
+            session_id (str | None, optional): The chat session, whose prior turns are cached for its next turn. Defaults to None.
 
         Returns:
             str: The generated RAG response.
         """
 
-        context_information = "\\n\\n".join(documents)
-        user_prompt = f"Question: {query}. \\n Information: {context_information}"
+        user_prompt, conversation_history = self.context_builder.build(
+            query, documents, conversation_history, RAG_SYSTEM_PROMPT, self.build_rag_prompt
+        )
         return await self.chat(
             user_prompt=user_prompt,
             conversation_history=conversation_history,
             system_prompt=RAG_SYSTEM_PROMPT,
+            session_id=session_id,
+        )
+
+    async def stream_rag(
+        self,
+        query: str,
+        documents: List[str],
+        conversation_history: List[Dict[str, str]] | None = None,
+        session_id: str | None = None,
+    ) -> AsyncIterator[str]:
+        """Performs Retrieval Augmented Generation (RAG), yielding the answer as it is generated.
+
+        Args:
+            query (str): The user's query.
+            documents (List[str]): A list of relevant documents, most relevant first.
+            conversation_history (List[Dict[str, str]] | None, optional): The conversation history. Defaults to None.
+                The documents and the most recent turns that fit into RAG_CONTEXT_TOKEN_BUDGET are used.
+            session_id (str | None, optional): The chat session, whose prior turns are cached for its next turn. Defaults to None.
+
+        Yields:
+            str: The next piece of the generated RAG response.
+        """
+
+        user_prompt, conversation_history = self.context_builder.build(
+            query, documents, conversation_history, RAG_SYSTEM_PROMPT, self.build_rag_prompt
         )
+        async for delta in self.stream_chat(
+            user_prompt=user_prompt,
+            conversation_history=conversation_history,
+            system_prompt=RAG_SYSTEM_PROMPT,
+            session_id=session_id,
+        ):
+            yield delta
 
     async def expand_querry_question(
-        self, user_prompt: str
+        self, user_prompt: str, max_new_tokens: int | None = None
     ) -> List[str]:
         """Expands the user's query question by generating additional related questions.
 
         Args:
             user_prompt (str): The initial user prompt or query.
+            max_new_tokens (int | None, optional): The maximum number of tokens to generate. Defaults to MAX_NEW_TOKENS.
 
         Returns:
             List[str]: A list of strings, where the first element is the original `user_prompt` and
@@ -150,7 +336,9 @@ class LLM:
         """
 
         additional_prompt = await self.chat(
-            user_prompt=user_prompt, system_prompt=QUESTIONS_SYSTEM_PROMPT
+            user_prompt=user_prompt,
+            system_prompt=QUESTIONS_SYSTEM_PROMPT,
+            max_new_tokens=max_new_tokens,
         )
         return [user_prompt] + additional_prompt.split("\n")
     
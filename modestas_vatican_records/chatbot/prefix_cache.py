@@ -0,0 +1,175 @@
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Iterator, Tuple
+
+import torch
+
+from chatbot.config import PREFIX_CACHE_MAX_MB
+from chatbot.utils.logging_config import configure_logging
+
+Logger = configure_logging()
+
+
+class PromptPrefix:
+    """The reusable beginning of a chat prompt.
+
+    system_text is the rendered system prompt alone, shared by every session.
+    conversation_text is the rendered system prompt and the session's prior turns.
+    Both are string prefixes of the full prompt, as chat templates render message by message.
+    """
+
+    def __init__(self, system_text: str, conversation_text: str, session_id: str | None = None) -> None:
+        self.system_text = system_text
+        self.conversation_text = conversation_text
+        self.session_id = session_id
+
+
+def cache_tensors(past_key_values: Any) -> Iterator[torch.Tensor]:
+    """Yields the key and value tensors of a cache, layer by layer.
+
+    transformers >= 4.56 keeps them in cache layers (layers[i].keys / .values), earlier
+    versions, like the locked 4.49, in the key_cache and value_cache lists.
+
+    Args:
+        past_key_values (Any): The transformers DynamicCache.
+
+    Yields:
+        torch.Tensor: The key and value tensors of every filled layer.
+    """
+
+    layers = getattr(past_key_values, "layers", None)
+    if layers is not None:
+        for layer in layers:
+            if layer.keys is not None:
+                yield layer.keys
+                yield layer.values
+        return
+
+    for keys, values in zip(past_key_values.key_cache, past_key_values.value_cache):
+        #* Layers that were not filled yet hold empty lists or tensors
+        if isinstance(keys, torch.Tensor) and keys.numel():
+            yield keys
+            yield values
+
+
+def cache_nbytes(past_key_values: Any) -> int:
+    """Returns the memory taken by the key and value tensors of a cache.
+
+    Args:
+        past_key_values (Any): The transformers DynamicCache.
+
+    Returns:
+        int: The size in bytes.
+    """
+
+    return sum(tensor.nelement() * tensor.element_size() for tensor in cache_tensors(past_key_values))
+
+
+class PrefixCache:
+    """Keeps the past key values of prompt prefixes, so only new tokens need to be pre-filled.
+
+    There is one entry for every system prompt and one for every session's conversation
+    so far. Entries are evicted least recently used first, once their key and value
+    tensors exceed max_mb in total. Entries are used from the generation thread and
+    released from the event loop, so access is guarded by a lock.
+    """
+
+    def __init__(self, max_mb: float | None = None) -> None:
+        """Initializes an empty PrefixCache instance.
+
+        Args:
+            max_mb (float | None, optional): The memory budget in megabytes. Defaults to PREFIX_CACHE_MAX_MB.
+        """
+
+        self.max_bytes = int((max_mb or PREFIX_CACHE_MAX_MB) * 1024 * 1024)
+        self._entries: OrderedDict[Hashable, Tuple[torch.Tensor, Any, int]] = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def keys(prefix: PromptPrefix) -> Tuple[Hashable, Hashable]:
+        """Returns the cache keys of the session's conversation and of the system prompt.
+
+        Args:
+            prefix (PromptPrefix): The prompt prefix.
+
+        Returns:
+            Tuple[Hashable, Hashable]: The conversation key (None without a session) and the system prompt key.
+        """
+
+        conversation_key = ("session", prefix.session_id) if prefix.session_id else None
+        return conversation_key, ("system", prefix.system_text)
+
+    def lookup(self, prefix: PromptPrefix, input_ids: torch.Tensor) -> Tuple[Any, int]:
+        """Returns a copy of the longest cached prefix of the prompt.
+
+        Args:
+            prefix (PromptPrefix): The prompt prefix.
+            input_ids (torch.Tensor): The token ids of the whole prompt, of shape (sequence_length,).
+
+        Returns:
+            Tuple[Any, int]: A copy of the cached past key values, which generation may extend,
+                and the number of prompt tokens it covers. (None, 0) if nothing is cached.
+        """
+
+        with self._lock:
+            for key in self.keys(prefix):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                token_ids, past_key_values, _ = entry
+                #* A cached prefix is only reusable if the prompt still starts with it (and has new tokens after it)
+                if len(token_ids) < len(input_ids) and torch.equal(input_ids[:len(token_ids)], token_ids):
+                    self._entries.move_to_end(key)
+                    return copy.deepcopy(past_key_values), len(token_ids)
+        return None, 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether an entry is cached under the key."""
+
+        return key in self._entries
+
+    def store(self, key: Hashable, token_ids: torch.Tensor, past_key_values: Any) -> None:
+        """Stores the past key values of a prefix, evicting the least recently used entries if needed.
+
+        Args:
+            key (Hashable): The cache key.
+            token_ids (torch.Tensor): The token ids of the prefix.
+            past_key_values (Any): The past key values, already cropped to the prefix.
+        """
+
+        nbytes = cache_nbytes(past_key_values)
+        with self._lock:
+            self._remove(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (token_ids, past_key_values, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                evicted_key = next(iter(self._entries))
+                Logger.info(f"Evicting prefix cache entry of {evicted_key[0]}.")
+                self._remove(evicted_key)
+
+    def release_session(self, session_id: str) -> None:
+        """Drops the cached conversation of a session that ended.
+
+        Args:
+            session_id (str): The session id.
+        """
+
+        with self._lock:
+            self._remove(("session", session_id))
+
+    def _remove(self, key: Hashable) -> None:
+        """Removes an entry, if it exists. The caller holds the lock."""
+
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._nbytes -= entry[2]
+
+    @property
+    def nbytes(self) -> int:
+        """The memory taken by all cached entries, in bytes."""
+
+        return self._nbytes
@@ -0,0 +1,206 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+from chromadb.api.models import Collection
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+from chatbot.config import (
+    QUERY_EXPANSION_CACHE_SIZE,
+    QUERY_EXPANSION_MAX_NEW_TOKENS,
+    QUERY_EXPANSION_NEIGHBOURS,
+    QUERY_EXPANSION_STRATEGY,
+    QUERY_EXPANSION_TIMEOUT_S,
+)
+from chatbot.llm import LLM
+from chatbot.utils.logging_config import configure_logging
+
+Logger = configure_logging()
+
+NONE = "none"
+LLM_QUESTIONS = "llm"
+EMBEDDING_NEIGHBOURS = "embedding"
+STRATEGIES = (NONE, LLM_QUESTIONS, EMBEDDING_NEIGHBOURS)
+
+
+class QueryExpander:
+    """Turns a user's query into the query embeddings used for retrieval.
+
+    The strategy decides how the query is expanded:
+        - "none": only the query itself is used.
+        - "llm": the LLM suggests related questions, generated with a small token limit
+          and cached per query, so a repeated query does not generate again.
+        - "embedding": the query embedding is moved towards the centroid of its nearest
+          chunks (pseudo-relevance feedback), which needs no generation at all.
+
+    Every strategy has a latency budget. Once it is spent, retrieval proceeds with the
+    query alone. A timed out LLM expansion is cancelled, so it doesn't hold up the generation
+    of the answer on the shared generation scheduler.
+    """
+
+    def __init__(
+        self,
+        embedding_function: SentenceTransformerEmbeddingFunction,
+        collection: Collection,
+        llm: LLM | None = None,
+        strategy: str | None = None,
+        timeout_s: float | None = None,
+    ) -> None:
+        """Initializes a QueryExpander instance.
+
+        Args:
+            embedding_function (SentenceTransformerEmbeddingFunction): The embedding function of the collection.
+            collection (Collection): The ChromaDB collection.
+            llm (LLM | None, optional): The language model, required by the "llm" strategy. Defaults to None.
+            strategy (str | None, optional): "none", "llm" or "embedding". Defaults to QUERY_EXPANSION_STRATEGY.
+            timeout_s (float | None, optional): The latency budget of the expansion. Defaults to the
+                strategy's QUERY_EXPANSION_TIMEOUT_S entry.
+
+        Raises:
+            ValueError: If the strategy is unknown, or it is "llm" and no LLM is given.
+        """
+
+        self.strategy = strategy or QUERY_EXPANSION_STRATEGY
+        if self.strategy not in STRATEGIES:
+            raise ValueError(
+                f"Unknown query expansion strategy '{self.strategy}', expected one of {STRATEGIES}."
+            )
+        if self.strategy == LLM_QUESTIONS and llm is None:
+            raise ValueError("The 'llm' query expansion strategy requires an LLM.")
+
+        self.embedding_function = embedding_function
+        self.collection = collection
+        self.llm = llm
+        self.timeout_s = QUERY_EXPANSION_TIMEOUT_S[self.strategy] if timeout_s is None else timeout_s
+
+        self._questions: OrderedDict[str, List[str]] = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+
+    async def expand(self, query: str, query_embedding: List[float] | None = None) -> List[List[float]]:
+        """Returns the query embeddings to retrieve documents with.
+
+        Args:
+            query (str): The user's query.
+            query_embedding (List[float] | None, optional): The query's embedding, if it was already computed,
+                e.g. for the answer cache. Defaults to None, embedding the query.
+
+        Returns:
+            List[List[float]]: The query's own embedding first, then the expanded ones, if any.
+        """
+
+        if query_embedding is None:
+            query_embedding = (await asyncio.to_thread(self.embedding_function, [query]))[0]
+        if self.strategy == NONE:
+            return [query_embedding]
+
+        start = time.perf_counter()
+        try:
+            if self.strategy == LLM_QUESTIONS:
+                expanded = await asyncio.wait_for(self._expand_questions(query), self.timeout_s)
+            else:
+                expanded = await asyncio.wait_for(
+                    asyncio.to_thread(self._expand_neighbours, query_embedding), self.timeout_s
+                )
+        except asyncio.TimeoutError:
+            Logger.warning(
+                f"Query expansion '{self.strategy}' exceeded its {self.timeout_s} s budget,"
+                " retrieving with the original query only."
+            )
+            return [query_embedding]
+        except Exception as e:
+            Logger.error(f"Query expansion '{self.strategy}' failed, retrieving with the original query only: {e}")
+            return [query_embedding]
+
+        Logger.info(
+            f"Query expansion '{self.strategy}' added {len(expanded)} queries"
+            f" in {time.perf_counter() - start:.2f} s."
+        )
+        return [query_embedding, *expanded]
+
+    def clear(self) -> None:
+        """Forgets the cached related questions."""
+
+        self._questions.clear()
+
+    async def _expand_questions(self, query: str) -> List[List[float]]:
+        """Embeds the related questions the LLM suggests for a query.
+
+        Args:
+            query (str): The user's query.
+
+        Returns:
+            List[List[float]]: The embeddings of the related questions.
+        """
+
+        key = " ".join(query.lower().split())
+        questions = self._questions.get(key)
+        if questions is None:
+            task = self._pending.get(key)
+            if task is None:
+                task = asyncio.create_task(self._generate_questions(key, query))
+                self._pending[key] = task
+                self._waiters[key] = 0
+            self._waiters[key] += 1
+            try:
+                #* Shielded, so a request running out of budget doesn't cancel a generation others still wait for
+                questions = await asyncio.shield(task)
+            finally:
+                self._waiters[key] -= 1
+                if not self._waiters[key]:
+                    del self._waiters[key]
+                    del self._pending[key]
+                    #* Once no request waits for it, a generation left in the scheduler queue would only
+                    #* delay the answer generated next, so it is dropped
+                    task.cancel()
+        else:
+            self._questions.move_to_end(key)
+
+        if not questions:
+            return []
+        return await asyncio.to_thread(self.embedding_function, questions)
+
+    async def _generate_questions(self, key: str, query: str) -> List[str]:
+        """Generates related questions for a query and caches them.
+
+        Args:
+            key (str): The normalized query, used as the cache key.
+            query (str): The user's query.
+
+        Returns:
+            List[str]: The related questions.
+        """
+
+        response = await self.llm.expand_querry_question(
+            query, max_new_tokens=QUERY_EXPANSION_MAX_NEW_TOKENS
+        )
+        questions = [line.strip() for line in response[1:] if line.strip()]
+        self._questions[key] = questions
+        while len(self._questions) > QUERY_EXPANSION_CACHE_SIZE:
+            self._questions.popitem(last=False)
+        return questions
+
+    def _expand_neighbours(self, query_embedding: List[float]) -> List[List[float]]:
+        """Moves the query embedding towards the centroid of its nearest chunks.
+
+        Args:
+            query_embedding (List[float]): The embedding of the user's query.
+
+        Returns:
+            List[List[float]]: The expanded query embedding, or nothing if the collection is empty.
+        """
+
+        results = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=QUERY_EXPANSION_NEIGHBOURS,
+            include=["embeddings"],
+        )
+        neighbours = np.asarray(results["embeddings"][0], dtype=np.float32)
+        if neighbours.size == 0:
+            return []
+
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        expanded = query_vector / (np.linalg.norm(query_vector) or 1.0) + neighbours.mean(axis=0)
+        return [(expanded / (np.linalg.norm(expanded) or 1.0)).tolist()]
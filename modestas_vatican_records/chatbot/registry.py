@@ -0,0 +1,281 @@
+import asyncio
+import atexit
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict
+
+from chromadb.api.models import Collection
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+from chatbot.config import (
+    BM25_INDEX_PATH,
+    CHROMA_DB_PERSIST_DIR,
+    COLLECTION_NAME,
+    CROSS_ENCODER,
+    DATA_ARTICLES_PATH,
+    HF_LLM_MODEL_ID,
+    HYBRID_RETRIEVAL,
+    INCREMENTAL_INGESTION,
+    INGESTION_MANIFEST_PATH,
+    SEMANTIC_CACHE_ENABLED,
+    QUERY_EXPANSION_STRATEGY,
+    SEMANTIC_CACHE_PATH,
+)
+from chatbot.cache import SemanticAnswerCache
+from chatbot.database import (
+    create_chroma_client,
+    create_embedding_function,
+    get_or_create_collection,
+    list_pdf_files,
+    populate_collection,
+)
+from chatbot.ingestion import manifest_fingerprint, rebuild_sparse_index, sync_collection
+from chatbot.llm import LLM
+from chatbot.query_expansion import LLM_QUESTIONS, QueryExpander
+from chatbot.reranking import Reranker
+from chatbot.sparse_index import BM25Index
+from chatbot.utils.logging_config import configure_logging
+
+Logger = configure_logging()
+
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+PARTIAL = "partial"
+READY = "ready"
+FAILED = "failed"
+
+
+class ModelRegistry:
+    """Process-wide registry of the heavy chatbot resources.
+
+    Every resource is loaded lazily, exactly once, on first use and then shared by all chat sessions.
+    Concurrent first requests wait for the same load instead of starting their own.
+    """
+
+    RESOURCES = (
+        "embedding_function",
+        "sparse_index",
+        "collection",
+        "answer_cache",
+        "llm",
+        "query_expander",
+        "reranker",
+    )
+
+    def __init__(self) -> None:
+        """Initializes an empty ModelRegistry instance."""
+
+        self._resources: Dict[str, Any] = {}
+        self.collection_version: str | None = None
+        self._locks: Dict[str, asyncio.Lock] = {name: asyncio.Lock() for name in self.RESOURCES}
+        self._status: Dict[str, Dict[str, Any]] = {
+            name: {"status": NOT_LOADED} for name in self.RESOURCES
+        }
+
+    async def _get(self, name: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Returns a resource, loading it first if it is not loaded yet.
+
+        Args:
+            name (str): The resource name.
+            loader (Callable[[], Awaitable[Any]]): Coroutine function loading the resource.
+
+        Returns:
+            Any: The loaded resource.
+
+        Raises:
+            Exception: If loading fails. The next call retries loading.
+        """
+
+        if name in self._resources:
+            return self._resources[name]
+
+        async with self._locks[name]:
+            if name in self._resources:
+                return self._resources[name]
+
+            Logger.info(f"Loading shared resource '{name}'.")
+            self._status[name] = {"status": LOADING}
+            start = time.perf_counter()
+            try:
+                resource = await loader()
+            except Exception as e:
+                Logger.error(f"Failed to load shared resource '{name}': {e}")
+                self._status[name] = {"status": FAILED, "error": str(e)}
+                raise
+
+            self._resources[name] = resource
+            load_time = time.perf_counter() - start
+            self._status[name] = {"status": READY, "load_time_s": round(load_time, 2)}
+            Logger.info(f"Shared resource '{name}' loaded in {load_time:.2f} s.")
+            return resource
+
+    async def get_embedding_function(self) -> SentenceTransformerEmbeddingFunction:
+        """Returns the shared embedding function."""
+
+        return await self._get("embedding_function", create_embedding_function)
+
+    async def get_collection(self) -> Collection:
+        """Returns the shared ChromaDB collection, ingesting the articles on first load."""
+
+        return await self._get("collection", self._load_collection)
+
+    async def get_sparse_index(self) -> BM25Index | None:
+        """Returns the shared BM25 index, or None if hybrid retrieval is disabled.
+
+        The index is only in sync with the collection once get_collection() has returned.
+        """
+
+        return await self._get("sparse_index", self._load_sparse_index)
+
+    async def get_answer_cache(self) -> SemanticAnswerCache | None:
+        """Returns the shared semantic answer cache, or None if it is disabled."""
+
+        return await self._get("answer_cache", self._load_answer_cache)
+
+    async def get_llm(self) -> LLM:
+        """Returns the shared LLM instance."""
+
+        return await self._get("llm", lambda: asyncio.to_thread(LLM, HF_LLM_MODEL_ID))
+
+    async def get_query_expander(self) -> QueryExpander:
+        """Returns the shared QueryExpander instance."""
+
+        return await self._get("query_expander", self._load_query_expander)
+
+    async def get_reranker(self) -> Reranker:
+        """Returns the shared Reranker instance."""
+
+        return await self._get("reranker", lambda: asyncio.to_thread(Reranker, CROSS_ENCODER))
+
+    async def _load_collection(self) -> Collection:
+        """Opens the ChromaDB collection and brings it in sync with the articles directory.
+
+        Returns:
+            Collection: The ChromaDB collection.
+        """
+
+        client = await create_chroma_client(persist_directory=CHROMA_DB_PERSIST_DIR)
+        embedding_function = await self.get_embedding_function()
+        sparse_index = await self.get_sparse_index()
+        collection = await get_or_create_collection(
+            client=client,
+            collection_name=COLLECTION_NAME,
+            embedding_function=embedding_function,
+        )
+        if INCREMENTAL_INGESTION:
+            await sync_collection(
+                collection=collection,
+                directory_path=Path(DATA_ARTICLES_PATH),
+                manifest_path=Path(INGESTION_MANIFEST_PATH),
+                embedding_function=embedding_function,
+                sparse_index=sparse_index,
+            )
+            self.collection_version = manifest_fingerprint(Path(INGESTION_MANIFEST_PATH))
+        elif collection.count() == 0:
+            await populate_collection(
+                collection=collection,
+                filepaths=list_pdf_files(Path(DATA_ARTICLES_PATH)),
+                embedding_function=embedding_function,
+                sparse_index=sparse_index,
+            )
+        elif sparse_index is not None and len(sparse_index) != collection.count():
+            await rebuild_sparse_index(collection, sparse_index)
+            await asyncio.to_thread(sparse_index.save)
+        if self.collection_version is None:
+            #* Without a manifest the collection is only ever populated from scratch, so its size identifies it
+            self.collection_version = f"count:{collection.count()}"
+        return collection
+
+    async def _load_sparse_index(self) -> BM25Index | None:
+        """Loads the persisted BM25 index.
+
+        Returns:
+            BM25Index | None: The BM25 index, or None if hybrid retrieval is disabled.
+        """
+
+        if not HYBRID_RETRIEVAL:
+            return None
+        return await asyncio.to_thread(BM25Index, Path(BM25_INDEX_PATH))
+
+    async def _load_answer_cache(self) -> SemanticAnswerCache | None:
+        """Loads the persisted semantic answer cache of the current collection version.
+
+        Returns:
+            SemanticAnswerCache | None: The answer cache, or None if it is disabled.
+        """
+
+        if not SEMANTIC_CACHE_ENABLED:
+            return None
+        embedding_function = await self.get_embedding_function()
+        await self.get_collection()
+        answer_cache = await asyncio.to_thread(
+            SemanticAnswerCache,
+            embedding_function=embedding_function,
+            collection_version=self.collection_version,
+            path=Path(SEMANTIC_CACHE_PATH),
+        )
+        #* Answers stored since the last periodic save are written when the server exits
+        atexit.register(answer_cache.close)
+        return answer_cache
+
+    async def _load_query_expander(self) -> QueryExpander:
+        """Creates the query expander of the configured strategy.
+
+        Returns:
+            QueryExpander: The query expander.
+        """
+
+        return QueryExpander(
+            embedding_function=await self.get_embedding_function(),
+            collection=await self.get_collection(),
+            llm=await self.get_llm() if QUERY_EXPANSION_STRATEGY == LLM_QUESTIONS else None,
+        )
+
+    async def warm_up(self) -> None:
+        """Loads every resource that is not loaded yet.
+
+        Raises:
+            Exception: If any resource fails to load.
+        """
+
+        await asyncio.gather(
+            self.get_collection(),
+            self.get_answer_cache(),
+            self.get_llm(),
+            self.get_query_expander(),
+            self.get_reranker(),
+        )
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether every resource is loaded."""
+
+        return all(name in self._resources for name in self.RESOURCES)
+
+    def health(self) -> Dict[str, Any]:
+        """Reports the load status of every resource.
+
+        Returns:
+            Dict[str, Any]: The overall status ("ready", "loading", "partial", "failed" or "not_loaded")
+                and the status, load time or error of each resource.
+        """
+
+        statuses = {details["status"] for details in self._status.values()}
+        if statuses == {READY}:
+            status = READY
+        elif FAILED in statuses:
+            status = FAILED
+        elif LOADING in statuses:
+            status = LOADING
+        elif READY in statuses:
+            status = PARTIAL
+        else:
+            status = NOT_LOADED
+        return {
+            "status": status,
+            "resources": {name: dict(details) for name, details in self._status.items()},
+        }
+
+
+#* The single registry shared by every Chainlit chat session of this process
+registry = ModelRegistry()
@@ -1,30 +1,62 @@
-from typing import List
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import List, Tuple
 
 import numpy as np
 import torch
 from sentence_transformers import CrossEncoder
 
-from chatbot.config import CROSS_ENCODER, HF_CACHE_DIR, NUM_RETRIEVE_DOCUMENTS
+from chatbot.config import (
+    CROSS_ENCODER,
+    HF_CACHE_DIR,
+    NUM_RETRIEVE_DOCUMENTS,
+    RERANK_BATCH_SIZE,
+    RERANK_CACHE_SIZE,
+    RERANKER_BACKEND,
+)
+from chatbot.backends import ENCODER_BACKENDS, INT8, quantize_sentence_transformer, validate_backend
+from chatbot.tracing import current_span, tracer
+from chatbot.utils.data_models import RetrievedChunk
 from chatbot.utils.logging_config import configure_logging
 
 Logger = configure_logging()
 
 
 class Reranker:
-    def __init__(self, model_name: str | None = None):
+    def __init__(
+        self,
+        model_name: str | None = None,
+        batch_size: int | None = None,
+        cache_size: int | None = None,
+        backend: str | None = None,
+    ):
         """Initializes an Reranker instance.
 
         Args:
             model_name (str | None, optional): The name of the cross encoder model. Defaults to None.
+            batch_size (int | None, optional): The number of pairs scored per forward pass. Defaults to RERANK_BATCH_SIZE.
+            cache_size (int | None, optional): The maximum number of cached scores. Defaults to RERANK_CACHE_SIZE.
+            backend (str | None, optional): The inference backend, "torch" or "int8". Defaults to RERANKER_BACKEND.
 
         Raises:
             OSError: If the model or tokenizer cannot be loaded.
+            ValueError: If the backend is not supported.
         """
 
         if not model_name:
             model_name = CROSS_ENCODER
 
-        if torch.backends.mps.is_available():
+        self.batch_size = batch_size or RERANK_BATCH_SIZE
+        self.cache_size = cache_size or RERANK_CACHE_SIZE
+        #* LRU cache of (query hash, chunk id) -> score, as follow-up and repeated queries rerank the same chunks
+        self._scores: OrderedDict[Tuple[str, str], float] = OrderedDict()
+
+        self.backend = validate_backend(backend or RERANKER_BACKEND, ENCODER_BACKENDS)
+        if self.backend == INT8:
+            #* Dynamic int8 quantization only runs on the CPU
+            device = "cpu"
+        elif torch.backends.mps.is_available():
             device = "mps"
         elif torch.cuda.is_available():
             device = "cuda"
@@ -35,8 +67,10 @@ class Reranker:
             self.cross_encoder = CrossEncoder(
                 model_name=model_name, cache_dir=HF_CACHE_DIR, device=device
             )
+            if self.backend == INT8:
+                quantize_sentence_transformer(self.cross_encoder)
             Logger.info(
-                f"CrossEncoder loaded successfully from {model_name}"
+                f"CrossEncoder loaded successfully from {model_name} ({self.backend} backend)"
             )
         except (OSError, FileNotFoundError) as e:
             Logger.error(f"Error loading CrossEncoder model: {e}")
@@ -47,25 +81,136 @@ class Reranker:
         query: str,
         documents: List[str],
         num_retrieve_documents: int | None = None,
-    ) -> List[str]:
-        """Returns the most relevant documents to the query using CrossEncoder.
+        document_ids: List[str] | None = None,
+    ) -> Tuple[List[str], List[float]]:
+        """Returns the most relevant documents to the query using CrossEncoder, with their scores.
+
+        A wrapper of rerank_chunks for plain document texts.
 
         Args:
             query: str - The search query.
             documents: List[str]- A list of documents to rerank.
+            num_retrieve_documents: int | None - The number of documents to return. Defaults to NUM_RETRIEVE_DOCUMENTS.
+            document_ids: List[str] | None - The chunk ids of the documents, used as score cache keys.
+                Defaults to None, keying the scores by the document text.
+
+        Returns:
+            Tuple[List[str], List[float]] - The most relevant documents, limited by NUM_RETRIEVE_DOCUMENTS,
+                and their relevance scores in descending order.
+        """
+
+        if document_ids is None:
+            document_ids = [hash_text(document) for document in documents]
+        chunks = [
+            RetrievedChunk(id=document_id, score=0.0, title="", text=document)
+            for document_id, document in zip(document_ids, documents)
+        ]
+        top_chunks = await self.rerank_chunks(query, chunks, num_retrieve_documents)
+        return [chunk.text for chunk in top_chunks], [chunk.score for chunk in top_chunks]
+
+    async def rerank_chunks(
+        self,
+        query: str,
+        chunks: List[RetrievedChunk],
+        num_retrieve_documents: int | None = None,
+    ) -> List[RetrievedChunk]:
+        """Returns the retrieved chunks most relevant to the query, scored by the CrossEncoder.
+
+        Only the (query, chunk) pairs that are not cached yet are scored, in batches of
+        RERANK_BATCH_SIZE and in a worker thread, so the event loop is not blocked.
+
+        Args:
+            query: str - The search query.
+            chunks: List[RetrievedChunk] - The retrieved chunks to rerank.
+            num_retrieve_documents: int | None - The number of chunks to return. Defaults to NUM_RETRIEVE_DOCUMENTS.
+
+        Returns:
+            List[RetrievedChunk] - The most relevant chunks with their relevance scores, in descending order.
+        """
+
+        if not chunks:
+            return []
+        with tracer.span("rerank", candidates_retrieved=len(chunks)) as span:
+            scores = await self._score(query, [chunk.text for chunk in chunks], [chunk.id for chunk in chunks])
+            top_indices = self._top_k(scores, num_retrieve_documents)
+            span.set(candidates_reranked=len(top_indices))
+        return [chunks[i].model_copy(update={"score": float(scores[i])}) for i in top_indices]
+
+    def clear(self) -> None:
+        """Forgets the cached scores."""
+
+        self._scores.clear()
+
+    async def _score(self, query: str, documents: List[str], document_ids: List[str]) -> np.ndarray:
+        """Scores the (query, document) pairs, running the CrossEncoder on the uncached ones only.
+
+        Args:
+            query: str - The search query.
+            documents: List[str] - The documents to score.
+            document_ids: List[str] - The score cache keys of the documents.
+
+        Returns:
+            np.ndarray - The relevance score of every document.
+        """
+
+        query_hash = hash_text(query)
+        keys = [(query_hash, document_id) for document_id in document_ids]
+        scores = np.empty(len(documents), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            score = self._scores.get(key)
+            if score is None:
+                missing.append(i)
+            else:
+                self._scores.move_to_end(key)
+                scores[i] = score
+
+        if missing:
+            pairs = [[query, documents[i]] for i in missing]
+            missing_scores = await asyncio.to_thread(
+                self.cross_encoder.predict, pairs, batch_size=self.batch_size
+            )
+            for i, score in zip(missing, missing_scores):
+                scores[i] = score
+                self._scores[keys[i]] = float(score)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+        span = current_span()
+        if span:
+            span.set(cache_hits=len(documents) - len(missing), cache_misses=len(missing))
+        Logger.info(
+            f"Documents have been reranked by their relevance to the query "
+            f"({len(documents) - len(missing)} of {len(documents)} scores cached)."
+        )
+        return scores
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, num_retrieve_documents: int | None) -> np.ndarray:
+        """Returns the indices of the top k scores in descending order.
+
+        Args:
+            scores: np.ndarray - The scores.
+            num_retrieve_documents: int | None - k. Defaults to NUM_RETRIEVE_DOCUMENTS.
 
         Returns:
-            List[str] - A list of the most relevant documents, limited by NUM_RETRIEVE_DOCUMENTS.
+            np.ndarray - The indices of the top k scores.
         """
-        pairs = [[query, doc] for doc in documents]
-        scores = self.cross_encoder.predict(pairs)
 
-        # Get the indices of the documents sorted by score in descending order
-        sorted_indices = np.argsort(scores)[::-1]
+        #* Only the top k scores need ordering, so they are partitioned out first
+        k = min(num_retrieve_documents or NUM_RETRIEVE_DOCUMENTS, len(scores))
+        top_indices = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(k)
+        return top_indices[np.argsort(-scores[top_indices], kind="stable")]
+
+
+def hash_text(text: str) -> str:
+    """Hashes a text into a compact score cache key.
+
+    Args:
+        text (str): The text.
 
-        if not num_retrieve_documents:
-            num_retrieve_documents = NUM_RETRIEVE_DOCUMENTS
+    Returns:
+        str: The hex digest of the text.
+    """
 
-        top_indices = sorted_indices[:num_retrieve_documents]
-        Logger.info("Documents have been reranked by their relevance to the query.")
-        return [documents[i] for i in top_indices]
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
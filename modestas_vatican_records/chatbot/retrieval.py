@@ -0,0 +1,136 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+from chromadb.api.models import Collection
+
+from chatbot.config import (
+    BM25_NUM_RESULTS,
+    NUM_RETRIEVE_DOCUMENTS,
+    RETRIEVAL_NUM_CANDIDATES,
+    RRF_K,
+)
+from chatbot.sparse_index import BM25Index, reciprocal_rank_fusion
+from chatbot.utils.data_models import RetrievedChunk
+from chatbot.utils.filter_documents import deduplicate_chunks
+from chatbot.utils.logging_config import configure_logging
+
+Logger = configure_logging()
+
+
+async def retrieve(
+    query: str,
+    collection: Collection,
+    query_embeddings: List[Any] | None = None,
+    sparse_index: BM25Index | None = None,
+) -> List[RetrievedChunk]:
+    """Retrieves the candidate chunks for a query, fusing dense and BM25 results.
+
+    Every query embedding (the query and its expansions) produces a dense ranking, and the
+    BM25 index a sparse one for the query text. The rankings are fused with Reciprocal Rank
+    Fusion and the RETRIEVAL_NUM_CANDIDATES best chunks are returned.
+
+    Args:
+        query (str): The user's query.
+        collection (Collection): The ChromaDB collection.
+        query_embeddings (List[Any] | None, optional): The query embeddings to retrieve with.
+            Defaults to None, letting the collection embed the query.
+        sparse_index (BM25Index | None, optional): The BM25 index. Defaults to None, retrieving densely only.
+
+    Returns:
+        List[RetrievedChunk]: The unique candidate chunks, scored by their fused rank, best first.
+    """
+
+    candidates, rankings = await query_candidates(query, collection, query_embeddings, sparse_index)
+    return await fuse_candidates(candidates, rankings)
+
+
+async def query_candidates(
+    query: str,
+    collection: Collection,
+    query_embeddings: List[Any] | None = None,
+    sparse_index: BM25Index | None = None,
+) -> Tuple[List[RetrievedChunk], List[List[str]]]:
+    """Queries the collection with every query embedding and the BM25 index with the query text.
+
+    Args:
+        query (str): The user's query.
+        collection (Collection): The ChromaDB collection.
+        query_embeddings (List[Any] | None, optional): The query embeddings to retrieve with.
+            Defaults to None, letting the collection embed the query.
+        sparse_index (BM25Index | None, optional): The BM25 index. Defaults to None, retrieving densely only.
+
+    Returns:
+        Tuple[List[RetrievedChunk], List[List[str]]]: The retrieved chunks, once per ranking they appear in,
+            and the chunk id rankings, best first.
+    """
+
+    results = collection.query(
+        query_texts=None if query_embeddings else [query],
+        query_embeddings=query_embeddings,
+        n_results=NUM_RETRIEVE_DOCUMENTS,
+        include=["documents", "metadatas"]
+    )
+    rankings = list(results["ids"])
+    candidates = [
+        to_retrieved_chunk(chunk_id, document, metadata, 1 / (RRF_K + rank))
+        for ids, documents, metadatas in zip(results["ids"], results["documents"], results["metadatas"])
+        for rank, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas), start=1)
+    ]
+
+    if sparse_index is not None:
+        sparse_hits = await asyncio.to_thread(sparse_index.search, query, BM25_NUM_RESULTS)
+        sparse_ranking = [chunk_id for chunk_id, _ in sparse_hits]
+        dense_ids = {chunk.id for chunk in candidates}
+        missing_ids = [chunk_id for chunk_id in sparse_ranking if chunk_id not in dense_ids]
+        if missing_ids:
+            missing = collection.get(ids=missing_ids, include=["documents", "metadatas"])
+            ranks = {chunk_id: rank for rank, chunk_id in enumerate(sparse_ranking, start=1)}
+            candidates.extend(
+                to_retrieved_chunk(chunk_id, document, metadata, 1 / (RRF_K + ranks[chunk_id]))
+                for chunk_id, document, metadata in zip(missing["ids"], missing["documents"], missing["metadatas"])
+            )
+        Logger.info(
+            f"BM25 retrieved {len(sparse_ranking)} chunks, {len(missing_ids)} of them missed by dense retrieval."
+        )
+        rankings.append(sparse_ranking)
+
+    return candidates, rankings
+
+
+async def fuse_candidates(candidates: List[RetrievedChunk], rankings: List[List[str]]) -> List[RetrievedChunk]:
+    """Deduplicates the retrieved chunks and orders them by Reciprocal Rank Fusion of the rankings.
+
+    Args:
+        candidates (List[RetrievedChunk]): The retrieved chunks, once per ranking they appear in.
+        rankings (List[List[str]]): The chunk id rankings, best first.
+
+    Returns:
+        List[RetrievedChunk]: The RETRIEVAL_NUM_CANDIDATES best unique chunks, scored by their fused rank.
+    """
+
+    #* Chunks retrieved by several query embeddings are kept once, then scored by all the rankings they appear in
+    chunks = await deduplicate_chunks(candidates)
+    fused_scores = dict(reciprocal_rank_fusion(rankings, RRF_K))
+    for chunk in chunks:
+        chunk.score = fused_scores[chunk.id]
+    chunks.sort(key=lambda chunk: chunk.score, reverse=True)
+    return chunks[:RETRIEVAL_NUM_CANDIDATES]
+
+
+def to_retrieved_chunk(chunk_id: str, document: str, metadata: Dict[str, Any] | None, score: float) -> RetrievedChunk:
+    """Builds the compact record of a chunk returned by ChromaDB.
+
+    Args:
+        chunk_id (str): The chunk id.
+        document (str): The chunk text.
+        metadata (Dict[str, Any] | None): The chunk metadata.
+        score (float): The retrieval score.
+
+    Returns:
+        RetrievedChunk: The chunk record.
+    """
+
+    metadata = metadata or {}
+    return RetrievedChunk(
+        id=chunk_id, score=score, title=metadata.get("title", ""), text=document, page=metadata.get("page", 0)
+    )
@@ -1,31 +1,23 @@
-from pathlib import Path
-from typing import Dict, List, Tuple
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
 
 import chromadb
 from chromadb.api.models import Collection
-from chromadb.utils.embedding_functions import \
-    SentenceTransformerEmbeddingFunction
 
+from chatbot.cache import SemanticAnswerCache
 from chatbot.config import (
-    CHROMA_DB_PERSIST_DIR,
-    COLLECTION_NAME,
     CONVERSATION_HISTORY_LIMIT,
-    CROSS_ENCODER,
-    DATA_ARTICLES_PATH,
-    HF_LLM_MODEL_ID,
-    NUM_RETRIEVE_DOCUMENTS
-)
-from chatbot.database import (
-    create_chroma_client,
-    create_embedding_function,
-    get_or_create_collection,
-    load_articles,
-    populate_collection
+    RERANK_MIN_SCORE,
 )
 from chatbot.llm import LLM
+from chatbot.query_expansion import QueryExpander
+from chatbot.registry import registry
 from chatbot.reranking import Reranker
+from chatbot.retrieval import retrieve
+from chatbot.sparse_index import BM25Index
+from chatbot.tracing import tracer
+from chatbot.utils.data_models import RetrievedChunk
 from chatbot.utils.logging_config import configure_logging
-from chatbot.utils.filter_documents import deduplicate_documents
 
 Logger = configure_logging()
 
@@ -33,26 +25,42 @@ Logger = configure_logging()
 async def prepare_user_session() -> Tuple[chromadb.api.models.Collection, LLM, Reranker]:
     """Prepares the user session by loading resources and setting up the chatbot.
 
+    The resources are process-wide and shared by every session, so only the first
+    session of the process waits for them to load.
+
     Returns:
-        Tuple[chromadb.api.models.Collection, LLM]: A tuple containing the ChromaDB collection and the LLM instance.
+        Tuple[chromadb.api.models.Collection, LLM, Reranker]: A tuple containing the ChromaDB collection,
+            the LLM instance and the Reranker instance.
     """
 
-    client = await create_chroma_client(persist_directory=CHROMA_DB_PERSIST_DIR)
-    embedding_function: SentenceTransformerEmbeddingFunction = (
-        await create_embedding_function()
+    await registry.warm_up()
+    return (
+        await registry.get_collection(),
+        await registry.get_llm(),
+        await registry.get_reranker(),
     )
-    collection = await get_or_create_collection(
-        client=client,
-        collection_name=COLLECTION_NAME,
-        embedding_function=embedding_function,
-    )
-    if collection.count() == 0:
-        articles = await load_articles(Path(DATA_ARTICLES_PATH))
-        await populate_collection(collection=collection, articles=articles)
 
-    llm = LLM(HF_LLM_MODEL_ID)
-    reranker = Reranker(CROSS_ENCODER)
-    return collection, llm, reranker
+
+def cite_chunks(chunks: List[RetrievedChunk]) -> List[str]:
+    """Cites the documents of chunks with the pages the chunks come from.
+
+    Args:
+        chunks (List[RetrievedChunk]): The chunks, most relevant first.
+
+    Returns:
+        List[str]: One citation per document, e.g. "manual (p. 3, 12)", in order of first appearance.
+    """
+
+    pages: Dict[str, List[int]] = {}
+    for chunk in chunks:
+        if chunk.title:
+            pages.setdefault(chunk.title, [])
+            if chunk.page and chunk.page not in pages[chunk.title]:
+                pages[chunk.title].append(chunk.page)
+    return [
+        f"{title} (p. {', '.join(str(page) for page in sorted(title_pages))})" if title_pages else title
+        for title, title_pages in pages.items()
+    ]
 
 
 async def perform_rag(
@@ -61,6 +69,11 @@ async def perform_rag(
     conversation_history: List[Dict[str, str]],
     llm: LLM,
     reranker: Reranker,
+    on_token: Callable[[str], Awaitable[Any]] | None = None,
+    answer_cache: SemanticAnswerCache | None = None,
+    query_expander: QueryExpander | None = None,
+    session_id: str | None = None,
+    sparse_index: BM25Index | None = None,
 ) -> Tuple[str, List[str]]:
     """Performs RAG (Retrieval Augmented Generation) to answer a user's query.
 
@@ -69,47 +82,95 @@ async def perform_rag(
         collection (Collection): The ChromaDB collection.
         conversation_history (List[Dict[str, str]]): The conversation history.
         llm (LLM): The language model instance.
+        reranker (Reranker): The reranker instance.
+        on_token (Callable[[str], Awaitable[Any]] | None, optional): Called with every piece of the answer
+            as it is generated, e.g. cl.Message.stream_token. Defaults to None, waiting for the whole answer.
+        answer_cache (SemanticAnswerCache | None, optional): Answers standalone queries similar to earlier ones
+            without retrieval and generation. Defaults to None, not caching.
+        query_expander (QueryExpander | None, optional): Expands the query before retrieval.
+            Defaults to None, retrieving with the query only.
+        session_id (str | None, optional): The chat session, whose conversation prefix the LLM caches.
+            Defaults to None.
+        sparse_index (BM25Index | None, optional): The BM25 index fused with dense retrieval.
+            Defaults to None, retrieving densely only.
 
     Returns:
-        Tuple[str, List[str]]: A tuple containing the answer and a list of URLs of retrieved documents.
+        Tuple[str, List[str]]: A tuple containing the answer and the citations of the retrieved documents,
+            their titles with the cited pages.
     """
 
-    Logger.info("Fetching documents for RAG")
-    # Generate multiple query variations to improve retrieval
-    query_texts = [query]
-    expanded_query = await llm.expand_querry_question(query)
-    if expanded_query:
-        query_texts.extend(expanded_query)
-    
-    # Add query processing and caching
-    results = collection.query(
-        query_texts=query_texts,
-        n_results=NUM_RETRIEVE_DOCUMENTS,
-        include=["documents", "metadatas"]
-    )
-    
-    # Flatten and deduplicate documents from multiple queries
-    all_documents = [doc for sublist in results["documents"] for doc in sublist]
-    documents = await deduplicate_documents(all_documents)
-    
-    # Rerank documents for better relevance
-    documents = await reranker.rerank(query, documents)
-    
-    # Extract titles from metadata instead of URLs
-    titles = []
-    for metadatas_list in results["metadatas"]:
-        for metadata in metadatas_list:
-            if metadata.get("title") and metadata.get("title") not in titles:
-                titles.append(metadata.get("title"))
-
-    Logger.info(f"Performing RAG for query:\n{query}")
-    answer = await llm.rag(
-        query=query, documents=documents, conversation_history=conversation_history
-    )
-
-    llm_response = {"role": "assistant", "content": answer}
-    conversation_history.append(llm_response)
-    while len(conversation_history) > CONVERSATION_HISTORY_LIMIT:
-        conversation_history.pop(0)
-
-    return answer, titles
\ No newline at end of file
+    with tracer.span("perform_rag", session_id=session_id) as request_span:
+        #* The trace id of the request's spans identifies the request
+        request_span.set(request_id=request_span.trace_id)
+
+        #* Only the first question of a conversation is standalone, follow-ups depend on the earlier turns
+        query_embedding = None
+        if answer_cache and not any(message["role"] == "assistant" for message in conversation_history):
+            with tracer.span("answer_cache") as span:
+                query_embedding = await answer_cache.embed(query)
+                cached = answer_cache.lookup(query_embedding)
+                span.set(cache_hits=int(cached is not None), cache_misses=int(cached is None))
+            if cached:
+                answer, titles = cached
+                if on_token:
+                    await on_token(answer)
+                conversation_history.append({"role": "assistant", "content": answer})
+                request_span.set(answered_from_cache=True)
+                return answer, titles
+
+        Logger.info("Fetching documents for RAG")
+        # Expand the query within its latency budget to improve retrieval
+        with tracer.span("expansion") as span:
+            #* Reuses the embedding computed for the answer cache, if any
+            query_embeddings = [query_embedding] if query_embedding is not None else None
+            if query_expander:
+                query_embeddings = await query_expander.expand(query, query_embedding)
+            span.set(queries=len(query_embeddings) if query_embeddings else 1)
+
+        # Retrieve densely with every query embedding and sparsely with BM25, fusing the rankings
+        with tracer.span("retrieval", hybrid=sparse_index is not None) as span:
+            chunks = await retrieve(query, collection, query_embeddings, sparse_index)
+            span.set(candidates_retrieved=len(chunks))
+
+        # Rerank the chunks for better relevance
+        chunks = await reranker.rerank_chunks(query, chunks)
+        if RERANK_MIN_SCORE is not None:
+            chunks = [chunk for chunk in chunks if chunk.score >= RERANK_MIN_SCORE]
+        documents = [chunk.text for chunk in chunks]
+
+        # Cite the titles and pages of the selected chunks only
+        titles = cite_chunks(chunks)
+
+        Logger.info(f"Performing RAG for query:\n{query}")
+        if on_token:
+            start = time.perf_counter()
+            answer_parts: List[str] = []
+            async for token in llm.stream_rag(
+                query=query,
+                documents=documents,
+                conversation_history=conversation_history,
+                session_id=session_id,
+            ):
+                if not answer_parts:
+                    Logger.info(f"Time to first token: {time.perf_counter() - start:.2f} s")
+                answer_parts.append(token)
+                await on_token(token)
+            answer = "".join(answer_parts)
+        else:
+            answer = await llm.rag(
+                query=query,
+                documents=documents,
+                conversation_history=conversation_history,
+                session_id=session_id,
+            )
+
+        if query_embedding is not None and answer:
+            await answer_cache.store(query, query_embedding, answer, titles)
+
+        llm_response = {"role": "assistant", "content": answer}
+        conversation_history.append(llm_response)
+        while len(conversation_history) > CONVERSATION_HISTORY_LIMIT:
+            conversation_history.pop(0)
+
+        request_span.set(answered_from_cache=False, documents=len(documents))
+        return answer, titles
@@ -0,0 +1,210 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from chatbot.config import BM25_B, BM25_K1
+from chatbot.utils.data_models import Chunk
+from chatbot.utils.logging_config import configure_logging
+
+Logger = configure_logging()
+
+INDEX_VERSION = 1
+
+#* Keeps product names, versions and error codes like "wi-fi", "2.4" or "0x800704cf" as single terms
+TOKEN_PATTERN = re.compile(r"\w+(?:[-.]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits a text into lowercase BM25 terms.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        List[str]: The terms.
+    """
+
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def analyze_chunks(chunks: Iterable[Chunk]) -> List[Tuple[str, Counter]]:
+    """Tokenizes chunks into the term frequencies BM25Index.add_analyzed indexes.
+
+    Tokenizing is the costly part of indexing, so it can run in a worker thread.
+
+    Args:
+        chunks (Iterable[Chunk]): The chunks.
+
+    Returns:
+        List[Tuple[str, Counter]]: The chunk ids and the frequencies of their terms.
+    """
+
+    return [(chunk.id, Counter(tokenize(chunk.document))) for chunk in chunks]
+
+
+class BM25Index:
+    """A persistent BM25 inverted index over the chunks of the collection, keyed by chunk id.
+
+    It complements the dense embeddings with exact term matching, which serves product
+    names and error codes far better. It is maintained at ingestion time next to the
+    Chroma collection and persisted as JSON.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        """Initializes a BM25Index instance, loading it from disk if it exists.
+
+        Args:
+            path (Path | None, optional): The JSON file the index is persisted to. Defaults to None, not persisting.
+        """
+
+        self.path = path
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        #* Forward index of chunk id -> terms, so deleting a chunk only touches its own postings
+        self.chunk_terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+        if self.path and self.path.exists():
+            self._load()
+
+    def __len__(self) -> int:
+        """The number of indexed chunks."""
+
+        return len(self.doc_lengths)
+
+    def add(self, chunks: Iterable[Chunk]) -> None:
+        """Indexes chunks, replacing the ones already indexed under the same id.
+
+        Args:
+            chunks (Iterable[Chunk]): The chunks to index.
+        """
+
+        self.add_analyzed(analyze_chunks(chunks))
+
+    def add_analyzed(self, analyzed_chunks: Iterable[Tuple[str, Counter]]) -> None:
+        """Indexes chunks already tokenized by analyze_chunks, replacing the ones already indexed under the same id.
+
+        Args:
+            analyzed_chunks (Iterable[Tuple[str, Counter]]): The chunk ids and the frequencies of their terms.
+        """
+
+        for chunk_id, term_frequencies in analyzed_chunks:
+            if chunk_id in self.doc_lengths:
+                self.delete([chunk_id])
+            for term, frequency in term_frequencies.items():
+                self.postings.setdefault(term, {})[chunk_id] = frequency
+            self.chunk_terms[chunk_id] = list(term_frequencies)
+            length = sum(term_frequencies.values())
+            self.doc_lengths[chunk_id] = length
+            self.total_length += length
+
+    def delete(self, ids: Iterable[str]) -> None:
+        """Removes chunks from the index.
+
+        Args:
+            ids (Iterable[str]): The ids of the chunks to remove.
+        """
+
+        for chunk_id in ids:
+            if chunk_id not in self.doc_lengths:
+                continue
+            for term in self.chunk_terms.pop(chunk_id):
+                postings = self.postings[term]
+                del postings[chunk_id]
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= self.doc_lengths.pop(chunk_id)
+
+    def clear(self) -> None:
+        """Removes every chunk from the index."""
+
+        self.postings.clear()
+        self.doc_lengths.clear()
+        self.chunk_terms.clear()
+        self.total_length = 0
+
+    def search(self, query: str, n_results: int) -> List[Tuple[str, float]]:
+        """Returns the chunks scoring highest for the query.
+
+        Args:
+            query (str): The query.
+            n_results (int): The maximum number of results.
+
+        Returns:
+            List[Tuple[str, float]]: The chunk ids and their BM25 scores, best first.
+        """
+
+        if not self.doc_lengths:
+            return []
+        docs_num = len(self.doc_lengths)
+        avg_length = self.total_length / docs_num
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (docs_num - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                length_norm = 1 - BM25_B + BM25_B * self.doc_lengths[chunk_id] / avg_length
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (
+                    frequency + BM25_K1 * length_norm
+                )
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+
+    def save(self) -> None:
+        """Atomically writes the index to its JSON file, if it has one."""
+
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps({
+            "version": INDEX_VERSION,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }))
+        os.replace(tmp_path, self.path)
+
+    def _load(self) -> None:
+        """Loads the index from its JSON file, or leaves it empty if the file is unusable."""
+
+        try:
+            index = json.loads(self.path.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            Logger.warning(f"BM25 index {self.path} is unreadable, rebuilding it: {e}")
+            return
+        if index.get("version") != INDEX_VERSION:
+            Logger.warning(f"BM25 index {self.path} has an unknown version, rebuilding it.")
+            return
+        self.doc_lengths = index["doc_lengths"]
+        self.postings = index["postings"]
+        self.total_length = sum(self.doc_lengths.values())
+        self.chunk_terms = {chunk_id: [] for chunk_id in self.doc_lengths}
+        for term, postings in self.postings.items():
+            for chunk_id in postings:
+                self.chunk_terms[chunk_id].append(term)
+        Logger.info(f"Loaded BM25 index of {len(self)} chunks from {self.path}.")
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int) -> List[Tuple[str, float]]:
+    """Fuses rankings of ids with Reciprocal Rank Fusion.
+
+    Every ranking adds 1 / (k + rank) to the score of each id it contains, so ids ranked
+    well by several retrievers come first, without having to calibrate their scores.
+
+    Args:
+        rankings (List[List[str]]): The rankings, best first.
+        k (int): Dampens the advantage of the very top ranks.
+
+    Returns:
+        List[Tuple[str, float]]: The fused ids and scores, best first.
+    """
+
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
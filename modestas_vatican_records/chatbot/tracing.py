@@ -0,0 +1,243 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Tuple
+
+from chatbot.config import TRACING_DURATION_BUCKETS_S, TRACING_ENABLED, TRACING_MAX_SPANS
+
+SERVICE_NAME = "vatican-records-chatbot"
+
+#* Numeric span attributes that are also summed into Prometheus counters, labelled by stage
+COUNTERS = {
+    "prompt_tokens": ("chatbot_prompt_tokens_total", "Prompt tokens sent to the LLM."),
+    "completion_tokens": ("chatbot_completion_tokens_total", "Tokens generated by the LLM."),
+    "cache_hits": ("chatbot_cache_hits_total", "Cache hits of the answer and rerank caches."),
+    "cache_misses": ("chatbot_cache_misses_total", "Cache misses of the answer and rerank caches."),
+    "candidates_retrieved": ("chatbot_candidates_retrieved_total", "Chunks retrieved for reranking."),
+    "candidates_reranked": ("chatbot_candidates_reranked_total", "Chunks kept after reranking."),
+}
+
+
+class Span:
+    """A timed stage of a request, with attributes such as token counts and cache hits.
+
+    Spans of the same request share its trace id, which serves as the request id.
+    """
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.error: str | None = None
+
+    def set(self, **attributes: Any) -> None:
+        """Sets attributes of the span."""
+
+        self.attributes.update(attributes)
+
+    @property
+    def duration_s(self) -> float:
+        """The duration of the span in seconds, so far if it has not ended."""
+
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Span | None:
+    """Returns the span of the stage being run, if any."""
+
+    return _current_span.get()
+
+
+class Tracer:
+    """Records the spans of chatbot requests and aggregates them into metrics.
+
+    The most recent spans are kept in memory and exported as OpenTelemetry (OTLP/JSON)
+    traces, and every finished span updates a duration histogram and the counters of
+    its stage, exported in the Prometheus text format. Spans finish on the event loop
+    and in worker threads, so the records are guarded by a lock.
+    """
+
+    def __init__(
+        self,
+        enabled: bool | None = None,
+        max_spans: int | None = None,
+        duration_buckets_s: Tuple[float, ...] | None = None,
+    ) -> None:
+        """Initializes a Tracer instance.
+
+        Args:
+            enabled (bool | None, optional): Whether spans are recorded. Defaults to TRACING_ENABLED.
+            max_spans (int | None, optional): The number of recent spans kept for export. Defaults to TRACING_MAX_SPANS.
+            duration_buckets_s (Tuple[float, ...] | None, optional): The upper bounds of the duration histogram buckets.
+                Defaults to TRACING_DURATION_BUCKETS_S.
+        """
+
+        self.enabled = TRACING_ENABLED if enabled is None else enabled
+        self.duration_buckets_s = duration_buckets_s or TRACING_DURATION_BUCKETS_S
+        self._spans: Deque[Span] = deque(maxlen=max_spans or TRACING_MAX_SPANS)
+        self._durations: Dict[str, List[float]] = {}
+        self._errors: Dict[str, int] = {}
+        self._counters: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, activate: bool = True, **attributes: Any) -> Iterator[Span]:
+        """Times a stage of the current request, nested in the stage that is running.
+
+        A span started outside of any other one begins a new request.
+
+        Args:
+            name (str): The stage name.
+            activate (bool, optional): Whether the span becomes the parent of the spans started within it.
+                Async generators pass False, as they are suspended with the span open. Defaults to True.
+            **attributes (Any): The initial attributes of the span.
+
+        Yields:
+            Span: The span, for setting attributes known only once the stage has run.
+        """
+
+        parent = _current_span.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+        token = _current_span.set(span) if activate else None
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            if token is not None:
+                _current_span.reset(token)
+            if self.enabled:
+                self._record(span)
+
+    def _record(self, span: Span) -> None:
+        """Keeps a finished span and adds it to the metrics of its stage."""
+
+        with self._lock:
+            self._spans.append(span)
+            buckets = self._durations.setdefault(span.name, [0] * (len(self.duration_buckets_s) + 2))
+            for i, upper_bound in enumerate(self.duration_buckets_s):
+                if span.duration_s <= upper_bound:
+                    buckets[i] += 1
+            #* The last two slots hold the total count (the +Inf bucket) and the sum of the durations
+            buckets[-2] += 1
+            buckets[-1] += span.duration_s
+            if span.error:
+                self._errors[span.name] = self._errors.get(span.name, 0) + 1
+            for attribute in COUNTERS.keys() & span.attributes.keys():
+                key = (attribute, span.name)
+                self._counters[key] = self._counters.get(key, 0) + span.attributes[attribute]
+
+    def export_otlp_json(self) -> Dict[str, Any]:
+        """Exports the recent spans as an OpenTelemetry OTLP/JSON trace export request.
+
+        Returns:
+            Dict[str, Any]: The export request, which OTLP/HTTP collectors accept on /v1/traces.
+        """
+
+        with self._lock:
+            spans = list(self._spans)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                            "name": span.name,
+                            "kind": 1,
+                            "startTimeUnixNano": str(span.start_ns),
+                            "endTimeUnixNano": str(span.end_ns),
+                            "attributes": [
+                                otlp_attribute(key, value) for key, value in span.attributes.items() if value is not None
+                            ],
+                            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                        }
+                        for span in spans
+                    ],
+                }],
+            }]
+        }
+
+    def render_prometheus(self) -> str:
+        """Renders the stage metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+
+        with self._lock:
+            durations = {stage: list(buckets) for stage, buckets in self._durations.items()}
+            errors = dict(self._errors)
+            counters = dict(self._counters)
+
+        lines = [
+            "# HELP chatbot_stage_duration_seconds Duration of the chatbot request stages.",
+            "# TYPE chatbot_stage_duration_seconds histogram",
+        ]
+        for stage, buckets in sorted(durations.items()):
+            for upper_bound, count in zip(self.duration_buckets_s, buckets):
+                lines.append(f'chatbot_stage_duration_seconds_bucket{{stage="{stage}",le="{upper_bound}"}} {count}')
+            lines.append(f'chatbot_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {buckets[-2]}')
+            lines.append(f'chatbot_stage_duration_seconds_sum{{stage="{stage}"}} {buckets[-1]}')
+            lines.append(f'chatbot_stage_duration_seconds_count{{stage="{stage}"}} {buckets[-2]}')
+
+        lines += [
+            "# HELP chatbot_stage_errors_total Chatbot request stages that raised an error.",
+            "# TYPE chatbot_stage_errors_total counter",
+        ]
+        lines += [f'chatbot_stage_errors_total{{stage="{stage}"}} {count}' for stage, count in sorted(errors.items())]
+
+        for attribute, (metric, description) in COUNTERS.items():
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+            lines += [
+                f'{metric}{{stage="{stage}"}} {value}'
+                for (counted_attribute, stage), value in sorted(counters.items())
+                if counted_attribute == attribute
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """Converts a span attribute to an OTLP/JSON key-value.
+
+    Args:
+        key (str): The attribute name.
+        value (Any): The attribute value.
+
+    Returns:
+        Dict[str, Any]: The OTLP/JSON attribute.
+    """
+
+    if isinstance(value, bool):
+        typed_value = {"boolValue": value}
+    elif isinstance(value, int):
+        #* OTLP/JSON encodes 64 bit integers as strings
+        typed_value = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed_value = {"doubleValue": value}
+    else:
+        typed_value = {"stringValue": str(value)}
+    return {"key": key, "value": typed_value}
+
+
+tracer = Tracer()
@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel
 
 
@@ -5,4 +7,39 @@ class Article(BaseModel):
     """PDF articles"""
 
     title: str
-    body: str
+    source: str = ""
+    pages: List[str] = []
+
+    @property
+    def body(self) -> str:
+        """The whole article text, pages joined the same way they used to be concatenated."""
+        return ".\n".join(self.pages)
+
+
+class Chunk(BaseModel):
+    """A single article chunk as stored in the Chroma collection"""
+
+    id: str
+    document: str
+    title: str
+    page: int
+
+
+class ChunkBatch(BaseModel):
+    """A batch of an article's chunks, streamed from a PDF extraction worker as the article is read"""
+
+    article: Article
+    chunks: List[Chunk] = []
+    #* The article's last batch. A failed article is incomplete, its earlier batches should be dropped
+    last: bool = False
+    failed: bool = False
+
+
+class RetrievedChunk(BaseModel):
+    """A compact record of a chunk carried through retrieval, reranking and citation"""
+
+    id: str
+    score: float
+    title: str
+    text: str
+    page: int = 0
@@ -1,27 +1,23 @@
-from typing import List
+from typing import Dict, List
 
-async def deduplicate_documents(documents: List[str]) -> List[str]:
-    """Deduplicates a list of strings.
+from chatbot.utils.data_models import RetrievedChunk
+
+
+async def deduplicate_chunks(chunks: List[RetrievedChunk]) -> List[RetrievedChunk]:
+    """Deduplicates retrieved chunks by id, keeping the best score of each.
 
     Args:
-        documents: A list of strings representing documents.
+        chunks: A list of retrieved chunks, possibly retrieved more than once.
 
     Returns:
-        A list of unique strings representing deduplicated documents.
+        A list of unique chunks, in the order they were first retrieved.
 
     """
-    unique_documents = set()
-    
-    # Handle both nested and flat document structures
-    if documents and isinstance(documents, list):
-        if documents and isinstance(documents[0], list):
-            # Nested structure [[doc1, doc2], [doc3, doc4]]
-            for documents_batch in documents:
-                for document in documents_batch:
-                    unique_documents.add(document)
-        else:
-            # Flat structure [doc1, doc2, doc3]
-            for document in documents:
-                unique_documents.add(document)
+    unique_chunks: Dict[str, RetrievedChunk] = {}
+    for chunk in chunks:
+        best = unique_chunks.get(chunk.id)
+        if best is None or chunk.score > best.score:
+            # Dicts keep the position of the first insertion when a key is overwritten
+            unique_chunks[chunk.id] = chunk
 
-    return list(unique_documents)
\ No newline at end of file
+    return list(unique_chunks.values())
@@ -0,0 +1,72 @@
+from pathlib import Path
+from typing import Any, Callable, Generator, Iterator
+
+import pypdf
+
+from chatbot.utils.text_utils import preprocess_text
+
+#* This module is imported by the PDF extraction worker processes
+#* Keep it free of heavy imports (chromadb, torch, langchain) so workers start quickly
+
+#* Events a worker sends about its file: an item it yielded, its return value once it is done, or its error
+RESULT = "result"
+DONE = "done"
+FAILED = "failed"
+
+#* The queue every worker of the pool streams its events through, set by the pool initializer
+result_queue: Any = None
+
+
+def iter_pdf_pages(filepath: Path) -> Iterator[str]:
+    """Reads and preprocesses the text of a PDF file one page at a time.
+
+    Only the page being read is held in memory, so the pages can be chunked
+    as they are read instead of after the whole document is extracted.
+
+    Args:
+        filepath (Path): The path to the PDF file.
+
+    Yields:
+        str: The preprocessed text of each page, in page order, empty for pages without text.
+    """
+
+    with open(filepath, "rb") as f:
+        reader = pypdf.PdfReader(f)
+        for page in reader.pages:
+            yield preprocess_text(page.extract_text())
+
+
+def set_result_queue(queue: Any) -> None:
+    """Sets the queue the worker process streams its results through. Runs once in every worker process.
+
+    Args:
+        queue (Any): The multiprocessing queue.
+    """
+
+    global result_queue
+    result_queue = queue
+
+
+def stream_pdf_results(worker: Callable[[str], Generator[Any, None, Any]], filepath: str) -> None:
+    """Runs a generator worker on a PDF file, sending every item it yields as soon as it is yielded.
+
+    Runs inside a worker process. Every event is a (filepath, event, payload) tuple: (RESULT, item)
+    for every item, then (DONE, the worker's return value) or (FAILED, the error message).
+    The queue is bounded, so a worker that gets ahead of the consumer waits for it.
+
+    Args:
+        worker (Callable[[str], Generator[Any, None, Any]]): The generator function processing the PDF file at a path.
+        filepath (str): The path to the PDF file.
+    """
+
+    try:
+        items = worker(filepath)
+        while True:
+            try:
+                item = next(items)
+            except StopIteration as stop:
+                result_queue.put((filepath, DONE, stop.value))
+                return
+            result_queue.put((filepath, RESULT, item))
+    except Exception as e:
+        result_queue.put((filepath, FAILED, str(e)))
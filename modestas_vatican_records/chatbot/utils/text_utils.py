@@ -1,6 +1,8 @@
 import re
 from typing import Dict, List
 
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
 
 def preprocess_text(text: str) -> str:
     """Preprocesses text by lowercasing and removing extra whitespace.
@@ -12,9 +14,8 @@ def preprocess_text(text: str) -> str:
         str: The preprocessed text.
     """
 
-    text = text.lower()
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    #* Whitespace is collapsed first, so only the shorter string is lowercased
+    return WHITESPACE_PATTERN.sub(" ", text).strip().lower()
 
 
 async def form_missing_fields_msg(
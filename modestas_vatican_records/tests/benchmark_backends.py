@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import gc
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import torch
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+from transformers import AutoTokenizer
+
+from chatbot.backends import ENCODER_BACKENDS, LLM_BACKENDS, TORCH, load_causal_lm
+from chatbot.config import HF_CACHE_DIR, HF_LLM_MODEL_ID, NUM_RETRIEVE_DOCUMENTS, RAG_SYSTEM_PROMPT
+from chatbot.database import create_embedding_function
+from chatbot.registry import registry
+from chatbot.reranking import Reranker
+from tests.benchmark_queries import QUERIES
+
+NUM_CANDIDATES = 25
+
+
+def rank_correlation(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """Computes the Spearman rank correlation of two score vectors.
+
+    Args:
+        reference (np.ndarray): The scores of the reference backend.
+        candidate (np.ndarray): The scores of the compared backend.
+
+    Returns:
+        float: The rank correlation, 1.0 meaning the same order.
+    """
+
+    reference_ranks = np.argsort(np.argsort(reference))
+    candidate_ranks = np.argsort(np.argsort(candidate))
+    return float(np.corrcoef(reference_ranks, candidate_ranks)[0, 1])
+
+
+def top_k_overlap(reference: np.ndarray, candidate: np.ndarray, k: int) -> float:
+    """Computes the share of the reference top k that the candidate also ranks in its top k.
+
+    Args:
+        reference (np.ndarray): The scores of the reference backend.
+        candidate (np.ndarray): The scores of the compared backend.
+        k (int): The number of top results compared.
+
+    Returns:
+        float: The overlap, 1.0 meaning the same top k.
+    """
+
+    k = min(k, len(reference))
+    return len(set(np.argsort(-reference)[:k]) & set(np.argsort(-candidate)[:k])) / k
+
+
+async def load_candidates() -> List[List[str]]:
+    """Retrieves NUM_CANDIDATES chunks per benchmark query from the collection.
+
+    Returns:
+        List[List[str]]: The candidate documents of every query.
+    """
+
+    collection = await registry.get_collection()
+    results = collection.query(query_texts=QUERIES, n_results=NUM_CANDIDATES, include=["documents"])
+    return results["documents"]
+
+
+def benchmark_embedding(backends: List[str], candidates: List[List[str]]) -> Dict[str, Any]:
+    """Measures embedding throughput and the retrieval agreement of each backend with "torch".
+
+    Args:
+        backends (List[str]): The encoder backends to compare.
+        candidates (List[List[str]]): The candidate documents of every query.
+
+    Returns:
+        Dict[str, Any]: Texts per second, the mean cosine similarity of the embeddings
+            and the top k overlap of the retrieval ranking, per backend.
+    """
+
+    texts = [document for documents in candidates for document in documents]
+    embeddings: Dict[str, np.ndarray] = {}
+    report: Dict[str, Any] = {}
+    for backend in backends:
+        #* The embedding function instances are cached by Chroma, so a fresh load is forced per backend
+        SentenceTransformerEmbeddingFunction.models.clear()
+        embedding_function = asyncio.run(create_embedding_function(backend=backend))
+        embedding_function(texts[:8])
+
+        start = time.perf_counter()
+        document_embeddings = np.asarray(embedding_function(texts), dtype=np.float32)
+        elapsed = time.perf_counter() - start
+        query_embeddings = np.asarray(embedding_function(QUERIES), dtype=np.float32)
+        embeddings[backend] = np.concatenate([query_embeddings, document_embeddings])
+        report[backend] = {"texts_per_s": round(len(texts) / elapsed, 1)}
+
+    reference = embeddings[TORCH]
+    reference_normalized = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    for backend in backends:
+        candidate = embeddings[backend]
+        candidate_normalized = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+        cosine = (reference_normalized * candidate_normalized).sum(axis=1)
+
+        overlaps = []
+        offset = len(QUERIES)
+        for i, documents in enumerate(candidates):
+            rows = slice(offset, offset + len(documents))
+            offset += len(documents)
+            overlaps.append(top_k_overlap(
+                reference_normalized[rows] @ reference_normalized[i],
+                candidate_normalized[rows] @ candidate_normalized[i],
+                NUM_RETRIEVE_DOCUMENTS,
+            ))
+        report[backend]["mean_cosine_to_torch"] = round(float(cosine.mean()), 4)
+        report[backend]["top_k_overlap_with_torch"] = round(float(np.mean(overlaps)), 4)
+    return report
+
+
+def benchmark_reranker(backends: List[str], candidates: List[List[str]]) -> Dict[str, Any]:
+    """Measures cross encoder throughput and the ranking agreement of each backend with "torch".
+
+    Args:
+        backends (List[str]): The encoder backends to compare.
+        candidates (List[List[str]]): The candidate documents of every query.
+
+    Returns:
+        Dict[str, Any]: Pairs per second, the rank correlation of the scores
+            and the top k overlap, per backend.
+    """
+
+    scores: Dict[str, List[np.ndarray]] = {}
+    report: Dict[str, Any] = {}
+    for backend in backends:
+        reranker = Reranker(backend=backend)
+        reranker.cross_encoder.predict([[QUERIES[0], candidates[0][0]]])
+
+        start = time.perf_counter()
+        scores[backend] = [
+            np.asarray(reranker.cross_encoder.predict(
+                [[query, document] for document in documents], batch_size=reranker.batch_size
+            ))
+            for query, documents in zip(QUERIES, candidates)
+        ]
+        elapsed = time.perf_counter() - start
+        pairs_num = sum(len(documents) for documents in candidates)
+        report[backend] = {"pairs_per_s": round(pairs_num / elapsed, 1)}
+        del reranker
+        gc.collect()
+
+    for backend in backends:
+        pairs = list(zip(scores[TORCH], scores[backend]))
+        report[backend]["rank_correlation_with_torch"] = round(
+            float(np.mean([rank_correlation(reference, candidate) for reference, candidate in pairs])), 4
+        )
+        report[backend]["top_k_overlap_with_torch"] = round(
+            float(np.mean([
+                top_k_overlap(reference, candidate, NUM_RETRIEVE_DOCUMENTS) for reference, candidate in pairs
+            ])), 4
+        )
+    return report
+
+
+def benchmark_llm(backends: List[str], max_new_tokens: int) -> Dict[str, Any]:
+    """Measures greedy decoding throughput and the agreement of each LLM backend with "torch".
+
+    Accuracy is measured on the "torch" outputs: the share of generated tokens that match
+    them, and the perplexity each backend assigns to them.
+
+    Args:
+        backends (List[str]): The LLM backends to compare.
+        max_new_tokens (int): The number of tokens to generate per query.
+
+    Returns:
+        Dict[str, Any]: Tokens per second, token agreement and perplexity, per backend.
+    """
+
+    tokenizer = AutoTokenizer.from_pretrained(HF_LLM_MODEL_ID, cache_dir=HF_CACHE_DIR)
+    prompts = [
+        tokenizer.apply_chat_template(
+            [{"role": "system", "content": RAG_SYSTEM_PROMPT}, {"role": "user", "content": query}],
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+        for query in QUERIES
+    ]
+
+    outputs: Dict[str, List[torch.Tensor]] = {}
+    report: Dict[str, Any] = {}
+    #* The reference backend goes first, as the others are scored on its outputs
+    for backend in [TORCH, *[backend for backend in backends if backend != TORCH]]:
+        model = load_causal_lm(HF_LLM_MODEL_ID, backend)
+        generated_tokens = 0
+        elapsed = 0.0
+        outputs[backend] = []
+        for prompt in prompts:
+            inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+            start = time.perf_counter()
+            generated = model.generate(
+                **inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tokenizer.eos_token_id
+            )
+            elapsed += time.perf_counter() - start
+            outputs[backend].append(generated[0].cpu())
+            generated_tokens += generated.shape[1] - inputs.input_ids.shape[1]
+
+        negative_log_likelihoods = []
+        agreements = []
+        for prompt, reference, candidate in zip(prompts, outputs[TORCH], outputs[backend]):
+            prompt_len = len(tokenizer(prompt).input_ids)
+            reference_ids = reference.unsqueeze(0).to(model.device)
+            with torch.no_grad():
+                logits = model(
+                    input_ids=reference_ids, attention_mask=torch.ones_like(reference_ids)
+                ).logits[0, prompt_len - 1:-1].float()
+            targets = reference[prompt_len:].to(logits.device)
+            negative_log_likelihoods.append(
+                torch.nn.functional.cross_entropy(logits, targets).item()
+            )
+            length = min(len(reference), len(candidate))
+            agreements.append(
+                float((reference[prompt_len:length] == candidate[prompt_len:length]).float().mean())
+            )
+
+        report[backend] = {
+            "tokens_per_s": round(generated_tokens / elapsed, 2),
+            "token_agreement_with_torch": round(float(np.mean(agreements)), 4),
+            "perplexity_of_torch_outputs": round(float(np.exp(np.mean(negative_log_likelihoods))), 4),
+        }
+        del model
+        gc.collect()
+
+    for backend in backends:
+        report[backend]["perplexity_delta"] = round(
+            report[backend]["perplexity_of_torch_outputs"] - report[TORCH]["perplexity_of_torch_outputs"], 4
+        )
+    return {backend: report[backend] for backend in backends}
+
+
+def main() -> None:
+    """Compares the inference backends and prints (and optionally saves) the report."""
+
+    parser = argparse.ArgumentParser(description="Benchmark the LLM, reranker and embedding inference backends.")
+    parser.add_argument("--llm-backends", nargs="*", default=list(LLM_BACKENDS), choices=LLM_BACKENDS)
+    parser.add_argument("--encoder-backends", nargs="*", default=list(ENCODER_BACKENDS), choices=ENCODER_BACKENDS)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--output", type=Path, default=None, help="Write the report to this JSON file.")
+    args = parser.parse_args()
+
+    for backends in (args.llm_backends, args.encoder_backends):
+        if backends and TORCH not in backends:
+            backends.insert(0, TORCH)
+
+    report: Dict[str, Any] = {}
+    if args.encoder_backends:
+        candidates = asyncio.run(load_candidates())
+        report["embedding"] = benchmark_embedding(args.encoder_backends, candidates)
+        report["reranker"] = benchmark_reranker(args.encoder_backends, candidates)
+    if args.llm_backends:
+        report["llm"] = benchmark_llm(args.llm_backends, args.max_new_tokens)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+#* A fixed query set, so the backends and the pipeline runs are compared on the same work
+QUERIES = [
+    "How do I connect to the VPN on Windows?",
+    "I cannot connect to the VPN from Lithuania, what should I check?",
+    "How do I reset my account password?",
+    "Which protocols does the VPN client support?",
+    "Why is my connection slow when the VPN is on?",
+    "How do I enable two-factor authentication?",
+    "What should I do if the VPN keeps disconnecting?",
+    "How do I uninstall the VPN client on macOS?",
+]
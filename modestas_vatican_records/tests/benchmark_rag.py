@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import torch
+
+from chatbot.config import RAG_SYSTEM_PROMPT
+from chatbot.llm import LLM
+from chatbot.query_expansion import QueryExpander
+from chatbot.registry import registry
+from chatbot.reranking import Reranker
+from chatbot.retrieval import fuse_candidates, query_candidates
+from chatbot.sparse_index import BM25Index
+from tests.benchmark_queries import QUERIES
+
+#* The stages of perform_rag, in order. Prefill is the time to the first token, decode the rest of the answer
+STAGES = ["expansion", "chroma_query", "dedup", "rerank", "prefill", "decode"]
+PERCENTILES = [50, 95, 99]
+
+
+def peak_rss_mb() -> float:
+    """Returns the peak resident set size of the process.
+
+    Returns:
+        float: The peak RSS in megabytes.
+    """
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #* ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return max_rss / (1024 * 1024 if platform.system() == "Darwin" else 1024)
+
+
+def summarize_latencies(latencies_s: List[float]) -> Dict[str, float]:
+    """Summarizes latencies into their mean and percentiles.
+
+    Args:
+        latencies_s (List[float]): The latencies in seconds.
+
+    Returns:
+        Dict[str, float]: The mean and the PERCENTILES in milliseconds.
+    """
+
+    latencies_ms = np.asarray(latencies_s) * 1000
+    summary = {"mean_ms": round(float(latencies_ms.mean()), 2)}
+    for percentile, value in zip(PERCENTILES, np.percentile(latencies_ms, PERCENTILES)):
+        summary[f"p{percentile}_ms"] = round(float(value), 2)
+    return summary
+
+
+async def run_query(
+    query: str,
+    collection: Any,
+    llm: LLM,
+    reranker: Reranker,
+    query_expander: QueryExpander,
+    sparse_index: BM25Index | None,
+) -> Dict[str, float]:
+    """Runs the stages of perform_rag for a first-turn query, timing each of them.
+
+    Args:
+        query (str): The query.
+        collection (Any): The ChromaDB collection.
+        llm (LLM): The language model instance.
+        reranker (Reranker): The reranker instance.
+        query_expander (QueryExpander): The query expander instance.
+        sparse_index (BM25Index | None): The BM25 index.
+
+    Returns:
+        Dict[str, float]: The duration of every stage in seconds, the prompt and answer token counts,
+            and the end to end duration.
+    """
+
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+
+    stage_start = time.perf_counter()
+    query_embeddings = await query_expander.expand(query)
+    timings["expansion"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    candidates, rankings = await query_candidates(query, collection, query_embeddings, sparse_index)
+    timings["chroma_query"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    chunks = await fuse_candidates(candidates, rankings)
+    timings["dedup"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    chunks = await reranker.rerank_chunks(query, chunks)
+    timings["rerank"] = time.perf_counter() - stage_start
+    documents = [chunk.text for chunk in chunks]
+
+    #* The prompt is built again outside the timed stages, only to count its tokens
+    user_prompt, history = llm.context_builder.build(query, documents, [], RAG_SYSTEM_PROMPT, llm.build_rag_prompt)
+    prompt = llm.build_prompt(user_prompt, history, RAG_SYSTEM_PROMPT)
+    timings["prompt_tokens"] = len(llm.tokenizer(prompt).input_ids)
+
+    stage_start = time.perf_counter()
+    first_token_at = None
+    answer_parts: List[str] = []
+    async for delta in llm.stream_rag(query=query, documents=documents, conversation_history=[]):
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        answer_parts.append(delta)
+    end = time.perf_counter()
+    first_token_at = first_token_at or end
+    timings["prefill"] = first_token_at - stage_start
+    timings["decode"] = end - first_token_at
+    timings["answer_tokens"] = len(llm.tokenizer("".join(answer_parts), add_special_tokens=False).input_ids)
+    timings["end_to_end"] = end - start
+    return timings
+
+
+async def benchmark(queries: List[str], concurrency: int, repeat: int, keep_caches: bool) -> Dict[str, Any]:
+    """Runs the query set through the RAG stages and reports their latencies and throughput.
+
+    Args:
+        queries (List[str]): The query set.
+        concurrency (int): The number of queries in flight at a time, as if from that many users.
+        repeat (int): The number of passes over the query set.
+        keep_caches (bool): Whether to keep the expansion and rerank caches between passes.
+
+    Returns:
+        Dict[str, Any]: The report.
+    """
+
+    await registry.warm_up()
+    collection = await registry.get_collection()
+    llm = await registry.get_llm()
+    reranker = await registry.get_reranker()
+    query_expander = await registry.get_query_expander()
+    sparse_index = await registry.get_sparse_index()
+
+    #* One untimed query loads the lazily initialized kernels and the system prompt prefix
+    await run_query(queries[0], collection, llm, reranker, query_expander, sparse_index)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_bounded(query: str) -> Dict[str, float]:
+        async with semaphore:
+            return await run_query(query, collection, llm, reranker, query_expander, sparse_index)
+
+    measurements: List[Dict[str, float]] = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        if not keep_caches:
+            reranker.clear()
+            query_expander.clear()
+        measurements.extend(await asyncio.gather(*(run_bounded(query) for query in queries)))
+    elapsed = time.perf_counter() - start
+
+    answer_tokens = sum(measurement["answer_tokens"] for measurement in measurements)
+    report: Dict[str, Any] = {
+        "config": {
+            "queries": len(queries),
+            "concurrency": concurrency,
+            "repeat": repeat,
+            "keep_caches": keep_caches,
+            "llm_backend": llm.backend,
+            "reranker_backend": reranker.backend,
+            "query_expansion": query_expander.strategy,
+            "hybrid_retrieval": sparse_index is not None,
+        },
+        "stages": {
+            stage: summarize_latencies([measurement[stage] for measurement in measurements])
+            for stage in [*STAGES, "end_to_end"]
+        },
+        "throughput": {
+            "queries_per_s": round(len(measurements) / elapsed, 3),
+            "decode_tokens_per_s": round(answer_tokens / elapsed, 2),
+            "per_request_decode_tokens_per_s": round(float(np.mean([
+                measurement["answer_tokens"] / measurement["decode"]
+                for measurement in measurements
+                if measurement["decode"] > 0
+            ] or [0.0])), 2),
+            "prefill_tokens_per_s": round(float(np.mean([
+                measurement["prompt_tokens"] / measurement["prefill"] for measurement in measurements
+            ])), 2),
+            "mean_prompt_tokens": round(float(np.mean([m["prompt_tokens"] for m in measurements])), 1),
+            "mean_answer_tokens": round(float(np.mean([m["answer_tokens"] for m in measurements])), 1),
+        },
+        "memory": {"peak_rss_mb": round(peak_rss_mb(), 1)},
+    }
+    if torch.cuda.is_available():
+        report["memory"]["peak_cuda_mb"] = round(torch.cuda.max_memory_allocated() / (1024 * 1024), 1)
+    return report
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Computes the relative change of every latency, throughput and memory figure from a baseline run.
+
+    Args:
+        baseline (Dict[str, Any]): The report of the baseline run.
+        current (Dict[str, Any]): The report of the current run.
+
+    Returns:
+        Dict[str, Any]: The change of every figure in percent, negative latencies and memory
+            and positive throughput meaning an improvement.
+    """
+
+    def change(old: float, new: float) -> float | None:
+        return round((new - old) / old * 100, 1) if old else None
+
+    comparison: Dict[str, Any] = {"stages": {}, "throughput": {}, "memory": {}}
+    for stage, summary in current["stages"].items():
+        old_summary = baseline.get("stages", {}).get(stage, {})
+        comparison["stages"][stage] = {
+            f"{name}_change_pct": change(old_summary[name], value)
+            for name, value in summary.items()
+            if name in old_summary
+        }
+    for section in ("throughput", "memory"):
+        for name, value in current[section].items():
+            if name in baseline.get(section, {}):
+                comparison[section][f"{name}_change_pct"] = change(baseline[section][name], value)
+    return comparison
+
+
+def main() -> None:
+    """Benchmarks the RAG stages and prints (and optionally saves) the report."""
+
+    parser = argparse.ArgumentParser(description="Benchmark the latency and throughput of every RAG stage.")
+    parser.add_argument("--concurrency", type=int, default=1, help="The number of queries in flight at a time.")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of passes over the query set.")
+    parser.add_argument(
+        "--keep-caches", action="store_true", help="Keep the expansion and rerank caches between passes."
+    )
+    parser.add_argument("--output", type=Path, default=None, help="Write the report to this JSON file.")
+    parser.add_argument("--compare", type=Path, default=None, help="A report of an earlier run to compare with.")
+    args = parser.parse_args()
+
+    report = asyncio.run(benchmark(QUERIES, args.concurrency, args.repeat, args.keep_caches))
+    if args.compare:
+        report["comparison"] = {
+            "baseline": str(args.compare),
+            **compare_reports(json.loads(args.compare.read_text()), report),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
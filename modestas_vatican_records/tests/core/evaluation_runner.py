@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from pydantic import BaseModel
+
+from chatbot.config import (
+    EVALUATION_CACHE_PATH,
+    EVALUATION_CONCURRENCY,
+    EVALUATION_MAX_RETRIES,
+    EVALUATION_RETRY_BASE_DELAY_S,
+)
+from chatbot.utils.logging_config import configure_logging
+from tests.core.evaluation_prompt_template import EVALUATION_PROMPT
+
+Logger = configure_logging()
+
+CACHE_VERSION = 1
+#* A changed evaluation prompt invalidates every cached judgement
+PROMPT_HASH = hashlib.sha256(EVALUATION_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+
+class EvaluationCase(BaseModel):
+    """A query, the chatbot's response to it and the expected response"""
+
+    query: str
+    response: str
+    expected_response: str
+
+
+class EvaluationResult(BaseModel):
+    """The judgement of an evaluation case"""
+
+    case: EvaluationCase
+    feedback: str = ""
+    score: str = ""
+    cached: bool = False
+    error: str | None = None
+
+
+class EvaluationRunner:
+    """Evaluates many cases concurrently with an evaluator, caching the judgements on disk.
+
+    The evaluator is an EvaluatorLLM, or a StubEvaluator for offline runs. At most
+    `concurrency` evaluations are in flight, and the ones failing with one of the
+    evaluator's rate_limit_errors are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        evaluator: Any,
+        concurrency: int | None = None,
+        max_retries: int | None = None,
+        retry_base_delay_s: float | None = None,
+        cache_path: Path | None = None,
+    ) -> None:
+        """Initializes an EvaluationRunner instance, loading the cached judgements.
+
+        Args:
+            evaluator (Any): The evaluator, with model_name, rate_limit_errors and an async evaluate method.
+            concurrency (int | None, optional): The maximum number of evaluations in flight. Defaults to EVALUATION_CONCURRENCY.
+            max_retries (int | None, optional): The number of retries of a rate limited evaluation. Defaults to EVALUATION_MAX_RETRIES.
+            retry_base_delay_s (float | None, optional): The delay before the first retry, doubled for every next one.
+                Defaults to EVALUATION_RETRY_BASE_DELAY_S.
+            cache_path (Path | None, optional): The JSON file the judgements are cached in. Defaults to None, not caching.
+        """
+
+        self.evaluator = evaluator
+        self.concurrency = concurrency or EVALUATION_CONCURRENCY
+        self.max_retries = EVALUATION_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_base_delay_s = (
+            EVALUATION_RETRY_BASE_DELAY_S if retry_base_delay_s is None else retry_base_delay_s
+        )
+        self.cache_path = cache_path
+        self._cache: Dict[str, Dict[str, str]] = self._load_cache()
+
+    def cache_key(self, case: EvaluationCase) -> str:
+        """Returns the cache key of a case, covering the evaluator, the evaluation prompt and the case.
+
+        Args:
+            case (EvaluationCase): The evaluation case.
+
+        Returns:
+            str: The hex digest identifying the judgement.
+        """
+
+        digest = hashlib.sha256()
+        for part in (self.evaluator.model_name or "", PROMPT_HASH, case.query, case.response, case.expected_response):
+            digest.update(f"{part}\x00".encode("utf-8"))
+        return digest.hexdigest()
+
+    async def run(self, cases: List[EvaluationCase]) -> List[EvaluationResult]:
+        """Evaluates the cases, only sending the ones that are not cached yet to the evaluator.
+
+        Args:
+            cases (List[EvaluationCase]): The evaluation cases.
+
+        Returns:
+            List[EvaluationResult]: The results, in the order of the cases.
+        """
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(self._evaluate(case, semaphore) for case in cases))
+        finally:
+            #* Whatever was judged before an interruption is kept for the next run
+            self._save_cache()
+
+        cached_num = sum(result.cached for result in results)
+        failed_num = sum(result.error is not None for result in results)
+        Logger.info(
+            f"Evaluated {len(cases)} cases in {time.perf_counter() - start:.1f} s: "
+            f"{cached_num} cached, {failed_num} failed."
+        )
+        return results
+
+    async def _evaluate(self, case: EvaluationCase, semaphore: asyncio.Semaphore) -> EvaluationResult:
+        """Evaluates a case, retrying rate limited requests.
+
+        Args:
+            case (EvaluationCase): The evaluation case.
+            semaphore (asyncio.Semaphore): Bounds the evaluations in flight.
+
+        Returns:
+            EvaluationResult: The result. Failed evaluations are returned with an error and not cached.
+        """
+
+        key = self.cache_key(case)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return EvaluationResult(case=case, feedback=cached["feedback"], score=cached["score"], cached=True)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    feedback, score = await self.evaluator.evaluate(
+                        case.query, case.response, case.expected_response
+                    )
+            except self.evaluator.rate_limit_errors as e:
+                if attempt == self.max_retries:
+                    Logger.error(f"Evaluation is still rate limited after {attempt} retries: {e}")
+                    return EvaluationResult(case=case, error=str(e))
+                #* Jitter keeps the rate limited requests from retrying in lockstep
+                delay = self.retry_base_delay_s * 2 ** attempt * random.uniform(0.5, 1.5)
+                Logger.warning(f"Evaluation is rate limited, retrying in {delay:.1f} s.")
+                await asyncio.sleep(delay)
+                continue
+            except Exception as e:
+                Logger.error(f"Evaluation failed: {e}")
+                return EvaluationResult(case=case, error=str(e))
+
+            self._cache[key] = {"feedback": feedback, "score": score}
+            return EvaluationResult(case=case, feedback=feedback, score=score)
+
+    def _load_cache(self) -> Dict[str, Dict[str, str]]:
+        """Loads the cached judgements, or returns none if the cache file is unusable."""
+
+        if not self.cache_path or not self.cache_path.exists():
+            return {}
+        try:
+            cache = json.loads(self.cache_path.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            Logger.warning(f"Evaluation cache {self.cache_path} is unreadable, ignoring it: {e}")
+            return {}
+        if cache.get("version") != CACHE_VERSION:
+            Logger.warning(f"Evaluation cache {self.cache_path} has an unknown version, ignoring it.")
+            return {}
+        return cache["entries"]
+
+    def _save_cache(self) -> None:
+        """Atomically writes the cached judgements to disk."""
+
+        if not self.cache_path:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_suffix(self.cache_path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps({"version": CACHE_VERSION, "entries": self._cache}))
+        os.replace(tmp_path, self.cache_path)
+
+
+async def evaluate_cases(
+    cases: List[EvaluationCase],
+    offline: bool,
+    concurrency: int | None,
+    cache_path: Path | None,
+    summarize: bool,
+) -> Dict[str, Any]:
+    """Evaluates the cases and builds the report.
+
+    Args:
+        cases (List[EvaluationCase]): The evaluation cases.
+        offline (bool): Whether to evaluate with the local StubEvaluator instead of Gemini.
+        concurrency (int | None): The maximum number of evaluations in flight.
+        cache_path (Path | None): The JSON file the judgements are cached in.
+        summarize (bool): Whether to generalize the feedback into a summary.
+
+    Returns:
+        Dict[str, Any]: The mean score, the summary and the results.
+    """
+
+    if offline:
+        from tests.core.stub_evaluator import StubEvaluator
+
+        evaluator = StubEvaluator()
+    else:
+        #* Imported lazily, so offline runs don't need the Gemini client
+        from tests.core.evaluator_llm import EvaluatorLLM
+
+        evaluator = EvaluatorLLM()
+
+    results = await EvaluationRunner(evaluator, concurrency=concurrency, cache_path=cache_path).run(cases)
+    scores = [int(result.score) for result in results if result.score.isdigit()]
+    report: Dict[str, Any] = {
+        "evaluator": evaluator.model_name,
+        "mean_score": round(sum(scores) / len(scores), 3) if scores else None,
+        "results": [result.model_dump() for result in results],
+    }
+    if summarize:
+        report["summary"] = await evaluator.generalize_feedback(
+            [result.feedback for result in results if result.error is None]
+        )
+    return report
+
+
+def main() -> None:
+    """Evaluates the cases of a JSON file and prints (and optionally saves) the report."""
+
+    parser = argparse.ArgumentParser(description="Evaluate chatbot responses against expected responses.")
+    parser.add_argument(
+        "cases", type=Path, help="A JSON list of objects with query, response and expected_response."
+    )
+    parser.add_argument("--offline", action="store_true", help="Evaluate with the local stub evaluator.")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--cache", type=Path, default=Path(EVALUATION_CACHE_PATH))
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--summarize", action="store_true", help="Generalize the feedback into a summary.")
+    parser.add_argument("--output", type=Path, default=None, help="Write the report to this JSON file.")
+    args = parser.parse_args()
+
+    cases = [EvaluationCase(**case) for case in json.loads(args.cases.read_text())]
+    report = asyncio.run(evaluate_cases(
+        cases,
+        offline=args.offline,
+        concurrency=args.concurrency,
+        cache_path=None if args.no_cache else args.cache,
+        summarize=args.summarize,
+    ))
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -15,16 +15,41 @@ load_dotenv()
 Logger = configure_logging()
 
 
+def parse_evaluation(eval_result: str) -> Tuple[str, str]:
+    """Splits an evaluation into its feedback and score.
+
+    Args:
+        eval_result (str): The evaluator's output, "Feedback: ... [RESULT] <score>".
+
+    Returns:
+        Tuple[str, str]: A tuple containing the feedback and the score.
+
+    Raises:
+        ValueError: If the output has no [RESULT] marker.
+    """
+
+    feedback, separator, score = eval_result.rpartition("[RESULT]")
+    if not separator:
+        raise ValueError(f"Evaluation has no [RESULT] marker: {eval_result!r}")
+    return feedback.strip(), score.strip()
+
+
 class EvaluatorLLM:
+    #* Errors the evaluation runner retries with backoff
+    rate_limit_errors = (google.api_core.exceptions.ResourceExhausted,)
+
     def __init__(self) -> None:
         """Initializes the EvaluatorLLM with the Gemini API key and model."""
 
         genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        self.model = genai.GenerativeModel(os.getenv("GEMINI_MODEL"))
-        self.gemini_chat = self.model.start_chat()
+        self.model_name = os.getenv("GEMINI_MODEL")
+        self.model = genai.GenerativeModel(self.model_name)
 
     async def chat(self, prompt: str) -> str:
-        """Sends a message to the Gemini chat model and returns the response.
+        """Sends a stateless request to the Gemini model and returns the response.
+
+        Every prompt is sent on its own rather than through a chat session,
+        so evaluations don't carry the previous prompts and can run concurrently.
 
         Args:
             prompt (str): The prompt to send to the model.
@@ -37,10 +62,10 @@ class EvaluatorLLM:
         """
 
         try:
-            response = await self.gemini_chat.send_message_async(prompt)
+            response = await self.model.generate_content_async(prompt)
             return response.text
         except google.api_core.exceptions.ResourceExhausted as e:
-            Logger.error(f"llm_completion RateLimitError: {e.status_code} {e.message}")
+            Logger.error(f"llm_completion RateLimitError: {e.code} {e.message}")
             raise
 
     async def evaluate(
@@ -55,6 +80,9 @@ class EvaluatorLLM:
 
         Returns:
             Tuple[str, str]: A tuple containing the feedback and the score.
+
+        Raises:
+            ValueError: If the evaluation has no [RESULT] marker.
         """
 
         eval_prompt = EVALUATION_PROMPT.format(
@@ -64,9 +92,7 @@ class EvaluatorLLM:
         )
 
         eval_result = await self.chat(eval_prompt)
-        feedback, score = [item.strip() for item in eval_result.split("[RESULT]")]
-
-        return feedback, score
+        return parse_evaluation(eval_result)
 
     async def generalize_feedback(self, feedback_acc: List[str]) -> str:
         """Generalizes a list of feedback strings into a single summary.
@@ -0,0 +1,70 @@
+import re
+from collections import Counter
+from typing import List, Tuple
+
+from tests.core.evaluation_prompt_template import MAX_SCORE
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def token_f1(response: str, expected_response: str) -> float:
+    """Computes the token overlap F1 of a response with the expected response.
+
+    Args:
+        response (str): The response to evaluate.
+        expected_response (str): The expected response.
+
+    Returns:
+        float: The F1 score, between 0 and 1.
+    """
+
+    response_tokens = Counter(TOKEN_PATTERN.findall(response.lower()))
+    expected_tokens = Counter(TOKEN_PATTERN.findall(expected_response.lower()))
+    overlap = sum((response_tokens & expected_tokens).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(response_tokens.values())
+    recall = overlap / sum(expected_tokens.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+class StubEvaluator:
+    """A local stand-in for EvaluatorLLM, for offline runs of the evaluation suite.
+
+    It scores a response by its token overlap with the expected response, so it needs
+    no API key or network and is deterministic. The scores are a rough sanity check
+    of the pipeline, not a replacement for the LLM judge.
+    """
+
+    model_name = "stub-token-f1"
+    rate_limit_errors: Tuple[type, ...] = ()
+
+    async def evaluate(
+        self, query: str, response: str, expected_response: str
+    ) -> Tuple[str, str]:
+        """Evaluates a response against an expected response by token overlap.
+
+        Args:
+            query (str): The original query.
+            response (str): The response to evaluate.
+            expected_response (str): The expected response.
+
+        Returns:
+            Tuple[str, str]: A tuple containing the feedback and the score.
+        """
+
+        f1 = token_f1(response, expected_response)
+        score = 1 + round(f1 * (int(MAX_SCORE) - 1))
+        return f"Feedback: token overlap F1 with the reference answer is {f1:.2f}.", str(score)
+
+    async def generalize_feedback(self, feedback_acc: List[str]) -> str:
+        """Summarizes a list of feedback strings.
+
+        Args:
+            feedback_acc (List[str]): A list of feedback strings.
+
+        Returns:
+            str: A summary of the feedback.
+        """
+
+        return f"{len(feedback_acc)} responses were evaluated offline by token overlap with the reference answers."
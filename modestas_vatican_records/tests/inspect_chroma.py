@@ -1,15 +1,28 @@
+import argparse
 import asyncio
+import os
+import pickle
 import numpy as np
 import umap
-from chatbot.config import CHROMA_DB_PERSIST_DIR, COLLECTION_NAME, DATA_ARTICLES_PATH, NUM_RETRIEVE_DOCUMENTS
+from chatbot.config import (
+    CHROMA_DB_PERSIST_DIR,
+    COLLECTION_NAME,
+    DATA_ARTICLES_PATH,
+    INGESTION_MANIFEST_PATH,
+    NUM_RETRIEVE_DOCUMENTS,
+    UMAP_CACHE_DIR,
+    UMAP_TRANSFORM_BATCH_SIZE,
+)
 from chatbot.database import (
     create_chroma_client,
     create_embedding_function,
     get_or_create_collection,
-    load_articles,
+    list_pdf_files,
     populate_collection,
 )
+from chatbot.ingestion import manifest_fingerprint
 from chatbot.llm import LLM
+from chatbot.utils.logging_config import configure_logging
 from tqdm import tqdm
 from pathlib import Path
 from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
@@ -17,6 +30,11 @@ from chromadb.api.models import Collection
 import matplotlib.pyplot as plt
 from typing import Tuple, List
 
+Logger = configure_logging()
+
+#* Bumped whenever the layout of the cached projection changes
+UMAP_CACHE_VERSION = 1
+
 
 async def prepare_chroma() -> Tuple[Collection.Collection, SentenceTransformerEmbeddingFunction]:
     """Prepares the Chroma database for use.
@@ -39,105 +57,234 @@ async def prepare_chroma() -> Tuple[Collection.Collection, SentenceTransformerEm
         embedding_function=embedding_function,
     )
     if collection.count() == 0:
-        articles = await load_articles(Path(DATA_ARTICLES_PATH))
-        await populate_collection(collection=collection, articles=articles)
+        await populate_collection(collection=collection, filepaths=list_pdf_files(Path(DATA_ARTICLES_PATH)))
 
     return collection, embedding_function
 
 
 async def project_embeddings(
     embeddings: np.ndarray[float, np.dtype[np.float64]],
-    umap_transform: umap.UMAP
+    umap_transform: umap.UMAP,
+    batch_size: int | None = None,
 ) -> np.ndarray[float, np.dtype[np.float64]]:
-    """Projects embeddings into a 2D space using UMAP.
+    """Projects embeddings into a 2D space using UMAP, a batch at a time.
 
     Args:
         embeddings (np.ndarray[float, np.dtype[np.float64]]): The embeddings to project.
         umap_transform (umap.UMAP): The fitted UMAP transformer.
+        batch_size (int | None, optional): The number of embeddings transformed at once. Defaults to UMAP_TRANSFORM_BATCH_SIZE.
 
     Returns:
         np.ndarray[float, np.dtype[np.float64]]: The projected embeddings.
     """
-    umap_embeddings = np.empty((len(embeddings),2))
-    for i, embedding in enumerate(tqdm(embeddings)): 
-        umap_embeddings[i] = umap_transform.transform([embedding])
-    return umap_embeddings
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if len(embeddings) == 0:
+        return np.empty((0, 2))
+    batch_size = batch_size or UMAP_TRANSFORM_BATCH_SIZE
+    return np.concatenate([
+        umap_transform.transform(embeddings[start:start + batch_size])
+        for start in tqdm(range(0, len(embeddings), batch_size))
+    ])
+
+
+def get_collection_version(chroma_collection: Collection) -> str:
+    """Returns the version of the collection, the same way the chatbot's resource registry does.
+
+    Args:
+        chroma_collection (Collection): The Chroma collection.
+
+    Returns:
+        str: The fingerprint of the ingested articles, or the chunk count if there is no ingestion manifest.
+    """
+    if Path(INGESTION_MANIFEST_PATH).exists():
+        return manifest_fingerprint(Path(INGESTION_MANIFEST_PATH))
+    return f"count:{chroma_collection.count()}"
+
+
+async def get_collection_embeddings(
+    chroma_collection: Collection,
+    ids: List[str] | None = None,
+    page_size: int | None = None,
+) -> Tuple[np.ndarray, np.ndarray[float, np.dtype[np.float32]]]:
+    """Reads chunk embeddings from the collection a page at a time.
+
+    Args:
+        chroma_collection (Collection): The Chroma collection.
+        ids (List[str] | None, optional): The ids of the chunks to read. Defaults to None, reading every chunk.
+        page_size (int | None, optional): The number of chunks read at once. Defaults to UMAP_TRANSFORM_BATCH_SIZE.
+
+    Returns:
+        Tuple containing the chunk ids and their embeddings.
+    """
+    page_size = page_size or UMAP_TRANSFORM_BATCH_SIZE
+    pages = []
+    if ids is None:
+        for offset in range(0, chroma_collection.count(), page_size):
+            pages.append(await asyncio.to_thread(
+                chroma_collection.get, include=["embeddings"], limit=page_size, offset=offset
+            ))
+    else:
+        for start in range(0, len(ids), page_size):
+            pages.append(await asyncio.to_thread(
+                chroma_collection.get, ids=ids[start:start + page_size], include=["embeddings"]
+            ))
+    if not pages:
+        return np.empty(0, dtype=str), np.empty((0, 0), dtype=np.float32)
+    return (
+        np.concatenate([np.asarray(page["ids"], dtype=str) for page in pages]),
+        np.concatenate([np.asarray(page["embeddings"], dtype=np.float32) for page in pages]),
+    )
+
+
+async def load_projection(
+    chroma_collection: Collection,
+    cache_dir: Path,
+    refit: bool = False,
+) -> Tuple[umap.UMAP, np.ndarray, np.ndarray[float, np.dtype[np.float64]]]:
+    """Loads the UMAP projection of the collection, computing only what the on-disk cache lacks.
+
+    The fitted UMAP and the projected coordinates of every chunk are cached, keyed by the
+    collection version. If the collection has not changed, nothing is computed. If it has,
+    the cached UMAP is reused: the coordinates of removed chunks are dropped and only the
+    chunks added since are transformed. The UMAP is fitted (on the whole collection, whose
+    coordinates it then holds) only without a cache, or when refit is requested.
+
+    Args:
+        chroma_collection (Collection): The Chroma collection.
+        cache_dir (Path): The directory of the cache.
+        refit (bool, optional): Whether to fit the UMAP again, e.g. after the collection changed a lot. Defaults to False.
+
+    Returns:
+        Tuple containing the fitted UMAP transformer, the chunk ids and their projected coordinates.
+    """
+    model_path = cache_dir / "umap.pkl"
+    coordinates_path = cache_dir / "coordinates.npz"
+    version = get_collection_version(chroma_collection)
+
+    cached = None
+    if not refit and model_path.exists() and coordinates_path.exists():
+        with np.load(coordinates_path) as coordinates_file:
+            cached = {name: coordinates_file[name] for name in coordinates_file.files}
+        if int(cached["cache_version"]) != UMAP_CACHE_VERSION:
+            cached = None
+
+    if cached is not None and str(cached["collection_version"]) == version:
+        Logger.info(f"Loaded the UMAP projection of {len(cached['ids'])} chunks from {cache_dir}.")
+        with open(model_path, "rb") as f:
+            return pickle.load(f), cached["ids"], cached["coordinates"]
+
+    if cached is not None:
+        with open(model_path, "rb") as f:
+            umap_transform = pickle.load(f)
+        ids = np.asarray(chroma_collection.get(include=[])["ids"], dtype=str)
+        kept = np.isin(cached["ids"], ids)
+        new_ids = ids[~np.isin(ids, cached["ids"])]
+        Logger.info(
+            f"Collection changed since the UMAP projection was cached: projecting {len(new_ids)} new chunks, "
+            f"dropping {int((~kept).sum())} removed ones."
+        )
+        new_ids, new_embeddings = await get_collection_embeddings(chroma_collection, new_ids.tolist())
+        ids = np.concatenate([cached["ids"][kept], new_ids])
+        coordinates = np.concatenate([
+            cached["coordinates"][kept],
+            await project_embeddings(new_embeddings, umap_transform),
+        ])
+    else:
+        Logger.info("Fitting UMAP on the whole collection.")
+        ids, embeddings = await get_collection_embeddings(chroma_collection)
+        umap_transform = umap.UMAP(random_state=0, transform_seed=0).fit(embeddings)
+        #* The fitted UMAP already holds the coordinates of the embeddings it was fitted on
+        coordinates = umap_transform.embedding_
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(model_path.with_suffix(".tmp"), "wb") as f:
+            pickle.dump(umap_transform, f)
+        os.replace(model_path.with_suffix(".tmp"), model_path)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    #* np.savez appends .npz to names without it, so the temporary file keeps the suffix
+    tmp_path = coordinates_path.with_name("coordinates.tmp.npz")
+    np.savez(
+        tmp_path,
+        cache_version=UMAP_CACHE_VERSION,
+        collection_version=version,
+        ids=ids,
+        coordinates=coordinates,
+    )
+    os.replace(tmp_path, coordinates_path)
+    return umap_transform, ids, coordinates
 
 
 async def display_latent_space(
-    embeddings: np.ndarray[float, np.dtype[np.float64]],
+    dataset_coordinates: np.ndarray[float, np.dtype[np.float64]],
     query_embeddings: np.ndarray[float, np.dtype[np.float64]],
-    retrieved_embeddings: np.ndarray[float, np.dtype[np.float64]],
+    retrieved_coordinates: np.ndarray[float, np.dtype[np.float64]],
     umap_transform: umap.UMAP
 ) -> None:
     """Displays the latent space of embeddings using UMAP and matplotlib.
 
-    Projects the embeddings, query embedding, and retrieved embeddings into 2D space and plots them.
+    Projects the query embeddings into 2D space and plots them over the projected dataset and retrieved chunks.
 
     Args:
-        embeddings (np.ndarray[float, np.dtype[np.float64]]): The dataset embeddings.
-        query_embedding (np.ndarray[float, np.dtype[np.float64]]): The query embedding.
-        retrieved_embeddings (np.ndarray[float, np.dtype[np.float64]]): The retrieved embeddings.
+        dataset_coordinates (np.ndarray[float, np.dtype[np.float64]]): The projected dataset embeddings.
+        query_embeddings (np.ndarray[float, np.dtype[np.float64]]): The query embedding, followed by the expanded queries' embeddings.
+        retrieved_coordinates (np.ndarray[float, np.dtype[np.float64]]): The projected retrieved embeddings.
         umap_transform (umap.UMAP): The fitted UMAP transformer.
 
     Returns:
         None
     """
-    projected_query_embedding = await project_embeddings([query_embeddings[0]], umap_transform)
-    projected_add_queries_embeddings = await project_embeddings(query_embeddings[1:], umap_transform)
+    projected_query_embeddings = await project_embeddings(query_embeddings, umap_transform)
+    projected_query_embedding = projected_query_embeddings[:1]
+    projected_add_queries_embeddings = projected_query_embeddings[1:]
 
-    projected_dataset_embeddings = await project_embeddings(embeddings, umap_transform)
-    projected_retrieved_embeddings = await project_embeddings(retrieved_embeddings, umap_transform)
-    
     plt.figure()
-    plt.scatter(projected_dataset_embeddings[:, 0], projected_dataset_embeddings[:, 1], s=10, color='gray')
+    plt.scatter(dataset_coordinates[:, 0], dataset_coordinates[:, 1], s=10, color='gray')
     plt.scatter(projected_query_embedding[:, 0], projected_query_embedding[:, 1], s=150, marker='X', color='r')
     plt.scatter(projected_add_queries_embeddings[:, 0], projected_add_queries_embeddings[:, 1], s=150, marker='X', color='y')
-    plt.scatter(projected_retrieved_embeddings[:, 0], projected_retrieved_embeddings[:, 1], s=100, facecolors='none', edgecolors='g')
+    plt.scatter(retrieved_coordinates[:, 0], retrieved_coordinates[:, 1], s=100, facecolors='none', edgecolors='g')
     plt.gca().set_aspect('equal', 'datalim')
     plt.title('Projected Embeddings')
     plt.show()
 
 
-async def get_db_retrieval_embeddings(
+async def get_db_retrieval_ids(
     query_texts: List[str],
     chroma_collection: Collection,
     embedding_function: SentenceTransformerEmbeddingFunction
-) -> Tuple[np.ndarray[float, np.dtype[np.float64]], np.ndarray[float, np.dtype[np.float64]]]:
-    """Retrieves embeddings from the Chroma database for a given query.
+) -> Tuple[np.ndarray[float, np.dtype[np.float64]], List[str]]:
+    """Retrieves chunks from the Chroma database for the given queries.
 
-    Queries the Chroma collection for similar documents and returns the query embedding and retrieved embeddings.
+    Queries the Chroma collection for similar documents and returns the query embeddings and the retrieved chunk ids,
+    whose projected coordinates are already cached.
 
     Args:
-        query (str): The query string.
+        query_texts (List[str]): The query strings.
         chroma_collection (Collection): The Chroma collection.
         embedding_function (SentenceTransformerEmbeddingFunction): The embedding function.
 
     Returns:
-        Tuple containing the query embedding and the retrieved embeddings.
+        Tuple containing the query embeddings and the retrieved chunk ids.
 
     Raises:
         Exception: If the query fails or if the results are not in the expected format.
     """
 
-    results = chroma_collection.query(query_texts=query_texts, n_results=NUM_RETRIEVE_DOCUMENTS, include=['documents', 'embeddings'])
+    results = chroma_collection.query(query_texts=query_texts, n_results=NUM_RETRIEVE_DOCUMENTS, include=[])
     query_embeddings = embedding_function(query_texts)
-    result_embeddings = results['embeddings']
+    retrieved_ids = [item for sublist in results['ids'] for item in sublist]
 
+    return query_embeddings, retrieved_ids
 
-    # query_embeddings = [item for sublist in query_embeddings for item in sublist]
-    retrieved_embeddings = [item for sublist in result_embeddings for item in sublist]
 
-    
-    return query_embeddings, retrieved_embeddings
 
-
-
-async def main() -> None:
+async def main(refit: bool = False) -> None:
     """Main function to demonstrate the embedding visualization.
 
     Sets up the Chroma database, retrieves embeddings for a sample query, and displays the latent space.
 
+    Args:
+        refit (bool, optional): Whether to fit the UMAP again instead of reusing the cached one. Defaults to False.
+
     Returns:
         None
     """
@@ -152,22 +299,25 @@ async def main() -> None:
     query_texts = await llm.expand_querry_question(query)
 
     chroma_collection, embedding_function = await prepare_chroma()
-    embeddings = chroma_collection.get(include=["embeddings"])["embeddings"]
-    umap_transform = umap.UMAP(random_state=0, transform_seed=0).fit(embeddings)
+    umap_transform, ids, coordinates = await load_projection(chroma_collection, Path(UMAP_CACHE_DIR), refit=refit)
 
-    query_embeddings, retrieved_embeddings = await get_db_retrieval_embeddings(
+    query_embeddings, retrieved_ids = await get_db_retrieval_ids(
         query_texts,
         chroma_collection,
         embedding_function
     )
+    rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+    retrieved_coordinates = coordinates[[rows[chunk_id] for chunk_id in retrieved_ids if chunk_id in rows]]
 
     await display_latent_space(
-        embeddings,
+        coordinates,
         query_embeddings,
-        retrieved_embeddings,
+        retrieved_coordinates,
         umap_transform
     )
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Display the UMAP projection of the collection and a query.")
+    parser.add_argument("--refit", action="store_true", help="Fit the UMAP again instead of reusing the cached one.")
+    asyncio.run(main(refit=parser.parse_args().refit))
@@ -0,0 +1,70 @@
+import asyncio
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from chatbot.cache import SemanticAnswerCache
+
+VECTORS = {
+    "how do I reset my password": [1.0, 0.0, 0.0],
+    "how can I reset my password": [0.99, 0.1, 0.0],
+    "what is a vpn": [0.0, 1.0, 0.0],
+}
+
+
+def fake_embedding_function(texts: List[str]) -> List[List[float]]:
+    return [VECTORS[text] for text in texts]
+
+
+def create_cache(path: Path, collection_version: str = "v1", **kwargs) -> SemanticAnswerCache:
+    return SemanticAnswerCache(
+        fake_embedding_function, collection_version=collection_version, path=path, **kwargs
+    )
+
+
+async def store(cache: SemanticAnswerCache, query: str, answer: str) -> None:
+    await cache.store(query, await cache.embed(query), answer, [f"{answer} title"])
+
+
+def test_similar_queries_hit_and_survive_restarts(tmp_path: Path) -> None:
+    path = tmp_path / "answer_cache.json"
+    cache = create_cache(path, similarity_threshold=0.95)
+    asyncio.run(store(cache, "how do I reset my password", "reset answer"))
+
+    similar = asyncio.run(cache.embed("how can I reset my password"))
+    different = asyncio.run(cache.embed("what is a vpn"))
+    assert cache.lookup(similar) == ("reset answer", ["reset answer title"])
+    assert cache.lookup(different) is None
+
+    cache.close()
+    assert create_cache(path).lookup(similar) == ("reset answer", ["reset answer title"])
+    assert create_cache(path, collection_version="v2").lookup(similar) is None
+
+
+def test_expired_and_least_recently_used_entries_are_evicted(tmp_path: Path) -> None:
+    cache = create_cache(tmp_path / "answer_cache.json", max_entries=1)
+    asyncio.run(store(cache, "how do I reset my password", "reset answer"))
+    asyncio.run(store(cache, "what is a vpn", "vpn answer"))
+
+    assert cache.lookup(np.array([1.0, 0.0, 0.0], dtype=np.float32)) is None
+    assert cache.lookup(np.array([0.0, 1.0, 0.0], dtype=np.float32)) == ("vpn answer", ["vpn answer title"])
+
+    cache.ttl_s = -1
+    assert cache.lookup(np.array([0.0, 1.0, 0.0], dtype=np.float32)) is None
+
+
+def test_saves_are_batched_and_never_interleave(tmp_path: Path) -> None:
+    path = tmp_path / "answer_cache.json"
+    cache = create_cache(path, save_every=2)
+    asyncio.run(store(cache, "how do I reset my password", "reset answer"))
+    assert not path.exists()
+    asyncio.run(store(cache, "what is a vpn", "vpn answer"))
+    assert len(create_cache(path)._entries) == 2
+
+    async def save_concurrently() -> None:
+        await asyncio.gather(*(cache.save() for _ in range(5)))
+
+    asyncio.run(save_concurrently())
+    assert len(create_cache(path)._entries) == 2
+    assert [file.name for file in tmp_path.iterdir()] == ["answer_cache.json"]
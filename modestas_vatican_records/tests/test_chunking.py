@@ -0,0 +1,76 @@
+import re
+from typing import Iterator, List
+
+import pytest
+
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+from transformers import PreTrainedTokenizerFast
+
+from chatbot.chunking import TokenChunker
+from chatbot.utils.data_models import Article
+
+TEXT = (
+    "one two three four five six. seven eight nine ten\n"
+    "eleven twelve thirteen. fourteen fifteen sixteen seventeen eighteen\n"
+    "nineteen twenty"
+)
+
+
+def create_tokenizer(text: str) -> PreTrainedTokenizerFast:
+    """Word level fast tokenizer built from the text itself, so nothing has to be downloaded."""
+
+    words = sorted(set(re.findall(r"\w+|[^\w\s]+", text)))
+    tokenizer = Tokenizer(WordLevel({word: i for i, word in enumerate(["[UNK]", *words])}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, unk_token="[UNK]")
+
+
+def test_split_text_cuts_after_separators_within_the_budget() -> None:
+    chunker = TokenChunker(create_tokenizer(TEXT), max_tokens=12, overlap=3)
+
+    chunks = chunker.split_text(TEXT)
+    assert chunks == [
+        "one two three four five six. seven eight nine ten",
+        "eight nine ten\neleven twelve thirteen. fourteen fifteen sixteen seventeen eighteen",
+        "sixteen seventeen eighteen\nnineteen twenty",
+    ]
+    assert all(len(chunker.tokenizer(chunk, add_special_tokens=False).input_ids) <= 12 for chunk in chunks)
+
+
+def test_split_text_keeps_short_text_whole() -> None:
+    chunker = TokenChunker(create_tokenizer(TEXT), max_tokens=64, overlap=3)
+    assert chunker.split_text(f"  {TEXT}\n") == [TEXT]
+    assert chunker.split_text("  \n") == []
+
+
+def test_chunk_article_numbers_pages_and_drops_repeats() -> None:
+    chunker = TokenChunker(create_tokenizer(TEXT), max_tokens=64, overlap=3)
+    article = Article(title="Article", source="article.pdf", pages=["one two", "", "one two"])
+
+    chunks = chunker.chunk_article(article)
+    assert [(chunk.page, chunk.document) for chunk in chunks] == [(1, "one two"), (3, "one two")]
+    assert chunks[0].id != chunks[1].id
+
+
+def test_iter_chunks_chunks_every_page_before_reading_the_next() -> None:
+    chunker = TokenChunker(create_tokenizer(TEXT), max_tokens=64, overlap=3)
+    read_pages: List[int] = []
+
+    def read_pages_lazily() -> Iterator[str]:
+        for page_number, page_text in enumerate(["one two", "three four", "five six"], start=1):
+            read_pages.append(page_number)
+            yield page_text
+
+    chunks = chunker.iter_chunks(read_pages_lazily(), title="Manual", source="manual.pdf")
+    assert next(chunks).page == 1
+    assert read_pages == [1]
+    assert [(chunk.page, chunk.document) for chunk in chunks] == [(2, "three four"), (3, "five six")]
+    assert read_pages == [1, 2, 3]
+
+
+def test_overlap_must_leave_room_for_new_tokens() -> None:
+    with pytest.raises(ValueError):
+        TokenChunker(create_tokenizer(TEXT), max_tokens=12, overlap=6)
+
@@ -0,0 +1,48 @@
+from typing import Any, Dict, List
+
+from chatbot.context import ContextBuilder
+from chatbot.llm import LLM
+
+
+class WordTokenizer:
+    """Counts every whitespace separated word as a token, with a minimal chat template."""
+
+    def __call__(self, text: str, add_special_tokens: bool = True) -> Any:
+        return type("Encoding", (), {"input_ids": text.split()})
+
+    def decode(self, token_ids: List[str], skip_special_tokens: bool = True) -> str:
+        return " ".join(token_ids)
+
+    def apply_chat_template(
+        self, messages: List[Dict[str, str]], tokenize: bool = False, add_generation_prompt: bool = False
+    ) -> List[str]:
+        tokens = [token for message in messages for token in ["<start>", message["role"], *message["content"].split(), "<end>"]]
+        return tokens + ["<start>", "assistant"] if add_generation_prompt else tokens
+
+
+def build(token_budget: int, documents: List[str], history: List[Dict[str, str]]) -> Any:
+    builder = ContextBuilder(WordTokenizer(), token_budget=token_budget)
+    return builder.build("q", documents, history, "system prompt", LLM.build_rag_prompt)
+
+
+def test_documents_fill_the_budget_before_history() -> None:
+    documents = ["one " * 50, "two " * 50, "three " * 100]
+    history = [{"role": "user", "content": "old " * 20}, {"role": "user", "content": "q"}]
+
+    user_prompt, kept_history = build(200, documents, history)
+    assert user_prompt.count("one") == 50 and user_prompt.count("two") == 50
+    assert 64 <= user_prompt.count("three") < 100
+    assert kept_history == []
+
+
+def test_oldest_turns_are_dropped_first() -> None:
+    history = [
+        {"role": "user", "content": "old " * 20},
+        {"role": "assistant", "content": "older answer " * 10},
+        {"role": "user", "content": "recent question"},
+        {"role": "assistant", "content": "recent answer"},
+    ]
+
+    user_prompt, kept_history = build(40, ["doc " * 10], history)
+    assert user_prompt.count("doc") == 10
+    assert kept_history == history[2:]
@@ -0,0 +1,56 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, Iterator, List, Tuple
+
+from chatbot.database import iter_pdf_results
+from chatbot.utils.pdf_utils import DONE, FAILED, RESULT
+
+
+def read_or_hang(filepath: str) -> Iterator[str]:
+    """Stand-in PDF worker streaming two pages, which never finishes hang.pdf and fails on broken.pdf."""
+
+    name = Path(filepath).name
+    if name == "hang.pdf":
+        time.sleep(60)
+    yield f"{name} page 1"
+    if name == "broken.pdf":
+        raise ValueError("broken page")
+    yield f"{name} page 2"
+    return 2
+
+
+def collect(filepaths: List[Path], **kwargs: Any) -> List[Tuple[str, str, Any]]:
+    async def collect_events() -> List[Tuple[str, str, Any]]:
+        return [
+            (filepath.name, event, payload)
+            async for filepath, event, payload in iter_pdf_results(read_or_hang, filepaths, **kwargs)
+        ]
+
+    return asyncio.run(collect_events())
+
+
+def test_worker_items_are_streamed_in_order() -> None:
+    events = collect([Path("a.pdf"), Path("broken.pdf")], max_workers=2, timeout=30)
+
+    assert [event for event in events if event[0] == "a.pdf"] == [
+        ("a.pdf", RESULT, "a.pdf page 1"),
+        ("a.pdf", RESULT, "a.pdf page 2"),
+        ("a.pdf", DONE, 2),
+    ]
+    assert [event for event in events if event[0] == "broken.pdf"] == [
+        ("broken.pdf", RESULT, "broken.pdf page 1"),
+        ("broken.pdf", FAILED, "broken page"),
+    ]
+
+
+def test_files_queued_behind_a_stuck_worker_do_not_time_out() -> None:
+    start = time.perf_counter()
+    events = collect([Path("hang.pdf"), Path("a.pdf"), Path("b.pdf")], max_workers=1, timeout=1)
+
+    assert [(name, event) for name, event, _ in events if event != RESULT] == [
+        ("hang.pdf", FAILED),
+        ("a.pdf", DONE),
+        ("b.pdf", DONE),
+    ]
+    assert time.perf_counter() - start < 30
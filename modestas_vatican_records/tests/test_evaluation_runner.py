@@ -0,0 +1,74 @@
+import asyncio
+from pathlib import Path
+from typing import List, Tuple
+
+from tests.core.evaluation_runner import EvaluationCase, EvaluationRunner
+from tests.core.stub_evaluator import StubEvaluator
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class FlakyEvaluator(StubEvaluator):
+    """Stub evaluator that is rate limited on the first request of every case, recording the concurrency."""
+
+    rate_limit_errors = (RateLimitError,)
+
+    def __init__(self) -> None:
+        self.evaluated: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def evaluate(self, query: str, response: str, expected_response: str) -> Tuple[str, str]:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            self.evaluated.append(query)
+            if self.evaluated.count(query) == 1:
+                raise RateLimitError("429")
+            return await super().evaluate(query, response, expected_response)
+        finally:
+            self.in_flight -= 1
+
+
+def cases(response: str = "reset it in the settings") -> List[EvaluationCase]:
+    return [
+        EvaluationCase(query=f"query {i}", response=response, expected_response="reset it in the settings")
+        for i in range(6)
+    ]
+
+
+def test_runner_bounds_concurrency_and_retries_rate_limits(tmp_path: Path) -> None:
+    evaluator = FlakyEvaluator()
+    runner = EvaluationRunner(evaluator, concurrency=2, retry_base_delay_s=0.0, cache_path=tmp_path / "cache.json")
+
+    results = asyncio.run(runner.run(cases()))
+    assert [result.score for result in results] == ["5"] * 6
+    assert all(result.error is None and not result.cached for result in results)
+    assert len(evaluator.evaluated) == 12
+    assert evaluator.max_in_flight == 2
+
+
+def test_runner_only_evaluates_changed_cases(tmp_path: Path) -> None:
+    cache_path = tmp_path / "cache.json"
+    asyncio.run(EvaluationRunner(StubEvaluator(), cache_path=cache_path).run(cases()))
+
+    changed = cases()
+    changed[0] = EvaluationCase(query="query 0", response="no idea", expected_response="reset it in the settings")
+    results = asyncio.run(EvaluationRunner(StubEvaluator(), cache_path=cache_path).run(changed))
+    assert [result.cached for result in results] == [False, True, True, True, True, True]
+    assert results[0].score == "1"
+
+
+def test_runner_gives_up_after_max_retries() -> None:
+    class AlwaysLimited(StubEvaluator):
+        rate_limit_errors = (RateLimitError,)
+
+        async def evaluate(self, query: str, response: str, expected_response: str) -> Tuple[str, str]:
+            raise RateLimitError("429")
+
+    runner = EvaluationRunner(AlwaysLimited(), max_retries=2, retry_base_delay_s=0.0)
+    results = asyncio.run(runner.run(cases()[:1]))
+    assert results[0].error == "429"
@@ -0,0 +1,15 @@
+import asyncio
+
+from chatbot.utils.data_models import RetrievedChunk
+from chatbot.utils.filter_documents import deduplicate_chunks
+
+
+def chunk(chunk_id: str, score: float) -> RetrievedChunk:
+    return RetrievedChunk(id=chunk_id, score=score, title=f"Title {chunk_id}", text=f"Text {chunk_id}")
+
+
+def test_deduplicate_chunks_keeps_first_order_and_best_score() -> None:
+    chunks = [chunk("b", 0.2), chunk("a", 0.5), chunk("b", 0.9), chunk("c", 0.1), chunk("a", 0.3)]
+
+    unique_chunks = asyncio.run(deduplicate_chunks(chunks))
+    assert [(c.id, c.score) for c in unique_chunks] == [("b", 0.9), ("a", 0.5), ("c", 0.1)]
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from typing import Any, List, Set
+
+import pytest
+import torch
+
+from chatbot.generation import CancelledRequestsCriteria, GenerationRequest, GenerationScheduler
+
+
+class RecordingScheduler(GenerationScheduler):
+    """Scheduler echoing prompts instead of running a model, recording every batch."""
+
+    def __init__(self, delay_s: float = 0, error: Exception | None = None, **kwargs) -> None:
+        super().__init__(model=None, tokenizer=None, **kwargs)
+        self.delay_s = delay_s
+        self.error = error
+        self.batches: List[List[str]] = []
+        self.requests: List[GenerationRequest] = []
+
+    def stop_token_ids(self) -> Set[int]:
+        return set()
+
+    def generate_batch(
+        self, prompts: List[str], max_new_tokens: int, streamer: Any = None, stopping_criteria: Any = None
+    ) -> List[str]:
+        self.batches.append(prompts)
+        self.requests.extend(stopping_criteria[0].requests)
+        time.sleep(self.delay_s)
+        if self.error:
+            raise self.error
+        return [f"{prompt}:{max_new_tokens}" for prompt in prompts]
+
+
+def test_concurrent_requests_are_batched() -> None:
+    scheduler = RecordingScheduler(max_batch_size=3, max_wait_ms=50)
+
+    async def run() -> List[str]:
+        return await asyncio.gather(
+            *(scheduler.submit(f"prompt {i}", max_new_tokens=8) for i in range(5))
+        )
+
+    responses = asyncio.run(run())
+    assert responses == [f"prompt {i}:8" for i in range(5)]
+    assert [len(batch) for batch in scheduler.batches] == [3, 2]
+
+
+def test_requests_are_grouped_by_token_limit() -> None:
+    scheduler = RecordingScheduler(max_batch_size=4, max_wait_ms=50)
+
+    async def run() -> List[str]:
+        return await asyncio.gather(
+            scheduler.submit("a", max_new_tokens=8),
+            scheduler.submit("b", max_new_tokens=16),
+            scheduler.submit("c", max_new_tokens=8),
+        )
+
+    assert asyncio.run(run()) == ["a:8", "b:16", "c:8"]
+    assert sorted(scheduler.batches) == [["a", "c"], ["b"]]
+
+
+def test_abandoned_stream_is_not_generated() -> None:
+    scheduler = RecordingScheduler(delay_s=0.1, max_wait_ms=0)
+
+    async def consume() -> List[str]:
+        return [delta async for delta in scheduler.stream("abandoned", max_new_tokens=8)]
+
+    async def run() -> None:
+        earlier = asyncio.create_task(scheduler.submit("earlier", max_new_tokens=8))
+        await asyncio.sleep(0.05)
+        abandoned = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        await earlier
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert scheduler.batches == [["earlier"]]
+
+
+def test_failed_stream_leaves_no_pending_future() -> None:
+    scheduler = RecordingScheduler(error=RuntimeError("out of memory"))
+
+    async def consume() -> List[str]:
+        return [delta async for delta in scheduler.stream("prompt", max_new_tokens=8)]
+
+    with pytest.raises(RuntimeError, match="out of memory"):
+        asyncio.run(consume())
+    assert all(request.future.done() for request in scheduler.requests)
+
+
+def test_cancelled_requests_stop_their_rows() -> None:
+    async def run() -> torch.Tensor:
+        loop = asyncio.get_running_loop()
+        requests = [GenerationRequest(f"prompt {i}", 8, loop.create_future()) for i in range(2)]
+        requests[1].future.cancel()
+        return CancelledRequestsCriteria(requests)(torch.zeros(2, 3, dtype=torch.long), torch.zeros(2, 5))
+
+    assert asyncio.run(run()).tolist() == [False, True]
@@ -0,0 +1,166 @@
+import asyncio
+import os
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List
+
+import pytest
+
+import chatbot.ingestion as ingestion
+from chatbot.chunking import TokenChunker
+from chatbot.ingestion import load_manifest, manifest_fingerprint, sync_collection
+from chatbot.sparse_index import BM25Index
+from chatbot.utils.data_models import Article, ChunkBatch
+
+
+class FakeCollection:
+    """In-memory stand-in for a Chroma collection, recording embedded chunks."""
+
+    name = "fake"
+
+    def __init__(self) -> None:
+        self.items: Dict[str, str] = {}
+        self.embedded: List[str] = []
+
+    def count(self) -> int:
+        return len(self.items)
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[Any] | None,
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        for uid, document in zip(ids, documents):
+            self.items[uid] = document
+            self.embedded.append(uid)
+
+    def delete(self, ids: List[str]) -> None:
+        for uid in ids:
+            del self.items[uid]
+
+    def get(self, include: List[str]) -> Dict[str, List[str]]:
+        return {"ids": list(self.items)}
+
+
+class WholePageChunker(TokenChunker):
+    """Chunker keeping each page as a single chunk, so no tokenizer has to be downloaded."""
+
+    def __init__(self) -> None:
+        pass
+
+    def split_text(self, text: str) -> List[str]:
+        return [text]
+
+
+async def fake_iter_pdf_chunks(filepaths: Iterable[Path]) -> AsyncIterator[ChunkBatch]:
+    """Streams every page as a batch. Reading fails on a page saying "corrupt", after the earlier pages were sent."""
+
+    for filepath in filepaths:
+        article = Article(title=filepath.stem, source=filepath.name)
+        pages = filepath.read_text().split("\f")
+        failed = False
+        for page_number, page_text in enumerate(pages, start=1):
+            if page_text == "corrupt":
+                failed = True
+                break
+            page_texts = [""] * (page_number - 1) + [page_text]
+            chunks = list(WholePageChunker().iter_chunks(page_texts, title=filepath.stem, source=filepath.name))
+            yield ChunkBatch(article=article, chunks=chunks)
+        yield ChunkBatch(article=article, last=True, failed=failed)
+
+
+@pytest.fixture(autouse=True)
+def text_articles(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(ingestion, "iter_pdf_chunks", fake_iter_pdf_chunks)
+
+
+def sync(
+    collection: FakeCollection,
+    data_dir: Path,
+    manifest_path: Path,
+    sparse_index: BM25Index | None = None,
+    embedding_backend: str | None = None,
+) -> bool:
+    return asyncio.run(
+        sync_collection(
+            collection, data_dir, manifest_path, sparse_index=sparse_index, embedding_backend=embedding_backend
+        )
+    )
+
+
+def test_sync_collection_only_embeds_changes(tmp_path: Path) -> None:
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    manifest_path = tmp_path / "manifest.json"
+    (data_dir / "vpn.pdf").write_text("vpn won't connect\fcheck the firewall")
+    (data_dir / "dns.pdf").write_text("dns leak test")
+
+    collection = FakeCollection()
+    sparse_index = BM25Index(tmp_path / "bm25_index.json")
+    assert sync(collection, data_dir, manifest_path, sparse_index)
+    assert collection.count() == 3
+
+    collection.embedded.clear()
+    assert not sync(collection, data_dir, manifest_path, sparse_index)
+    assert collection.embedded == []
+
+    (data_dir / "vpn.pdf").write_text("vpn won't connect\frestart the app")
+    os.utime(data_dir / "vpn.pdf", (0, 0))
+    (data_dir / "dns.pdf").unlink()
+    assert sync(collection, data_dir, manifest_path, sparse_index)
+    assert len(collection.embedded) == 1
+    assert collection.count() == 2
+    assert set(load_manifest(manifest_path)["files"]) == {"vpn.pdf"}
+
+    persisted_index = BM25Index(tmp_path / "bm25_index.json")
+    assert set(persisted_index.doc_lengths) == set(collection.items)
+    assert persisted_index.search("restart", n_results=5)[0][0] in collection.items
+    assert persisted_index.search("dns", n_results=5) == []
+
+
+def test_sync_collection_replaces_legacy_chunks(tmp_path: Path) -> None:
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "vpn.pdf").write_text("vpn won't connect")
+
+    collection = FakeCollection()
+    collection.items["legacy-uuid"] = "vpn won't connect"
+    assert sync(collection, data_dir, tmp_path / "manifest.json")
+    assert "legacy-uuid" not in collection.items
+    assert collection.count() == 1
+
+
+def test_sync_collection_drops_chunks_of_files_failing_half_way(tmp_path: Path) -> None:
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    manifest_path = tmp_path / "manifest.json"
+    (data_dir / "vpn.pdf").write_text("vpn won't connect")
+    (data_dir / "dns.pdf").write_text("dns leak test\fcorrupt")
+
+    collection = FakeCollection()
+    sparse_index = BM25Index(tmp_path / "bm25_index.json")
+    assert sync(collection, data_dir, manifest_path, sparse_index)
+    assert list(collection.items.values()) == ["vpn won't connect"]
+    assert set(sparse_index.doc_lengths) == set(collection.items)
+    assert set(load_manifest(manifest_path)["files"]) == {"vpn.pdf"}
+
+
+def test_sync_collection_reingests_when_the_embedding_backend_changes(tmp_path: Path) -> None:
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    manifest_path = tmp_path / "manifest.json"
+    (data_dir / "vpn.pdf").write_text("vpn won't connect\fcheck the firewall")
+
+    collection = FakeCollection()
+    sparse_index = BM25Index(tmp_path / "bm25_index.json")
+    assert sync(collection, data_dir, manifest_path, sparse_index, embedding_backend="torch")
+    torch_fingerprint = manifest_fingerprint(manifest_path)
+
+    collection.embedded.clear()
+    assert sync(collection, data_dir, manifest_path, sparse_index, embedding_backend="int8")
+    assert sorted(collection.embedded) == sorted(collection.items)
+    assert collection.count() == 2
+    assert set(sparse_index.doc_lengths) == set(collection.items)
+    assert load_manifest(manifest_path)["embedding"]["backend"] == "int8"
+    assert manifest_fingerprint(manifest_path) != torch_fingerprint
@@ -0,0 +1,54 @@
+import torch
+from transformers import DynamicCache
+
+from chatbot.prefix_cache import PrefixCache, PromptPrefix
+
+
+def create_past_key_values(length: int) -> DynamicCache:
+    past_key_values = DynamicCache()
+    past_key_values.update(torch.zeros(1, 1, length, 256), torch.zeros(1, 1, length, 256), 0)
+    return past_key_values
+
+
+def test_longest_matching_prefix_is_reused() -> None:
+    cache = PrefixCache(max_mb=1)
+    prefix = PromptPrefix(system_text="system", conversation_text="system turns", session_id="a")
+    cache.store(("system", "system"), torch.arange(2), create_past_key_values(2))
+    cache.store(("session", "a"), torch.arange(4), create_past_key_values(4))
+
+    past_key_values, cached_len = cache.lookup(prefix, torch.arange(6))
+    assert cached_len == 4
+    assert past_key_values.get_seq_length() == 4
+
+    #* The session's conversation was trimmed, so only the system prompt still matches
+    _, cached_len = cache.lookup(prefix, torch.tensor([0, 1, 5, 6, 7]))
+    assert cached_len == 2
+
+
+def test_least_recently_used_sessions_are_evicted() -> None:
+    #* Every entry takes 2 * 4 * 256 * 4 bytes = 8 KB
+    cache = PrefixCache(max_mb=20 / 1024)
+    for session_id in ("a", "b"):
+        cache.store(("session", session_id), torch.arange(4), create_past_key_values(4))
+    cache.lookup(PromptPrefix("", "", session_id="a"), torch.arange(6))
+    cache.store(("session", "c"), torch.arange(4), create_past_key_values(4))
+
+    assert ("session", "a") in cache and ("session", "c") in cache
+    assert ("session", "b") not in cache
+    assert cache.nbytes == 2 * 8192
+
+
+class LegacyDynamicCache:
+    """The DynamicCache layout of transformers < 4.56 (the locked 4.49), with per-layer tensor lists."""
+
+    def __init__(self, length: int) -> None:
+        self.key_cache = [torch.zeros(1, 1, length, 256), []]
+        self.value_cache = [torch.zeros(1, 1, length, 256), []]
+
+
+def test_legacy_cache_layout_is_measured() -> None:
+    cache = PrefixCache(max_mb=1)
+    cache.store(("session", "a"), torch.arange(4), LegacyDynamicCache(4))
+
+    assert ("session", "a") in cache
+    assert cache.nbytes == 8192
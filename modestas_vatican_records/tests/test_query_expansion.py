@@ -0,0 +1,150 @@
+import asyncio
+import time
+from typing import Any, List
+
+import chromadb
+
+from chatbot.generation import GenerationScheduler
+from chatbot.query_expansion import QueryExpander
+
+VECTORS = {
+    "reset password": [1.0, 0.0, 0.0],
+    "Forgot my login?": [0.9, 0.1, 0.0],
+    "Change my credentials?": [0.8, 0.0, 0.2],
+}
+
+
+def fake_embedding_function(texts: List[str]) -> List[List[float]]:
+    return [VECTORS[text] for text in texts]
+
+
+class SlowLLM:
+    """Stands in for LLM, suggesting related questions after a delay."""
+
+    def __init__(self, delay_s: float) -> None:
+        self.delay_s = delay_s
+        self.calls = 0
+        self.cancelled = 0
+
+    async def expand_querry_question(self, user_prompt: str, max_new_tokens: int | None = None) -> List[str]:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay_s)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return [user_prompt, "Forgot my login?", "", "Change my credentials?"]
+
+
+class SleepingScheduler(GenerationScheduler):
+    """Scheduler taking a while per batch instead of running a model, recording every batch."""
+
+    def __init__(self, delay_s: float) -> None:
+        super().__init__(model=None, tokenizer=None, max_wait_ms=10)
+        self.delay_s = delay_s
+        self.batches: List[List[str]] = []
+
+    def generate_batch(
+        self, prompts: List[str], max_new_tokens: int, streamer: Any = None, stopping_criteria: Any = None
+    ) -> List[str]:
+        self.batches.append(prompts)
+        time.sleep(self.delay_s)
+        return [prompt for prompt in prompts]
+
+
+class SchedulerLLM:
+    """Stands in for LLM, generating the related questions on a shared scheduler."""
+
+    def __init__(self, scheduler: GenerationScheduler) -> None:
+        self.scheduler = scheduler
+
+    async def expand_querry_question(self, user_prompt: str, max_new_tokens: int | None = None) -> List[str]:
+        response = await self.scheduler.submit(f"expand {user_prompt}", max_new_tokens=8)
+        return [user_prompt, response]
+
+
+def create_collection() -> chromadb.Collection:
+    collection = chromadb.EphemeralClient().get_or_create_collection("query_expansion_test")
+    collection.upsert(
+        ids=["a", "b"],
+        documents=["first chunk", "second chunk"],
+        embeddings=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]],
+    )
+    return collection
+
+
+def test_llm_expansion_is_cached() -> None:
+    llm = SlowLLM(delay_s=0)
+    expander = QueryExpander(fake_embedding_function, create_collection(), llm=llm, strategy="llm", timeout_s=1)
+
+    async def run() -> List[List[List[float]]]:
+        return [await expander.expand("reset password") for _ in range(2)]
+
+    first, second = asyncio.run(run())
+    assert first == second == [VECTORS["reset password"], VECTORS["Forgot my login?"], VECTORS["Change my credentials?"]]
+    assert llm.calls == 1
+
+
+
+def test_clear_forgets_cached_questions() -> None:
+    llm = SlowLLM(delay_s=0)
+    expander = QueryExpander(fake_embedding_function, create_collection(), llm=llm, strategy="llm", timeout_s=1)
+
+    asyncio.run(expander.expand("reset password"))
+    expander.clear()
+    asyncio.run(expander.expand("reset password"))
+    assert llm.calls == 2
+
+
+def test_precomputed_query_embedding_is_reused() -> None:
+    embedded: List[str] = []
+
+    def recording_embedding_function(texts: List[str]) -> List[List[float]]:
+        embedded.extend(texts)
+        return fake_embedding_function(texts)
+
+    expander = QueryExpander(
+        recording_embedding_function, create_collection(), llm=SlowLLM(delay_s=0), strategy="llm", timeout_s=1
+    )
+    query_embeddings = asyncio.run(expander.expand("reset password", query_embedding=VECTORS["reset password"]))
+    assert query_embeddings[0] == VECTORS["reset password"]
+    assert "reset password" not in embedded
+
+def test_expansion_over_budget_falls_back_to_query() -> None:
+    llm = SlowLLM(delay_s=0.2)
+    expander = QueryExpander(fake_embedding_function, create_collection(), llm=llm, strategy="llm", timeout_s=0.05)
+
+    async def run() -> List[List[float]]:
+        timed_out = await expander.expand("reset password")
+        await asyncio.sleep(0)
+        return timed_out
+
+    assert asyncio.run(run()) == [VECTORS["reset password"]]
+    assert llm.calls == llm.cancelled == 1
+
+
+def test_timed_out_expansion_does_not_delay_the_answer() -> None:
+    scheduler = SleepingScheduler(delay_s=0.2)
+    expander = QueryExpander(
+        fake_embedding_function, create_collection(), llm=SchedulerLLM(scheduler), strategy="llm", timeout_s=0.05
+    )
+
+    async def run() -> str:
+        earlier_answer = asyncio.create_task(scheduler.submit("earlier answer", max_new_tokens=8))
+        await asyncio.sleep(0.05)
+        #* The expansion queues behind the earlier answer and runs out of budget
+        assert await expander.expand("reset password") == [VECTORS["reset password"]]
+        answer = await scheduler.submit("answer", max_new_tokens=8)
+        await earlier_answer
+        return answer
+
+    assert asyncio.run(run()) == "answer"
+    assert scheduler.batches == [["earlier answer"], ["answer"]]
+
+
+def test_embedding_expansion_moves_towards_neighbours() -> None:
+    expander = QueryExpander(fake_embedding_function, create_collection(), strategy="embedding", timeout_s=5)
+
+    query_embedding, expanded = asyncio.run(expander.expand("reset password"))
+    assert query_embedding == VECTORS["reset password"]
+    assert expanded[0] > expanded[1] > 0
@@ -0,0 +1,65 @@
+import asyncio
+from collections import OrderedDict
+from typing import List
+
+from chatbot.reranking import Reranker
+from chatbot.utils.data_models import RetrievedChunk
+
+
+class FakeCrossEncoder:
+    """Scores a document by its length, recording every scored pair."""
+
+    def __init__(self) -> None:
+        self.scored: List[List[str]] = []
+
+    def predict(self, pairs: List[List[str]], batch_size: int = 32) -> List[float]:
+        self.scored.extend(pairs)
+        return [float(len(document)) for _, document in pairs]
+
+
+class FakeReranker(Reranker):
+    """Reranker using the fake cross encoder instead of loading a model."""
+
+    def __init__(self) -> None:
+        self.batch_size = 2
+        self.cache_size = 100
+        self._scores = OrderedDict()
+        self.cross_encoder = FakeCrossEncoder()
+
+
+def test_rerank_returns_top_k_with_scores() -> None:
+    reranker = FakeReranker()
+    documents = ["aaa", "a", "aaaaa", "aa", "aaaa"]
+
+    top_documents, scores = asyncio.run(reranker.rerank("query", documents, num_retrieve_documents=3))
+    assert top_documents == ["aaaaa", "aaaa", "aaa"]
+    assert scores == [5.0, 4.0, 3.0]
+
+
+def test_rerank_scores_are_cached_by_chunk_id() -> None:
+    reranker = FakeReranker()
+    asyncio.run(reranker.rerank("query", ["a", "aa"], document_ids=["1", "2"]))
+    asyncio.run(reranker.rerank("query", ["a", "aa", "aaa"], document_ids=["1", "2", "3"]))
+
+    assert reranker.cross_encoder.scored == [["query", "a"], ["query", "aa"], ["query", "aaa"]]
+
+
+
+def test_clear_forgets_cached_scores() -> None:
+    reranker = FakeReranker()
+    asyncio.run(reranker.rerank("query", ["a"], document_ids=["1"]))
+    reranker.clear()
+    asyncio.run(reranker.rerank("query", ["a"], document_ids=["1"]))
+
+    assert reranker.cross_encoder.scored == [["query", "a"], ["query", "a"]]
+
+
+def test_rerank_chunks_scores_records() -> None:
+    reranker = FakeReranker()
+    chunks = [
+        RetrievedChunk(id=str(i), score=0.0, title=f"Title {i}", text="a" * i) for i in (2, 5, 1, 4)
+    ]
+
+    top_chunks = asyncio.run(reranker.rerank_chunks("query", chunks, num_retrieve_documents=2))
+    assert [(c.id, c.title, c.score) for c in top_chunks] == [("5", "Title 5", 5.0), ("4", "Title 4", 4.0)]
+    assert [c.score for c in chunks] == [0.0] * 4
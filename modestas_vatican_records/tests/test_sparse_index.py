@@ -0,0 +1,46 @@
+from pathlib import Path
+
+from chatbot.sparse_index import BM25Index, reciprocal_rank_fusion, tokenize
+from chatbot.utils.data_models import Chunk
+
+
+def create_chunk(chunk_id: str, document: str) -> Chunk:
+    return Chunk(id=chunk_id, document=document, title="", page=1)
+
+
+def test_tokenize_keeps_error_codes_and_versions() -> None:
+    assert tokenize("Error 0x800704CF on Wi-Fi 2.4 GHz.") == ["error", "0x800704cf", "on", "wi-fi", "2.4", "ghz"]
+
+
+def test_exact_terms_rank_first_and_survive_reloading(tmp_path: Path) -> None:
+    index = BM25Index(tmp_path / "bm25_index.json")
+    index.add([
+        create_chunk("a", "The VPN client shows error 0x800704cf when the adapter is disabled"),
+        create_chunk("b", "The VPN client can be reinstalled from the downloads page"),
+        create_chunk("c", "Two-factor authentication is enabled in the account settings"),
+    ])
+    index.save()
+
+    reloaded = BM25Index(tmp_path / "bm25_index.json")
+    assert [chunk_id for chunk_id, _ in reloaded.search("vpn error 0x800704cf", n_results=3)] == ["a", "b"]
+
+    reloaded.delete(["a"])
+    assert [chunk_id for chunk_id, _ in reloaded.search("0x800704cf", n_results=3)] == []
+    assert len(reloaded) == 2
+
+
+def test_replacing_and_deleting_only_touches_the_chunks_own_terms() -> None:
+    index = BM25Index()
+    index.add([create_chunk("a", "reset the router"), create_chunk("b", "reset the password")])
+    index.add([create_chunk("a", "restart the modem")])
+    assert index.postings["reset"] == {"b": 1}
+    assert "router" not in index.postings
+
+    index.delete(["b", "missing"])
+    assert index.postings == {"restart": {"a": 1}, "the": {"a": 1}, "modem": {"a": 1}}
+    assert index.chunk_terms == {"a": ["restart", "the", "modem"]}
+    assert index.total_length == 3
+
+def test_reciprocal_rank_fusion_favours_agreement() -> None:
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=60)
+    assert [item_id for item_id, _ in fused] == ["b", "a", "c"]
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from chatbot.tracing import Tracer, current_span
+
+
+def test_nested_spans_share_the_request_trace() -> None:
+    tracer = Tracer(enabled=True, duration_buckets_s=(0.1, 1.0))
+
+    async def request() -> None:
+        with tracer.span("perform_rag") as root:
+            with tracer.span("rerank", candidates_retrieved=20) as span:
+                assert current_span() is span
+                span.set(candidates_reranked=5, cache_hits=3)
+            assert current_span() is root
+        assert current_span() is None
+
+    asyncio.run(request())
+    asyncio.run(request())
+
+    spans = tracer.export_otlp_json()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in spans] == ["rerank", "perform_rag"] * 2
+    rerank, root = spans[:2]
+    assert rerank["traceId"] == root["traceId"] != spans[2]["traceId"]
+    assert rerank["parentSpanId"] == root["spanId"] and "parentSpanId" not in root
+    assert {"key": "candidates_reranked", "value": {"intValue": "5"}} in rerank["attributes"]
+
+    metrics = tracer.render_prometheus()
+    assert 'chatbot_stage_duration_seconds_bucket{stage="rerank",le="+Inf"} 2' in metrics
+    assert 'chatbot_stage_duration_seconds_count{stage="perform_rag"} 2' in metrics
+    assert 'chatbot_candidates_retrieved_total{stage="rerank"} 40' in metrics
+    assert 'chatbot_cache_hits_total{stage="rerank"} 6' in metrics
+
+
+def test_failed_spans_are_counted() -> None:
+    tracer = Tracer(enabled=True)
+    with pytest.raises(RuntimeError):
+        with tracer.span("llm.chat"):
+            raise RuntimeError("out of memory")
+
+    span = tracer.export_otlp_json()["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert span["status"] == {"code": 2, "message": "RuntimeError: out of memory"}
+    assert 'chatbot_stage_errors_total{stage="llm.chat"} 1' in tracer.render_prometheus()